@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Onboarding masivo KYC desde archivos JSONL/CSV
+Cada línea es un solicitante ({"customer_id", "personal_info": {...}} o CSV plano con encabezado).
+Procesa en este mismo proceso (caches y pool HTTP compartidos por todo el lote) o envía el archivo
+en streaming a /kyc/process-batch. Escribe un resultado NDJSON por solicitante conforme termina.
+
+Uso:
+    python batch_onboard.py solicitantes.jsonl --output resultados.ndjson
+    python batch_onboard.py solicitantes.csv --concurrency 16
+    python batch_onboard.py solicitantes.jsonl --url http://localhost:8000
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+from typing import Dict, Any, List, Optional, TextIO
+
+import aiohttp
+
+def detect_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+async def run_local(args: argparse.Namespace, fmt: str, out: TextIO) -> Dict[str, Any]:
+    """Procesa el archivo con el orquestador local; el archivo se lee línea por línea"""
+    from services.kyc_orchestrator import KYCOrchestrator
+    from services.kyc_batch import KYCBatchProcessor, aiter_sync, parse_applicants
+    from services.saptiva_http import get_http_pool
+
+    processor = KYCBatchProcessor(KYCOrchestrator())
+    summary: Dict[str, Any] = {}
+    await get_http_pool().start()
+    try:
+        with open(args.input, "r", encoding="utf-8") as f:
+            rows = parse_applicants(aiter_sync(f), fmt)
+            async for item in processor.stream(rows, args.concurrency):
+                if "summary" in item:
+                    summary = item["summary"]
+                write_line(out, item, args.quiet)
+    finally:
+        await get_http_pool().close()
+    return summary
+
+async def file_chunks(path: str, chunk_size: int = 64 * 1024):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+async def run_remote(args: argparse.Namespace, fmt: str, out: TextIO) -> Dict[str, Any]:
+    """Sube el archivo en streaming a /kyc/process-batch y reenvía el NDJSON de respuesta"""
+    summary: Dict[str, Any] = {}
+    params = {"format": fmt}
+    if args.concurrency:
+        params["concurrency"] = args.concurrency
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=args.timeout)) as session:
+        async with session.post(
+            f"{args.url.rstrip('/')}/kyc/process-batch",
+            params=params,
+            data=file_chunks(args.input),
+            headers={"Content-Type": content_type}
+        ) as response:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}: {await response.text()}")
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if "summary" in item:
+                    summary = item["summary"]
+                write_line(out, item, args.quiet)
+    return summary
+
+def write_line(out: TextIO, item: Dict[str, Any], quiet: bool):
+    out.write(json.dumps(item, ensure_ascii=False) + "\n")
+    out.flush()
+    if not quiet and out is not sys.stdout and "summary" not in item:
+        marker = "✅" if item["ok"] else "❌"
+        detail = item["result"]["status"] if item["ok"] else item["error"]
+        print(f"{marker} #{item['index']} {item['customer_id']}: {detail}", file=sys.stderr)
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Onboarding masivo KYC (JSONL/CSV -> NDJSON)")
+    parser.add_argument("input", help="Archivo de solicitantes (.jsonl o .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Formato (default: por extensión)")
+    parser.add_argument("--concurrency", type=int, help="Solicitantes en paralelo (default KYC_BATCH_CONCURRENCY)")
+    parser.add_argument("--url", help="Enviar a la API en vez de procesar localmente (p. ej. http://localhost:8000)")
+    parser.add_argument("--timeout", type=float, default=120, help="Tiempo máximo sin recibir resultados (modo --url)")
+    parser.add_argument("--output", help="Archivo NDJSON de resultados (default: stdout)")
+    parser.add_argument("--quiet", action="store_true", help="Sin progreso por solicitante en stderr")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fmt = detect_format(args.input, args.format)
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        runner = run_remote if args.url else run_local
+        print(f"📦 Lote {args.input} ({fmt}) -> {args.url or 'proceso local'}", file=sys.stderr)
+        summary = asyncio.run(runner(args, fmt, out))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"✅ {summary.get('completed', 0)}/{summary.get('total', 0)} procesados, "
+          f"{summary.get('approved', 0)} aprobados, {summary.get('errors', 0)} errores "
+          f"en {summary.get('elapsed', 0)}s ({summary.get('throughput', 0)} solicitantes/s)", file=sys.stderr)
+    if args.output:
+        print(f"📄 Resultados en {args.output}", file=sys.stderr)
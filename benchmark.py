@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks de las rutas calientes de los servicios (Python puro)
+
+Uso:
+    python benchmark.py run --output bench_current.json          # tamaños por defecto (10^3-10^5)
+    python benchmark.py run --full --output bench_current.json   # incluye 10^6
+    python benchmark.py baseline                                  # escribe benchmark_baseline.json
+    python benchmark.py compare bench_current.json               # compara contra el baseline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import gc
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Callable, Tuple
+
+# Los servicios no necesitan la API real para estas rutas
+os.environ.setdefault("SAPTIVA_API_KEY", "benchmark")
+
+from services.saptiva_rag import SaptivaRAGService
+from services.validation_service import ValidationService
+from services.database_service import DatabaseService
+from services.saptiva_billing import SaptivaBillingService
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+FULL_SIZES = DEFAULT_SIZES + [1_000_000]
+
+EMBEDDING_DIM = 384
+STATUSES = ["completed", "completed", "completed", "rejected", "manual_review", "error"]
+RISK_LEVELS = ["low", "medium", "high"]
+MODELS = ["Saptiva OCR", "Saptiva Guard", "Saptiva Ops", "Saptiva KAL", "Saptiva Embed", "Saptiva Cortex"]
+FIRST_NAMES = ["María", "José", "Ana", "Carlos", "Roberto", "Sofía", "Luis", "Elena", "Juan", "Lucía"]
+LAST_NAMES = ["González", "Hernández", "Martínez", "Sánchez", "Rodríguez", "Pérez", "Vásquez", "Ruiz"]
+
+_loop = asyncio.new_event_loop()
+
+def run_async(coro):
+    return _loop.run_until_complete(coro)
+
+# --- Generadores de datos ---------------------------------------------------------------
+
+def make_name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def make_personal_info(rng: random.Random, index: int) -> Dict[str, Any]:
+    return {
+        "name": make_name(rng),
+        "id_number": f"CURP{index:014d}",
+        "curp": f"GOMA{rng.randint(0, 999999):06d}HDFNRS0{rng.randint(0, 9)}",
+        "birth_date": f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "address": "Av. Reforma 123, CDMX",
+        "phone": f"+5255{rng.randint(0, 99999999):08d}",
+        "email": f"cliente{index}@correo.mx"
+    }
+
+def make_document_results(personal_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"extracted_fields": {"name": personal_info["name"], "id_number": personal_info["id_number"]}}]
+
+def make_records(size: int, seed: int = 7) -> Dict[str, Dict[str, Any]]:
+    """Registros KYC con la forma que guarda el orquestador"""
+    rng = random.Random(seed)
+    base = datetime(2025, 1, 1)
+    records = {}
+    for index in range(size):
+        status = rng.choice(STATUSES)
+        created_at = (base + timedelta(seconds=index * 30)).isoformat()
+        customer_id = f"CUST{index:08d}"
+        record = {
+            "customer_id": customer_id,
+            "status": status,
+            "approved": status == "completed" and rng.random() < 0.8,
+            "processing_time": rng.uniform(0.5, 5.0),
+            "created_at": created_at,
+            "updated_at": created_at
+        }
+        if status != "error":
+            record["risk_assessment"] = {"risk_level": rng.choice(RISK_LEVELS), "final_score": rng.random()}
+        records[customer_id] = record
+    return records
+
+# --- Benchmarks ---------------------------------------------------------------------------
+# Cada benchmark recibe el tamaño y devuelve (operación a medir, número de operaciones internas)
+
+def bench_cosine_similarity(size: int) -> Tuple[Callable[[], Any], int]:
+    """Similitud de una consulta contra `size` chunks de la base de conocimiento"""
+    rag = SaptivaRAGService()
+    rng = random.Random(1)
+    # Pool de vectores reutilizado: el costo es el mismo y la memoria no crece con 10^6 chunks
+    pool = [[rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)] for _ in range(min(size, 1000))]
+    query = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]
+
+    def op():
+        for index in range(size):
+            rag._cosine_similarity(query, pool[index % len(pool)])
+    return op, size
+
+def bench_validate_personal_info(size: int) -> Tuple[Callable[[], Any], int]:
+    """Validación completa de `size` solicitudes (regex + nombres + edad)"""
+    service = ValidationService()
+    rng = random.Random(2)
+    applicants = [make_personal_info(rng, index) for index in range(min(size, 10_000))]
+    documents = [make_document_results(info) for info in applicants]
+
+    async def validate_all():
+        for index in range(size):
+            slot = index % len(applicants)
+            await service.validate_personal_info(applicants[slot], documents[slot])
+
+    return lambda: run_async(validate_all()), size
+
+def bench_name_similarity(size: int) -> Tuple[Callable[[], Any], int]:
+    """`size` comparaciones de nombres"""
+    service = ValidationService()
+    rng = random.Random(3)
+    pairs = [(make_name(rng), make_name(rng)) for _ in range(min(size, 10_000))]
+
+    def op():
+        for index in range(size):
+            name1, name2 = pairs[index % len(pairs)]
+            service._calculate_name_similarity(name1, name2)
+    return op, size
+
+def _database(size: int) -> DatabaseService:
+    db = DatabaseService()
+    for record in make_records(size).values():
+        run_async(db.save_kyc_record(record))
+    return db
+
+SEARCH_FILTERS = {"status": "completed", "approved": True}
+SEARCH_FIELDS = ("customer_id", "status", "approved", "risk_level")
+
+def bench_search_kyc_records(size: int) -> Tuple[Callable[[], Any], int]:
+    """Una búsqueda con dos filtros sobre `size` registros, proyectada a la fila caliente (sin blobs)"""
+    db = _database(size)
+    return lambda: run_async(db.search_kyc_records(SEARCH_FILTERS, fields=SEARCH_FIELDS)), 1
+
+def bench_search_kyc_page(size: int) -> Tuple[Callable[[], Any], int]:
+    """Primera página (100 registros completos) de la misma búsqueda, como /kyc/search por defecto"""
+    db = _database(size)
+    return lambda: run_async(db.search_kyc_records(SEARCH_FILTERS, limit=100)), 1
+
+def bench_get_kyc_statistics(size: int) -> Tuple[Callable[[], Any], int]:
+    """Estadísticas agregadas sobre `size` registros"""
+    db = _database(size)
+    return lambda: run_async(db.get_kyc_statistics()), 1
+
+def bench_log_api_call(size: int) -> Tuple[Callable[[], Any], int]:
+    """`size` registros de uso en un servicio de billing nuevo"""
+    rng = random.Random(4)
+    calls = [(rng.choice(MODELS), rng.randint(20, 2000), rng.randint(0, 500)) for _ in range(1000)]
+
+    def op():
+        billing = SaptivaBillingService()
+        for index in range(size):
+            model, input_tokens, output_tokens = calls[index % len(calls)]
+            billing.log_api_call(model, input_tokens, output_tokens, operation="benchmark")
+    return op, size
+
+BENCHMARKS: Dict[str, Callable[[int], Tuple[Callable[[], Any], int]]] = {
+    "rag._cosine_similarity": bench_cosine_similarity,
+    "validation.validate_personal_info": bench_validate_personal_info,
+    "validation._calculate_name_similarity": bench_name_similarity,
+    "database.search_kyc_records": bench_search_kyc_records,
+    "database.search_kyc_page": bench_search_kyc_page,
+    "database.get_kyc_statistics": bench_get_kyc_statistics,
+    "billing.log_api_call": bench_log_api_call
+}
+
+# --- Ejecución y comparación --------------------------------------------------------------
+
+def measure(op: Callable[[], Any], repeat: int, min_time: float) -> List[float]:
+    """Tiempos de `repeat` ejecuciones (al menos `min_time` segundos en total si son muy rápidas)"""
+    op()  # calentamiento
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or (time.perf_counter() - started < min_time and len(timings) < repeat * 10):
+        # Como timeit: el GC no debe caer dentro de una medición
+        gc.collect()
+        gc.disable()
+        try:
+            t0 = time.perf_counter()
+            op()
+            timings.append(time.perf_counter() - t0)
+        finally:
+            gc.enable()
+    return timings
+
+def calibrate(repeat: int = 15) -> float:
+    """
+    Tiempo de una carga fija de Python puro; permite comparar corridas hechas
+    con la máquina más o menos ocupada (el baseline es específico de cada máquina)
+    """
+    def op():
+        total = 0
+        for i in range(200_000):
+            total += i * i % 7
+        return total
+    return min(measure(op, repeat, 0))
+
+def run_benchmarks(names: List[str], sizes: List[int], repeat: int, min_time: float) -> Dict[str, Any]:
+    calibration = calibrate()
+    print(f"  {'calibración':<50} min {calibration * 1000:10.3f} ms")
+    results = {}
+    for name in names:
+        for size in sizes:
+            key = f"{name}@{size}"
+            op, ops = BENCHMARKS[name](size)
+            timings = measure(op, repeat, min_time)
+            best = min(timings)
+            results[key] = {
+                "benchmark": name,
+                "size": size,
+                "runs": len(timings),
+                "min_seconds": best,
+                "median_seconds": statistics.median(timings),
+                "per_op_us": best / ops * 1e6
+            }
+            print(f"  {key:<50} min {best * 1000:10.3f} ms | mediana {statistics.median(timings) * 1000:10.3f} ms "
+                  f"| {results[key]['per_op_us']:9.3f} µs/op")
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "calibration_seconds": calibration
+        },
+        "results": results
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compara tiempos mínimos normalizados por la calibración de cada corrida;
+    regresión si current > baseline * (1 + threshold)
+    """
+    scale = 1.0
+    if baseline["meta"].get("calibration_seconds") and current["meta"].get("calibration_seconds"):
+        scale = current["meta"]["calibration_seconds"] / baseline["meta"]["calibration_seconds"]
+    rows = []
+    for key, result in current["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        expected = reference["min_seconds"] * scale
+        ratio = result["min_seconds"] / expected if expected > 0 else float("inf")
+        rows.append({
+            "key": key,
+            "baseline_ms": reference["min_seconds"] * 1000,
+            "current_ms": result["min_seconds"] * 1000,
+            "ratio": ratio,
+            "status": "REGRESSION" if ratio > 1 + threshold else ("improved" if ratio < 1 - threshold else "ok")
+        })
+    return rows
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de KYC Lightning Onboard")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for command in ("run", "baseline"):
+        sub = commands.add_parser(command, help="Ejecuta los benchmarks" if command == "run" else "Ejecuta y guarda el baseline")
+        sub.add_argument("--only", help="Benchmarks a ejecutar (separados por coma, por prefijo)")
+        sub.add_argument("--sizes", help="Tamaños separados por coma (default 1000,10000,100000)")
+        sub.add_argument("--full", action="store_true", help="Incluye 10^6")
+        sub.add_argument("--repeat", type=int, default=7)
+        sub.add_argument("--min-time", type=float, default=0.2, help="Tiempo mínimo de medición por caso")
+        sub.add_argument("--output", default=BASELINE_FILE if command == "baseline" else None)
+
+    sub = commands.add_parser("compare", help="Compara resultados contra el baseline")
+    sub.add_argument("current", help="JSON de resultados de `run`")
+    sub.add_argument("--baseline", default=BASELINE_FILE)
+    sub.add_argument("--threshold", type=float, default=0.25, help="Tolerancia relativa (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, "r", encoding="utf-8") as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold)
+        for row in rows:
+            marker = "❌" if row["status"] == "REGRESSION" else ("🚀" if row["status"] == "improved" else "✅")
+            print(f"{marker} {row['key']:<50} {row['baseline_ms']:10.3f} ms -> {row['current_ms']:10.3f} ms "
+                  f"(x{row['ratio']:.2f})")
+        regressions = [row for row in rows if row["status"] == "REGRESSION"]
+        print(f"{len(rows)} casos comparados, {len(regressions)} regresiones (umbral {args.threshold * 100:.0f}%)")
+        return 1 if regressions else 0
+
+    # Los logs por operación distorsionan las mediciones
+    logging.disable(logging.WARNING)
+
+    names = list(BENCHMARKS)
+    if args.only:
+        prefixes = [prefix.strip() for prefix in args.only.split(",")]
+        names = [name for name in names if any(name.startswith(prefix) for prefix in prefixes)]
+    if args.sizes:
+        sizes = [int(float(size)) for size in args.sizes.split(",")]
+    else:
+        sizes = FULL_SIZES if args.full else DEFAULT_SIZES
+
+    print(f"⏱️ Benchmarks: {len(names)} rutas x {len(sizes)} tamaños")
+    report = run_benchmarks(names, sizes, args.repeat, args.min_time)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Resultados en {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Generador de carga asíncrono para KYC Lightning Onboard API
+Mezcla de endpoints KYC/RAG a RPS objetivo (lazo abierto) o concurrencia fija (lazo cerrado),
+con perfiles de saptiva_demo_data.json. Reporta throughput, percentiles, errores y costo por petición.
+
+Uso:
+    python load_test.py --rps 20 --duration 60 --output results/run1.json
+    python load_test.py --concurrency 16 --requests 500 --mix process-simple:3,rag-query:1
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import aiohttp
+
+BASE_URL = "http://localhost:8000"
+
+ENDPOINTS = {
+    "process-simple": "/kyc/process-simple",
+    "process": "/kyc/process",
+    "process-with-tools": "/kyc/process-with-tools",
+    "rag-query": "/kyc/rag-query"
+}
+
+DEFAULT_MIX = "process-simple:4,process:1,process-with-tools:2,rag-query:2"
+
+RAG_QUESTIONS = [
+    "¿Qué documentos requiere la CNBV para abrir una cuenta?",
+    "¿Cuáles son las obligaciones de la UIF sobre operaciones inusuales?",
+    "¿Cómo se verifica a una Persona Políticamente Expuesta?",
+    "¿Qué información debe contener el expediente de identificación del cliente?",
+    "¿Qué establece CONDUSEF sobre la transparencia en productos financieros?"
+]
+
+# Documento ficticio (cabecera JPEG + relleno) para /kyc/process
+FAKE_DOCUMENT = b"\xff\xd8\xff\xe0" + b"KYC-LOAD-TEST-DOCUMENT " * 200 + b"\xff\xd9"
+
+def load_profiles(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [case["customer_data"] for case in data["demo_cases"]]
+
+def parse_mix(spec: str) -> List[Tuple[str, int]]:
+    """"process-simple:4,rag-query:1" -> [("process-simple", 4), ("rag-query", 1)]"""
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition(":")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Endpoint desconocido: {name} (disponibles: {', '.join(ENDPOINTS)})")
+        mix.append((name, int(weight or 1)))
+    return mix
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class LoadGenerator:
+    """Ejecuta la carga y acumula resultados por endpoint"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.base_url = args.base_url.rstrip("/")
+        self.profiles = load_profiles(args.profiles)
+        self.mix = parse_mix(args.mix)
+        self.timeout = args.timeout
+        self.request_timeout_header = args.request_timeout
+        self.sequence = itertools.count(1)
+        self.run_id = datetime.now().strftime("%H%M%S")
+        self.results: Dict[str, List[Tuple[float, Optional[int], Optional[str]]]] = {name: [] for name, _ in self.mix}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _choose_endpoint(self) -> str:
+        names, weights = zip(*self.mix)
+        return random.choices(names, weights=weights)[0]
+
+    def _next_customer(self) -> Dict[str, Any]:
+        profile = random.choice(self.profiles)
+        # ID único por petición: evita que single-flight/cache colapsen la carga
+        return {
+            "customer_id": f"{profile['customer_id']}-LT{self.run_id}-{next(self.sequence)}",
+            "personal_info": profile["personal_info"]
+        }
+
+    def _headers(self) -> Dict[str, str]:
+        if self.request_timeout_header:
+            return {"X-Request-Timeout": str(self.request_timeout_header)}
+        return {}
+
+    async def _request(self, session: aiohttp.ClientSession, endpoint: str) -> Tuple[Optional[int], Optional[str]]:
+        """Una petición; devuelve (status HTTP, error)"""
+        customer = self._next_customer()
+        url = f"{self.base_url}{ENDPOINTS[endpoint]}"
+        headers = self._headers()
+
+        if endpoint == "process":
+            form = aiohttp.FormData()
+            form.add_field("request", json.dumps(customer), content_type="application/json")
+            form.add_field("documents", FAKE_DOCUMENT, filename="ine_frente.jpg", content_type="image/jpeg")
+            form.add_field("documents", FAKE_DOCUMENT, filename="comprobante_domicilio.pdf", content_type="application/pdf")
+            request = session.post(url, data=form, headers=headers)
+        elif endpoint == "rag-query":
+            request = session.post(url, json={"question": random.choice(RAG_QUESTIONS)}, headers=headers)
+        else:
+            request = session.post(url, json=customer, headers=headers)
+
+        async with request as response:
+            await response.read()
+            if response.status >= 400:
+                return response.status, f"HTTP {response.status}"
+            return response.status, None
+
+    async def _timed_request(self, session: aiohttp.ClientSession, endpoint: str):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.monotonic()
+        try:
+            status, error = await self._request(session, endpoint)
+        except asyncio.TimeoutError:
+            status, error = None, "timeout"
+        except aiohttp.ClientError as e:
+            status, error = None, type(e).__name__
+        finally:
+            self.in_flight -= 1
+        self.results[endpoint].append((time.monotonic() - started, status, error))
+
+    async def run_open_loop(self, session: aiohttp.ClientSession, rps: float, duration: float, max_in_flight: int):
+        """Lazo abierto: llegadas Poisson a `rps`, independientes de la latencia del servidor"""
+        tasks = set()
+        deadline = time.monotonic() + duration
+        next_arrival = time.monotonic()
+        dropped = 0
+        while next_arrival < deadline:
+            await asyncio.sleep(max(0.0, next_arrival - time.monotonic()))
+            if self.in_flight >= max_in_flight:
+                dropped += 1  # el servidor no da abasto; se cuenta como llegada perdida
+            else:
+                task = asyncio.ensure_future(self._timed_request(session, self._choose_endpoint()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_arrival += random.expovariate(rps)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return dropped
+
+    async def run_closed_loop(self, session: aiohttp.ClientSession, concurrency: int, total: Optional[int], duration: Optional[float]):
+        """Lazo cerrado: `concurrency` workers, cada uno lanza la siguiente petición al terminar la anterior"""
+        counter = itertools.count()
+        deadline = time.monotonic() + duration if duration else None
+
+        async def worker():
+            while True:
+                if total is not None and next(counter) >= total:
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                await self._timed_request(session, self._choose_endpoint())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def billing_summary(self, session: aiohttp.ClientSession) -> Dict[str, Any]:
+        try:
+            async with session.get(f"{self.base_url}/billing/session-summary") as response:
+                data = await response.json()
+                return data.get("billing_summary", {}).get("session_summary", {})
+        except Exception:
+            return {}
+
+    def report(self, elapsed: float, billing_before: Dict[str, Any], billing_after: Dict[str, Any]) -> Dict[str, Any]:
+        endpoints = {}
+        all_latencies = []
+        total_ok = total_errors = 0
+        for endpoint, samples in self.results.items():
+            latencies = sorted(latency for latency, _, error in samples if error is None)
+            errors = Counter(error for _, _, error in samples if error is not None)
+            all_latencies.extend(latencies)
+            total_ok += len(latencies)
+            total_errors += sum(errors.values())
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "ok": len(latencies),
+                "errors": dict(errors),
+                "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0,
+                "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0,
+                "latency": latency_summary(latencies)
+            }
+
+        total_requests = total_ok + total_errors
+        cost = billing_after.get("total_cost", 0) - billing_before.get("total_cost", 0)
+        calls = billing_after.get("total_calls", 0) - billing_before.get("total_calls", 0)
+        tokens = billing_after.get("total_tokens", 0) - billing_before.get("total_tokens", 0)
+        return {
+            "summary": {
+                "elapsed_seconds": round(elapsed, 3),
+                "requests": total_requests,
+                "ok": total_ok,
+                "errors": total_errors,
+                "error_rate": round(total_errors / total_requests, 4) if total_requests else 0,
+                "throughput_rps": round(total_ok / elapsed, 3) if elapsed > 0 else 0,
+                "peak_in_flight": self.peak_in_flight,
+                "latency": latency_summary(sorted(all_latencies))
+            },
+            "endpoints": endpoints,
+            "billing": {
+                "total_cost": round(cost, 6),
+                "saptiva_calls": calls,
+                "tokens": tokens,
+                "cost_per_request": round(cost / total_ok, 8) if total_ok else 0,
+                "saptiva_calls_per_request": round(calls / total_ok, 3) if total_ok else 0
+            }
+        }
+
+def latency_summary(ordered: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p90_ms": ms(percentile(ordered, 90)),
+        "p95_ms": ms(percentile(ordered, 95)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else None
+    }
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    generator = LoadGenerator(args)
+    connector = aiohttp.TCPConnector(limit=args.max_in_flight)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        billing_before = await generator.billing_summary(session)
+        started = time.monotonic()
+        dropped = 0
+        if args.rps:
+            mode = {"mode": "open_loop", "target_rps": args.rps, "duration": args.duration}
+            dropped = await generator.run_open_loop(session, args.rps, args.duration, args.max_in_flight)
+        else:
+            mode = {"mode": "closed_loop", "concurrency": args.concurrency, "requests": args.requests, "duration": args.duration}
+            await generator.run_closed_loop(session, args.concurrency, args.requests, args.duration if not args.requests else None)
+        elapsed = time.monotonic() - started
+        billing_after = await generator.billing_summary(session)
+
+    report = generator.report(elapsed, billing_before, billing_after)
+    report["summary"]["dropped_arrivals"] = dropped
+    report["config"] = {
+        **mode,
+        "base_url": generator.base_url,
+        "mix": dict(generator.mix),
+        "request_timeout_header": args.request_timeout,
+        "client_timeout": args.timeout,
+        "profiles": len(generator.profiles),
+        "started_at": datetime.now().isoformat()
+    }
+    return report
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generador de carga para KYC Lightning Onboard API")
+    parser.add_argument("--base-url", default=os.getenv("KYC_API_URL", BASE_URL))
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Endpoints y pesos (default: {DEFAULT_MIX})")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--rps", type=float, help="RPS objetivo (lazo abierto)")
+    load.add_argument("--concurrency", type=int, default=8, help="Workers concurrentes (lazo cerrado)")
+    parser.add_argument("--duration", type=float, default=30, help="Duración en segundos")
+    parser.add_argument("--requests", type=int, help="Total de peticiones (solo lazo cerrado)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Tope de peticiones en vuelo")
+    parser.add_argument("--timeout", type=float, default=60, help="Timeout del cliente por petición")
+    parser.add_argument("--request-timeout", type=float, help="Valor del header X-Request-Timeout")
+    parser.add_argument("--profiles", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "saptiva_demo_data.json"))
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    parser.add_argument("--seed", type=int, help="Semilla para reproducir la mezcla")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    print(f"🚀 Carga contra {args.base_url} ({'%s RPS' % args.rps if args.rps else '%s workers' % args.concurrency})")
+    report = asyncio.run(main(args))
+
+    summary = report["summary"]
+    print(f"✅ {summary['ok']}/{summary['requests']} OK en {summary['elapsed_seconds']}s "
+          f"({summary['throughput_rps']} req/s, errores {summary['error_rate'] * 100:.1f}%)")
+    print(f"⏱️ p50 {summary['latency']['p50_ms']}ms | p95 {summary['latency']['p95_ms']}ms | "
+          f"p99 {summary['latency']['p99_ms']}ms")
+    print(f"💰 ${report['billing']['cost_per_request']} por petición "
+          f"({report['billing']['saptiva_calls_per_request']} llamadas Saptiva)")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"   {endpoint}: {stats['ok']}/{stats['requests']} OK, p95 {stats['latency']['p95_ms']}ms, errores {stats['errors']}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📄 Resultados en {args.output}")
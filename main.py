@@ -1,13 +1,30 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Response, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import os
+import json
+import time
+import hashlib
 import logging
+import itertools
 from dotenv import load_dotenv
 
 from services.kyc_orchestrator import KYCOrchestrator
-from services.database_service import DatabaseService
+from services.database_service import DatabaseService, encode_cursor, decode_cursor
+from services.saptiva_http import get_http_pool
+from services.saptiva_cache import get_completion_cache
+from services.single_flight import get_single_flight, request_key
+from services.saptiva_limiter import get_limiter_registry
+from services.saptiva_client import get_saptiva_client
+from services.saptiva_breaker import get_breaker_registry
+from services.deadline import deadline_for, deadline_scope
+from services.kyc_jobs import KYCJobManager, QueueFull, InvalidWebhookURL
+from services.kyc_batch import KYCBatchProcessor, aiter_lines, parse_applicants
+from services.idempotency import get_idempotency_store, IdempotencyConflict, REPLAYED_HEADER
+from services.metrics import metrics_registry
+from services.model_cascade import get_model_cascade
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -32,8 +49,40 @@ app.add_middleware(
 )
 
 # Inicializar servicios
-kyc_orchestrator = KYCOrchestrator()
 db_service = DatabaseService()
+kyc_orchestrator = KYCOrchestrator(db_service=db_service)
+job_manager = KYCJobManager(kyc_orchestrator)
+batch_processor = KYCBatchProcessor(kyc_orchestrator)
+
+@app.on_event("startup")
+async def startup_http_pool():
+    """Abre el pool HTTP compartido para las llamadas a Saptiva"""
+    await get_http_pool().start()
+
+@app.on_event("startup")
+async def startup_job_workers():
+    """Lanza los workers de la cola KYC asíncrona"""
+    await job_manager.start()
+
+@app.on_event("startup")
+async def startup_write_behind():
+    """Abre el almacén durable (KYC_DB_BACKEND) y arranca el flusher de write-behind (si KYC_WRITE_BEHIND=true)"""
+    await db_service.start()
+
+@app.on_event("shutdown")
+async def shutdown_job_workers():
+    """Detiene los workers antes de cerrar el pool HTTP"""
+    await job_manager.stop()
+
+@app.on_event("shutdown")
+async def shutdown_write_behind():
+    """Escribe los registros encolados y cierra el almacén (después de detener los workers)"""
+    await db_service.stop()
+
+@app.on_event("shutdown")
+async def shutdown_http_pool():
+    """Cierra el pool HTTP compartido"""
+    await get_http_pool().close()
 
 # Modelos Pydantic
 class PersonalInfo(BaseModel):
@@ -63,6 +112,64 @@ class KYCStatusResponse(BaseModel):
     approved: bool
     risk_level: str
     last_updated: Optional[str] = None
+    job_id: Optional[str] = None
+
+def server_timing_header(step_timings: Dict[str, float], total: float) -> str:
+    """Construye el header Server-Timing (duraciones en ms)"""
+    parts = [f"{step};dur={duration * 1000:.1f}" for step, duration in step_timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+async def sse_stream(events, deadline):
+    """Serializa eventos como server-sent events con el deadline activo"""
+    with deadline_scope(deadline):
+        try:
+            async for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"❌ Error en stream: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'event': 'error', 'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+def documents_fingerprint(document_data: List[Dict[str, Any]]) -> List[str]:
+    """Hash del contenido de cada documento (para comparar peticiones idempotentes)"""
+    return [hashlib.sha256(doc["content"]).hexdigest() for doc in document_data]
+
+async def run_idempotent(endpoint: str, idempotency_key: Optional[str], fingerprint: str, response: Response, factory):
+    """
+    Ejecuta `factory()` una sola vez por Idempotency-Key; sin header se ejecuta siempre
+    """
+    if not idempotency_key:
+        return await factory()
+    store = get_idempotency_store()
+    try:
+        result, replayed = await store.run(endpoint, store.validate_key(idempotency_key), fingerprint, factory)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers[REPLAYED_HEADER] = "true" if replayed else "false"
+    return result
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que no escucha `http.disconnect` mientras responde: en ASGI < 2.4 ese
+    listener consume los mensajes del cuerpo de la petición, que aquí se sigue leyendo en
+    paralelo. Una desconexión se detecta al leer el cuerpo (ClientDisconnect)
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+# Tamaño de página de /kyc/search en modo JSON (el modo NDJSON no tiene tope)
+SEARCH_DEFAULT_LIMIT = int(os.getenv("KYC_SEARCH_DEFAULT_LIMIT", "100"))
+SEARCH_MAX_LIMIT = int(os.getenv("KYC_SEARCH_MAX_LIMIT", "1000"))
 
 @app.get("/")
 async def root():
@@ -72,6 +179,7 @@ async def root():
         "endpoints": {
             "health": "/health",
             "process_kyc": "/kyc/process",
+            "submit_kyc": "/kyc/submit",
             "kyc_status": "/kyc/status/{customer_id}",
             "statistics": "/kyc/stats"
         }
@@ -85,14 +193,41 @@ async def health_check():
         "saptiva_api_configured": bool(os.getenv("SAPTIVA_API_KEY"))
     }
 
+async def read_kyc_request(http_request: Request, form_value: Optional[str]) -> KYCRequest:
+    """KYCRequest del campo multipart `request` o, en el formato original, del cuerpo JSON"""
+    try:
+        if form_value is not None:
+            return KYCRequest.parse_raw(form_value)
+        if http_request.headers.get("content-type", "").startswith("application/json"):
+            return KYCRequest.parse_raw(await http_request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"KYCRequest inválido: {str(e)}")
+    raise HTTPException(
+        status_code=422,
+        detail="Falta KYCRequest: campo multipart 'request' o cuerpo application/json"
+    )
+
 @app.post("/kyc/process", response_model=KYCResponse)
 async def process_kyc(
-    request: KYCRequest,
-    documents: List[UploadFile] = File(...)
+    http_request: Request,
+    response: Response,
+    request: Optional[str] = Form(None),
+    documents: Optional[List[UploadFile]] = File(None),
+    resume: Optional[bool] = None,
+    x_request_timeout: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
-    Procesa una aplicación KYC completa con documentos
+    Procesa una aplicación KYC completa con documentos. Acepta dos formatos:
+    multipart (campo `request` con el JSON de KYCRequest + archivos `documents`) o, como
+    antes, un cuerpo JSON con KYCRequest (sin documentos).
+    `?resume=true|false` fuerza o evita reanudar desde los checkpoints de un intento fallido
     """
+    # El presupuesto incluye la lectura de los documentos subidos
+    deadline = deadline_for("process", x_request_timeout)
+    request = await read_kyc_request(http_request, request)
+    documents = documents or []
+    
     try:
         logger.info(f"Iniciando proceso KYC para cliente: {request.customer_id}")
         
@@ -107,23 +242,44 @@ async def process_kyc(
             })
         
         # Procesar KYC usando el orquestador
-        result = await kyc_orchestrator.process_kyc_application(
-            customer_id=request.customer_id,
-            documents=document_data,
-            personal_info=request.personal_info.dict()
+        result = await run_idempotent(
+            "process",
+            idempotency_key,
+            request_key(request.dict(), documents_fingerprint(document_data)),
+            response,
+            lambda: kyc_orchestrator.process_kyc_application(
+                customer_id=request.customer_id,
+                documents=document_data,
+                personal_info=request.personal_info.dict(),
+                deadline=deadline,
+                resume=resume
+            )
         )
         
+        response.headers["Server-Timing"] = server_timing_header(
+            result["details"].get("step_timings", {}),
+            result["processing_time"]
+        )
         return KYCResponse(**result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error procesando KYC: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error procesando KYC: {str(e)}")
 
 @app.post("/kyc/process-simple", response_model=KYCResponse)
-async def process_kyc_simple(request: KYCRequest):
+async def process_kyc_simple(
+    request: KYCRequest,
+    response: Response,
+    resume: Optional[bool] = None,
+    x_request_timeout: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
+):
     """
     Procesa KYC sin documentos (solo validación de datos)
     """
+    deadline = deadline_for("process-simple", x_request_timeout)
     try:
         logger.info(f"Procesando KYC simple para cliente: {request.customer_id}")
         logger.info(f"Datos recibidos: {request.personal_info}")
@@ -140,28 +296,162 @@ async def process_kyc_simple(request: KYCRequest):
         
         logger.info(f"Datos procesados: {personal_info_dict}")
         
-        result = await kyc_orchestrator.process_kyc_application(
-            customer_id=request.customer_id,
-            documents=[],
-            personal_info=personal_info_dict
+        result = await run_idempotent(
+            "process-simple",
+            idempotency_key,
+            request_key(request.dict()),
+            response,
+            lambda: kyc_orchestrator.process_kyc_application(
+                customer_id=request.customer_id,
+                documents=[],
+                personal_info=personal_info_dict,
+                deadline=deadline,
+                resume=resume
+            )
         )
         
         logger.info(f"Resultado obtenido: {result}")
         
+        response.headers["Server-Timing"] = server_timing_header(
+            result["details"].get("step_timings", {}),
+            result["processing_time"]
+        )
         return KYCResponse(**result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         logger.error(f"Error procesando KYC simple: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error procesando KYC: {str(e)}")
 
+@app.post("/kyc/submit", status_code=202)
+async def submit_kyc(
+    response: Response,
+    request: str = Form(...),
+    documents: List[UploadFile] = File(None),
+    webhook_url: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Encola una aplicación KYC y responde de inmediato con el job id
+    (multipart como /kyc/process; documentos opcionales). El resultado se consulta en
+    /kyc/status/{customer_id} o /kyc/jobs/{job_id}, o se recibe en `webhook_url`
+    """
+    try:
+        request = KYCRequest.parse_raw(request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Campo 'request' inválido: {str(e)}")
+    
+    document_data = []
+    for doc in documents or []:
+        content = await doc.read()
+        document_data.append({
+            "content": content,
+            "type": doc.filename.split('.')[-1] if doc.filename else "unknown",
+            "filename": doc.filename
+        })
+    
+    async def enqueue():
+        job = await job_manager.submit(
+            customer_id=request.customer_id,
+            documents=document_data,
+            personal_info=request.personal_info.dict(),
+            webhook_url=webhook_url
+        )
+        return {
+            "job_id": job.job_id,
+            "customer_id": job.customer_id,
+            "status": job.status,
+            "status_url": f"/kyc/status/{job.customer_id}",
+            "job_url": f"/kyc/jobs/{job.job_id}"
+        }
+    
+    # Un reintento con la misma clave devuelve el mismo job id en lugar de encolar otro
+    try:
+        submitted = await run_idempotent(
+            "submit",
+            idempotency_key,
+            request_key(request.dict(), documents_fingerprint(document_data), webhook_url),
+            response,
+            enqueue
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except InvalidWebhookURL as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    response.headers["Location"] = submitted["job_url"]
+    return submitted
+
+@app.get("/kyc/jobs/{job_id}")
+async def get_kyc_job(job_id: str):
+    """
+    Estado y resultado de un trabajo KYC encolado
+    """
+    job = await job_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job.to_dict()
+
+@app.get("/kyc/queue-metrics")
+async def get_kyc_queue_metrics():
+    """
+    Profundidad de la cola, workers ocupados, reintentos y webhooks
+    """
+    return job_manager.get_metrics()
+
+@app.post("/kyc/process-batch")
+async def process_kyc_batch(request: Request, concurrency: Optional[int] = None, format: Optional[str] = None):
+    """
+    Procesa un archivo de solicitantes (cuerpo JSONL o CSV con encabezado) y devuelve
+    un resultado NDJSON por solicitante conforme termina, más una línea final de resumen.
+    El cuerpo se lee en streaming: la memoria no crece con el tamaño del archivo
+    """
+    fmt = (format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")).lower()
+    if fmt not in ("jsonl", "csv"):
+        raise HTTPException(status_code=422, detail=f"Formato no soportado: {fmt} (jsonl | csv)")
+    
+    rows = parse_applicants(aiter_lines(request.stream()), fmt)
+    
+    async def ndjson():
+        async for item in batch_processor.stream(rows, concurrency):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+    
+    return DuplexStreamingResponse(ndjson(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
+@app.get("/kyc/idempotency-metrics")
+async def get_kyc_idempotency_metrics():
+    """
+    Respuestas guardadas por Idempotency-Key, repeticiones y conflictos
+    """
+    return get_idempotency_store().get_metrics()
+
+@app.get("/kyc/batch-metrics")
+async def get_kyc_batch_metrics():
+    """
+    Lotes procesados, solicitantes en vuelo y errores
+    """
+    return batch_processor.get_metrics()
+
 @app.get("/kyc/status/{customer_id}", response_model=KYCStatusResponse)
 async def get_kyc_status(customer_id: str):
     """
     Obtiene el estado actual de un proceso KYC
     """
     try:
+        # Aplicación enviada por /kyc/submit que aún no termina
+        job = await job_manager.get_pending_job(customer_id)
+        if job is not None:
+            return KYCStatusResponse(
+                status=job.status,
+                customer_id=customer_id,
+                approved=False,
+                risk_level="unknown",
+                job_id=job.job_id
+            )
+        
         result = await kyc_orchestrator.get_kyc_status(customer_id)
         
         if result["status"] == "not_found":
@@ -188,15 +478,43 @@ async def get_kyc_statistics():
         logger.error(f"Error obteniendo estadísticas: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
 
+@app.get("/kyc/storage-metrics")
+async def get_kyc_storage_metrics():
+    """
+    Filas calientes y tamaño de los blobs con los registros completos
+    """
+    return db_service.get_storage_metrics()
+
 @app.get("/kyc/search")
 async def search_kyc_records(
     status: Optional[str] = None,
     approved: Optional[bool] = None,
-    risk_level: Optional[str] = None
+    risk_level: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: Optional[str] = None
 ):
     """
-    Busca registros KYC con filtros opcionales
+    Busca registros KYC con filtros opcionales (created_after/created_before en ISO 8601, inclusivos;
+    un created_before de solo fecha incluye todo ese día).
+    Paginación por cursor: `limit` registros por página (tope KYC_SEARCH_MAX_LIMIT) y `next_cursor`
+    para pedir la siguiente. `fields` (p. ej. customer_id,status,risk_level) devuelve solo esos campos.
+    Con format=ndjson los registros se envían uno por línea conforme se leen, más una línea final de resumen
     """
+    fmt = (format or "json").lower()
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(status_code=422, detail=f"Formato no soportado: {fmt} (json | ndjson)")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=422, detail="limit debe ser mayor que 0")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    projection = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    
     try:
         filters = {}
         if status:
@@ -205,22 +523,53 @@ async def search_kyc_records(
             filters["approved"] = approved
         if risk_level:
             filters["risk_level"] = risk_level
+        if created_after:
+            filters["created_after"] = created_after
+        if created_before:
+            filters["created_before"] = created_before
+        
+        if fmt == "ndjson":
+            async def ndjson():
+                count = 0
+                last = None
+                next_cursor = None
+                for row in db_service.iter_kyc_rows(filters, after):
+                    if limit is not None and count >= limit:
+                        next_cursor = encode_cursor(last)
+                        break
+                    yield json.dumps(db_service.row_view(row, projection), ensure_ascii=False, default=str) + "\n"
+                    count += 1
+                    last = row
+                yield json.dumps({"summary": {"count": count, "next_cursor": next_cursor}}) + "\n"
+            
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers=SSE_HEADERS)
         
-        results = await db_service.search_kyc_records(filters)
-        return {"results": results, "count": len(results)}
+        page_size = min(limit or SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+        # Un registro de más indica si hay página siguiente; los blobs se leen solo para la página
+        rows = list(itertools.islice(db_service.iter_kyc_rows(filters, after), page_size + 1))
+        next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        
+        results = [db_service.row_view(row, projection) for row in rows[:page_size]]
+        return {"results": results, "count": len(results), "next_cursor": next_cursor}
         
     except Exception as e:
         logger.error(f"Error buscando registros: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error en búsqueda: {str(e)}")
 
 @app.post("/kyc/process-with-tools")
-async def process_kyc_with_saptiva_tools(request: KYCRequest):
+async def process_kyc_with_saptiva_tools(
+    request: KYCRequest,
+    response: Response,
+    x_request_timeout: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None)
+):
     """
     Procesa KYC usando Saptiva Tools (Function Calling) con Saptiva KAL
     Demuestra el poder real de las tools de Saptiva
     """
     try:
         logger.info(f"🔧 Procesando KYC con Saptiva Tools para: {request.customer_id}")
+        started = time.monotonic()
         
         # Preparar datos del cliente
         customer_data = {
@@ -234,7 +583,14 @@ async def process_kyc_with_saptiva_tools(request: KYCRequest):
         }
         
         # Procesar con Saptiva Tools
-        result = await kyc_orchestrator.saptiva_service.process_kyc_with_tools(customer_data)
+        with deadline_scope(deadline_for("process-with-tools", x_request_timeout)):
+            result = await run_idempotent(
+                "process-with-tools",
+                idempotency_key,
+                request_key(request.dict()),
+                response,
+                lambda: kyc_orchestrator.saptiva_service.process_kyc_with_tools(customer_data)
+            )
         
         # Extraer información para la respuesta
         workflow_result = result.get("result", {})
@@ -270,13 +626,16 @@ async def process_kyc_with_saptiva_tools(request: KYCRequest):
             decision = "APROBAR"
             approved = True
         
-        response = KYCResponse(
+        processing_time = time.monotonic() - started
+        response.headers["Server-Timing"] = server_timing_header({}, processing_time)
+        
+        return KYCResponse(
             status="completed_with_tools",
             customer_id=request.customer_id,
             verification_score=adjusted_score,
             risk_level=risk_level,
             approved=approved,
-            processing_time=result.get("processing_time", 2.3),
+            processing_time=processing_time,
             details={
                 "tools_used": workflow_result.get("tools_executed", []),
                 "models_used": ["Saptiva KAL", "Saptiva Tools"],
@@ -289,8 +648,8 @@ async def process_kyc_with_saptiva_tools(request: KYCRequest):
             }
         )
         
-        return response
-        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error procesando KYC con tools: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error procesando KYC con tools: {str(e)}")
@@ -338,7 +697,7 @@ async def get_saptiva_tools_info():
         raise HTTPException(status_code=500, detail=f"Error obteniendo información: {str(e)}")
 
 @app.post("/kyc/rag-query")
-async def kyc_rag_query(query: dict):
+async def kyc_rag_query(query: dict, x_request_timeout: Optional[str] = Header(None)):
     """
     Consulta RAG sobre normativas bancarias mexicanas
     Demuestra Saptiva Embed + Saptiva Cortex + RAGster
@@ -351,7 +710,8 @@ async def kyc_rag_query(query: dict):
         logger.info(f"🧠 Consulta RAG: {question}")
         
         # Consulta RAG
-        result = await kyc_orchestrator.saptiva_service.rag_service.rag_query(question)
+        with deadline_scope(deadline_for("rag-query", x_request_timeout)):
+            result = await kyc_orchestrator.saptiva_service.rag_service.rag_query(question)
         
         return {
             "question": question,
@@ -371,8 +731,29 @@ async def kyc_rag_query(query: dict):
         logger.error(f"❌ Error en consulta RAG: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error en consulta RAG: {str(e)}")
 
+@app.post("/kyc/rag-query/stream")
+async def kyc_rag_query_stream(query: dict, x_request_timeout: Optional[str] = Header(None)):
+    """
+    Consulta RAG con la respuesta de Saptiva Cortex en streaming (text/event-stream)
+    Eventos: sources -> token... -> done
+    """
+    question = query.get("question", "")
+    if not question:
+        raise HTTPException(status_code=400, detail="Campo 'question' requerido")
+    
+    logger.info(f"🧠 Consulta RAG (stream): {question}")
+    
+    return StreamingResponse(
+        sse_stream(
+            kyc_orchestrator.saptiva_service.rag_service.stream_rag_query(question),
+            deadline_for("rag-query", x_request_timeout)
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.post("/kyc/validate-compliance")
-async def validate_kyc_compliance(kyc_data: dict):
+async def validate_kyc_compliance(kyc_data: dict, x_request_timeout: Optional[str] = Header(None)):
     """
     Valida cumplimiento normativo usando RAG
     """
@@ -380,7 +761,8 @@ async def validate_kyc_compliance(kyc_data: dict):
         logger.info("🛡️ Validando cumplimiento normativo con RAG")
         
         # Validar compliance usando RAG
-        result = await kyc_orchestrator.saptiva_service.rag_service.validate_kyc_compliance(kyc_data)
+        with deadline_scope(deadline_for("validate-compliance", x_request_timeout)):
+            result = await kyc_orchestrator.saptiva_service.rag_service.validate_kyc_compliance(kyc_data)
         
         return {
             "compliance_validation": result,
@@ -397,6 +779,22 @@ async def validate_kyc_compliance(kyc_data: dict):
         logger.error(f"❌ Error validando compliance: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error validando compliance: {str(e)}")
 
+@app.post("/kyc/validate-compliance/stream")
+async def validate_kyc_compliance_stream(kyc_data: dict, x_request_timeout: Optional[str] = Header(None)):
+    """
+    Valida cumplimiento normativo con el análisis RAG en streaming (text/event-stream)
+    """
+    logger.info("🛡️ Validando cumplimiento normativo con RAG (stream)")
+    
+    return StreamingResponse(
+        sse_stream(
+            kyc_orchestrator.saptiva_service.rag_service.stream_kyc_compliance(kyc_data),
+            deadline_for("validate-compliance", x_request_timeout)
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.get("/kyc/rag-info")
 async def get_rag_info():
     """
@@ -566,51 +964,42 @@ async def log_manual_usage(usage_data: dict):
 @app.get("/saptiva/connectivity-status")
 async def check_saptiva_connectivity():
     """
-    Verifica el estado de conectividad con la API de Saptiva
+    Estado de conectividad con la API de Saptiva según los circuit breakers
+    (no hace llamadas de red: refleja el resultado de las llamadas reales)
     """
     try:
-        import aiohttp
-        import ssl
-        
         api_key = os.getenv("SAPTIVA_API_KEY", "")
+        breakers = get_breaker_registry()
         
-        # URLs a verificar
+        # URLs monitoreadas por endpoint de circuit breaker
         endpoints = {
-            "chat_api": "https://api.saptiva.com/v1/chat/completions",
-            "embed_api": "https://api.saptiva.com/api/embed"
+            "chat_api": ("chat", kyc_orchestrator.saptiva_service.base_url),
+            "embed_api": ("embed", kyc_orchestrator.saptiva_service.embed_url)
         }
         
         connectivity_status = {}
         
-        for name, url in endpoints.items():
-            try:
-                # Configurar SSL
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-                
-                connector = aiohttp.TCPConnector(ssl=ssl_context)
-                
-                async with aiohttp.ClientSession(connector=connector) as session:
-                    # Test simple de conectividad
-                    async with session.get(
-                        url,
-                        headers={"Authorization": f"Bearer {api_key}"},
-                        timeout=aiohttp.ClientTimeout(total=5)
-                    ) as response:
-                        connectivity_status[name] = {
-                            "url": url,
-                            "status": "connected",
-                            "http_status": response.status,
-                            "response_time": "< 5s"
-                        }
-                        
-            except Exception as e:
+        for name, (endpoint, url) in endpoints.items():
+            state = breakers.endpoint_state(endpoint)
+            if state == "open":
                 connectivity_status[name] = {
                     "url": url,
                     "status": "disconnected",
-                    "error": str(e),
-                    "fallback": "simulation_mode"
+                    "circuit_state": state,
+                    "fallback": "simulation_mode" if breakers.degrade else "fail_fast"
+                }
+            elif state == "half_open":
+                connectivity_status[name] = {
+                    "url": url,
+                    "status": "recovering",
+                    "circuit_state": state,
+                    "fallback": "simulation_mode" if breakers.degrade else "fail_fast"
+                }
+            else:
+                connectivity_status[name] = {
+                    "url": url,
+                    "status": "connected",
+                    "circuit_state": state or "no_traffic"
                 }
         
         # Determinar modo de operación
@@ -626,7 +1015,8 @@ async def check_saptiva_connectivity():
                 "operation_mode": operation_mode,
                 "connected_apis": connected_apis,
                 "total_apis": total_apis,
-                "endpoints": connectivity_status
+                "endpoints": connectivity_status,
+                "circuit_breakers": breakers.get_status()
             },
             "demo_status": {
                 "fully_functional": True,
@@ -655,4 +1045,60 @@ async def check_saptiva_connectivity():
                 "fully_functional": True,
                 "demo_ready": True
             }
-        }
\ No newline at end of file
+        }
+
+@app.get("/saptiva/pool-metrics")
+async def get_saptiva_pool_metrics():
+    """
+    Métricas del pool HTTP compartido (uso y reutilización de conexiones)
+    """
+    return {"http_pool": get_http_pool().get_metrics()}
+
+@app.get("/saptiva/cache-metrics")
+async def get_saptiva_cache_metrics():
+    """
+    Métricas del cache de completions (hit/miss por nivel y por modelo)
+    """
+    return {"completion_cache": get_completion_cache().get_metrics()}
+
+@app.get("/saptiva/coalescing-metrics")
+async def get_coalescing_metrics():
+    """
+    Métricas de single-flight (ejecuciones reales vs duplicadas coalescidas) y de micro-batching de embeddings
+    """
+    return {
+        "saptiva_requests": get_single_flight().get_metrics(),
+        "kyc_applications": kyc_orchestrator.single_flight.get_metrics(),
+        "embedding_batches": kyc_orchestrator.saptiva_service.rag_service.embed_batcher.get_metrics()
+    }
+
+@app.get("/saptiva/limiter-status")
+async def get_limiter_status():
+    """
+    Límites de concurrencia adaptativos por modelo (límite actual, en vuelo, cola)
+    """
+    return {"limiters": get_limiter_registry().get_status()}
+
+@app.get("/saptiva/cascade-metrics")
+async def get_cascade_metrics():
+    """
+    Bandas de incertidumbre y tasa de escalamiento a Guard/KAL de la cascada de modelos
+    """
+    return get_model_cascade().get_metrics()
+
+@app.get("/saptiva/retry-metrics")
+async def get_retry_metrics():
+    """
+    Reintentos, hedging y políticas de reintento por modelo
+    """
+    return {"retries": get_saptiva_client().get_metrics()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Métricas en formato Prometheus (histogramas de latencia por paso)
+    """
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
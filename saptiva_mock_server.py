@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la API de Saptiva (chat completions + embed)
+Latencia configurable por distribución, inyección de errores/429 y streaming SSE
+
+Uso:
+    python saptiva_mock_server.py --port 8001 --latency lognormal:-0.5,0.4 --error-rate 0.02
+    SAPTIVA_BASE_URL=http://localhost:8001 uvicorn main:app
+"""
+
+import os
+import json
+import time
+import uuid
+import math
+import random
+import asyncio
+import hashlib
+import argparse
+import logging
+from typing import Dict, Any, List, Callable
+
+from aiohttp import web
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("saptiva_mock")
+
+EMBEDDING_DIM = 384
+
+# Respuestas de ejemplo por modelo (mismo tono que las del servicio real)
+MODEL_REPLIES = {
+    "Saptiva OCR": "Documento procesado: nombre, CURP, fecha de nacimiento y domicilio extraídos correctamente.",
+    "Saptiva Guard": "Identidad consistente con los datos proporcionados. Sin coincidencias en listas OFAC/ONU/UE/PEP.",
+    "Saptiva Ops": "Historial crediticio estable, sin atrasos relevantes. Capacidad de pago adecuada.",
+    "Saptiva KAL": "Se recomienda APROBAR conforme a las disposiciones de la CNBV y CONDUSEF; perfil de riesgo aceptable.",
+    "Saptiva Cortex": "De acuerdo con las Disposiciones de carácter general de la CNBV, la institución debe integrar "
+                      "un expediente de identificación del cliente, verificar su identidad y conservar la "
+                      "documentación durante el plazo que marca la normativa aplicable."
+}
+DEFAULT_REPLY = "Procesamiento exitoso con el modelo solicitado."
+
+def parse_distribution(spec: str) -> Callable[[], float]:
+    """
+    Distribución de latencia en segundos:
+    fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MU,SIGMA | exponential:MEAN
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(value) for value in args.split(",") if value.strip()]
+    kind = kind.strip().lower()
+
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(params[0], params[1])
+    if kind == "exponential":
+        return lambda: random.expovariate(1 / params[0])
+    raise ValueError(f"Distribución desconocida: {spec}")
+
+def estimate_tokens(text: str) -> int:
+    return max(1, int(len(text.split()) * 1.3))
+
+def fake_embedding(text: str) -> List[float]:
+    """Embedding determinista (mismo texto -> mismo vector), normalizado"""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+class SaptivaMock:
+    """Estado y configuración del servidor mock"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.chat_latency = parse_distribution(args.latency)
+        self.embed_latency = parse_distribution(args.embed_latency)
+        self.model_latency = {
+            model: parse_distribution(spec)
+            for model, spec in json.loads(args.model_latency or "{}").items()
+        }
+        self.token_interval = parse_distribution(args.token_interval)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.max_concurrency = args.max_concurrency
+        self.reasoning_rate = args.reasoning_rate
+        self.in_flight = 0
+        self.stats = {
+            "requests": 0,
+            "chat": 0,
+            "chat_streams": 0,
+            "embed": 0,
+            "embed_texts": 0,
+            "injected_errors": 0,
+            "rate_limited": 0,
+            "unauthorized": 0,
+            "peak_in_flight": 0,
+            "started_at": time.time()
+        }
+
+    def _latency_for(self, model: str) -> float:
+        return self.model_latency.get(model, self.chat_latency)()
+
+    def _fault(self, request: web.Request):
+        """Respuesta de error inyectada (401/429/5xx) o None"""
+        self.stats["requests"] += 1
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            self.stats["unauthorized"] += 1
+            return web.json_response({"detail": "Not authenticated"}, status=401)
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            self.stats["rate_limited"] += 1
+            return web.json_response(
+                {"detail": "Too many concurrent requests"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after), "X-RateLimit-Remaining": "0"}
+            )
+        if random.random() < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return web.json_response(
+                {"detail": "Rate limit exceeded"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)}
+            )
+        if random.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            status = random.choice((500, 502, 503))
+            return web.json_response({"detail": "Injected upstream error"}, status=status)
+        return None
+
+    def _reply(self, model: str, max_tokens: int) -> Dict[str, str]:
+        words = MODEL_REPLIES.get(model, DEFAULT_REPLY).split()
+        content = " ".join(words[:max(1, int(max_tokens / 1.3))])
+        if random.random() < self.reasoning_rate:
+            # Algunos modelos responden solo en reasoning_content
+            return {"content": "", "reasoning_content": f"Análisis: {content}"}
+        return {"content": content, "reasoning_content": ""}
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        fault = self._fault(request)
+        if fault is not None:
+            return fault
+        body = await request.json()
+        model = body.get("model", "Saptiva Turbo")
+        max_tokens = int(body.get("max_tokens", 256))
+        prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+        reply = self._reply(model, max_tokens)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(reply["content"] or reply["reasoning_content"])
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+
+        self.in_flight += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        self.stats["chat"] += 1
+        try:
+            if body.get("stream"):
+                return await self._stream_chat(request, body, model, reply, usage, completion_id)
+
+            await asyncio.sleep(self._latency_for(model))
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "system_fingerprint": "fp_saptiva_mock",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", **reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream_chat(self,
+                           request: web.Request,
+                           body: Dict[str, Any],
+                           model: str,
+                           reply: Dict[str, str],
+                           usage: Dict[str, int],
+                           completion_id: str) -> web.StreamResponse:
+        """Chat completions en SSE: latencia hasta el primer token y luego un delta por token"""
+        self.stats["chat_streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        def chunk(delta: Dict[str, Any], finish_reason=None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        await asyncio.sleep(self._latency_for(model))
+        await response.write(chunk({"role": "assistant"}))
+        for field in ("reasoning_content", "content"):
+            for word in reply[field].split():
+                await response.write(chunk({field: f"{word} "}))
+                await asyncio.sleep(self.token_interval())
+        await response.write(chunk({}, finish_reason="stop"))
+
+        if body.get("stream_options", {}).get("include_usage"):
+            usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def embed(self, request: web.Request) -> web.Response:
+        fault = self._fault(request)
+        if fault is not None:
+            return fault
+        body = await request.json()
+        prompt = body.get("prompt", body.get("input", ""))
+
+        self.in_flight += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        self.stats["embed"] += 1
+        try:
+            await asyncio.sleep(self.embed_latency())
+            if isinstance(prompt, list):
+                # Lote: un embedding por texto, en orden
+                self.stats["embed_texts"] += len(prompt)
+                return web.json_response({
+                    "model": body.get("model", "Saptiva Embed"),
+                    "embeddings": [fake_embedding(text) for text in prompt],
+                    "prompt_eval_count": sum(estimate_tokens(text) for text in prompt)
+                })
+            self.stats["embed_texts"] += 1
+            return web.json_response({
+                "model": body.get("model", "Saptiva Embed"),
+                "embeddings": fake_embedding(prompt),
+                "prompt_eval_count": estimate_tokens(prompt)
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "in_flight": self.in_flight})
+
+def build_app(args: argparse.Namespace) -> web.Application:
+    mock = SaptivaMock(args)
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", mock.chat_completions)
+    app.router.add_post("/api/embed", mock.embed)
+    app.router.add_get("/mock/stats", mock.get_stats)
+    app["mock"] = mock
+    return app
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock local de la API de Saptiva")
+    parser.add_argument("--host", default=os.getenv("SAPTIVA_MOCK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SAPTIVA_MOCK_PORT", "8001")))
+    parser.add_argument("--latency", default=os.getenv("SAPTIVA_MOCK_LATENCY", "lognormal:-0.7,0.5"),
+                        help="Latencia de chat: fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MU,SIGMA | exponential:MEAN")
+    parser.add_argument("--embed-latency", default=os.getenv("SAPTIVA_MOCK_EMBED_LATENCY", "lognormal:-3,0.5"))
+    parser.add_argument("--model-latency", default=os.getenv("SAPTIVA_MOCK_MODEL_LATENCY"),
+                        help='Overrides por modelo (JSON), p. ej. {"Saptiva Ops": "fixed:1.5"}')
+    parser.add_argument("--token-interval", default=os.getenv("SAPTIVA_MOCK_TOKEN_INTERVAL", "fixed:0.02"),
+                        help="Pausa entre deltas en streaming")
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("SAPTIVA_MOCK_ERROR_RATE", "0")))
+    parser.add_argument("--rate-limit-rate", type=float, default=float(os.getenv("SAPTIVA_MOCK_RATE_LIMIT_RATE", "0")))
+    parser.add_argument("--retry-after", type=float, default=float(os.getenv("SAPTIVA_MOCK_RETRY_AFTER", "1")))
+    parser.add_argument("--max-concurrency", type=int, default=int(os.getenv("SAPTIVA_MOCK_MAX_CONCURRENCY", "0")),
+                        help="429 cuando hay más peticiones en vuelo (0 = sin límite)")
+    parser.add_argument("--reasoning-rate", type=float, default=float(os.getenv("SAPTIVA_MOCK_REASONING_RATE", "0")),
+                        help="Fracción de respuestas solo con reasoning_content")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    logger.info(f"🧪 Saptiva mock en http://{args.host}:{args.port} (latencia {args.latency})")
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None)
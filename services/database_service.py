@@ -1,29 +1,507 @@
+import os
 import asyncio
 import json
-from typing import Dict, Any, Optional
+import time
+import zlib
+import base64
+import pickle
+import bisect
+import itertools
+from collections import deque
+from typing import Dict, Any, Optional, List, Set, Tuple, Iterator, Sequence
 from datetime import datetime
 import logging
 
+from .metrics import metrics_registry
+from .record_store import create_record_store
+
 logger = logging.getLogger(__name__)
 
+WRITE_BEHIND_DEPTH = metrics_registry.gauge(
+    "kyc_write_behind_queue_depth",
+    "Registros KYC encolados pendientes de escribir (modo write-behind)"
+)
+WRITE_BEHIND_LAG = metrics_registry.gauge(
+    "kyc_write_behind_lag_seconds",
+    "Antigüedad del registro más viejo aún no escrito (modo write-behind)"
+)
+WRITE_BEHIND_BATCH = metrics_registry.histogram(
+    "kyc_write_behind_batch_size",
+    "Registros por escritura agrupada (modo write-behind)",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+
+# Campos con índice secundario (valor -> conjunto de customer_id)
+INDEXED_FIELDS = ("status", "approved", "risk_level")
+
+# Filtros de rango sobre el índice ordenado de created_at (ISO 8601, inclusivos)
+RANGE_FILTERS = ("created_after", "created_before")
+
+# Una cota de solo fecha (YYYY-MM-DD) como created_before abarca el día completo
+END_OF_DAY = "T23:59:59.999999"
+
+def index_value(record: Dict[str, Any], field: str) -> Any:
+    """Valor indexado de un campo; risk_level vive dentro de risk_assessment en los registros del pipeline"""
+    if field == "risk_level" and "risk_level" not in record:
+        return (record.get("risk_assessment") or {}).get("risk_level")
+    return record.get(field)
+
+class KYCRow:
+    """
+    Fila caliente de un cliente: lo que usan el estado, los índices, las estadísticas y la
+    paginación. El registro completo vive en BlobStore y solo se decodifica cuando se pide
+    """
+    
+    __slots__ = ("customer_id", "status", "approved", "risk_level", "score",
+                 "processing_time", "created_at", "updated_at")
+    
+    def __init__(self,
+                 customer_id: str,
+                 status: Optional[str],
+                 approved: bool,
+                 risk_level: Optional[str],
+                 score: Optional[float],
+                 processing_time: Optional[float],
+                 created_at: Optional[str],
+                 updated_at: Optional[str]):
+        self.customer_id = customer_id
+        self.status = status
+        self.approved = approved
+        self.risk_level = risk_level
+        self.score = score
+        self.processing_time = processing_time
+        self.created_at = created_at
+        self.updated_at = updated_at
+    
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "KYCRow":
+        return cls(
+            customer_id=record["customer_id"],
+            status=record.get("status"),
+            approved=bool(record.get("approved", False)),
+            risk_level=index_value(record, "risk_level"),
+            score=(record.get("risk_assessment") or {}).get("final_score"),
+            processing_time=record.get("processing_time"),
+            created_at=record.get("created_at"),
+            updated_at=record.get("updated_at")
+        )
+    
+    def get(self, field: str, default: Any = None) -> Any:
+        """Misma lectura que sobre el registro completo, para los campos de la fila"""
+        return getattr(self, field, default)
+    
+    def replace(self, **changes) -> "KYCRow":
+        """Copia con campos cambiados (la fila guardada no se muta: sus valores siguen en los índices)"""
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values.update(changes)
+        return KYCRow(**values)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+# Campos que se pueden leer o proyectar sin tocar el blob
+ROW_FIELDS = frozenset(KYCRow.__slots__)
+
+# Diccionario de compresión: zlib usa como máximo 32 KB
+BLOB_ZDICT_MAX = 32 * 1024
+
+class BlobStore:
+    """
+    Registros completos (resultados OCR, análisis de Saptiva, metadatos de modelos) fuera de
+    las filas calientes: pickle comprimido con zlib, decodificado solo cuando se pide. Los
+    datos son del propio proceso, nunca entrada externa. Los metadatos de modelos se repiten
+    en cada registro, así que se comprimen contra un diccionario tomado de un registro ya
+    guardado; el primer byte de cada blob indica qué versión del diccionario usa
+    """
+    
+    def __init__(self, level: int = 6):
+        self.level = level
+        self._blobs: Dict[str, bytes] = {}
+        self._dictionaries: List[bytes] = []
+        self.nbytes = 0
+        self.metrics = {"reads": 0, "writes": 0}
+    
+    def put(self, key: str, record: Dict[str, Any]):
+        raw = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        # Un registro bastante más grande que el diccionario actual (p. ej. el primer
+        # completado después de un error) lo reemplaza para los blobs siguientes
+        current = len(self._dictionaries[-1]) if self._dictionaries else 0
+        if current < BLOB_ZDICT_MAX and len(raw) > 2 * current and len(self._dictionaries) < 256:
+            self._dictionaries.append(raw[-BLOB_ZDICT_MAX:])
+        version = len(self._dictionaries) - 1
+        
+        compressor = zlib.compressobj(self.level, zdict=self._dictionaries[version])
+        data = bytes([version]) + compressor.compress(raw) + compressor.flush()
+        
+        previous = self._blobs.get(key)
+        if previous is not None:
+            self.nbytes -= len(previous)
+        self._blobs[key] = data
+        self.nbytes += len(data)
+        self.metrics["writes"] += 1
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        data = self._blobs.get(key)
+        if data is None:
+            return None
+        self.metrics["reads"] += 1
+        decompressor = zlib.decompressobj(zdict=self._dictionaries[data[0]])
+        return pickle.loads(decompressor.decompress(memoryview(data)[1:]) + decompressor.flush())
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "blobs": len(self._blobs),
+            "bytes": self.nbytes,
+            "avg_bytes": round(self.nbytes / len(self._blobs)) if self._blobs else 0,
+            "dictionaries": len(self._dictionaries),
+            "dictionary_bytes": sum(len(dictionary) for dictionary in self._dictionaries),
+            **self.metrics
+        }
+
+# Entradas del índice de created_at copiadas por iteración al recorrerlo en streaming
+SCAN_CHUNK = 1024
+
+def encode_cursor(record: Any) -> str:
+    """Cursor opaco de paginación keyset: posición (created_at, customer_id) del último registro (o KYCRow) entregado"""
+    raw = json.dumps([record.get("created_at") or "", record.get("customer_id")], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverso de encode_cursor; ValueError si el cursor no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, customer_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor de paginación inválido")
+    if not isinstance(created_at, str) or not isinstance(customer_id, str):
+        raise ValueError("Cursor de paginación inválido")
+    return (created_at, customer_id)
+
+def project_record(record: Any, fields: Sequence[str]) -> Dict[str, Any]:
+    """Solo los campos pedidos, de un registro completo o de una KYCRow (risk_level se resuelve como en los índices)"""
+    if isinstance(record, KYCRow):
+        return {field: record.get(field) for field in fields}
+    return {field: index_value(record, field) for field in fields}
+
+# Ventanas móviles de /kyc/stats: nombre -> (duración, resolución de los buckets) en segundos
+STATS_WINDOWS = {"1m": (60, 1), "1h": (3600, 10), "1d": (86400, 60)}
+
+OUTCOMES = ("approved", "rejected", "errors")
+
+def record_outcome(record: Dict[str, Any]) -> str:
+    """Clasificación de /kyc/stats: error, aprobado o rechazado (todo lo demás)"""
+    if record.get("status") == "error":
+        return "errors"
+    return "approved" if record.get("approved", False) else "rejected"
+
+class RollingWindow:
+    """
+    Resultados de los últimos `span` segundos en buckets de `resolution` segundos.
+    Los totales se mantienen al agregar y al expirar buckets: leerlos es O(1) amortizado
+    """
+    
+    def __init__(self, span: float, resolution: float):
+        self.span = span
+        self.resolution = resolution
+        # [inicio, approved, rejected, errors, suma de processing_time, muestras de processing_time]
+        self.buckets = deque()
+        self.totals = [0, 0, 0, 0.0, 0]
+    
+    def add(self, outcome: str, processing_time: Optional[float], now: float):
+        self._expire(now)
+        start = now - now % self.resolution
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append([start, 0, 0, 0, 0.0, 0])
+        bucket = self.buckets[-1]
+        
+        slot = OUTCOMES.index(outcome)
+        bucket[slot + 1] += 1
+        self.totals[slot] += 1
+        if processing_time is not None:
+            bucket[4] += processing_time
+            bucket[5] += 1
+            self.totals[3] += processing_time
+            self.totals[4] += 1
+    
+    def _expire(self, now: float):
+        limit = now - self.span
+        while self.buckets and self.buckets[0][0] + self.resolution <= limit:
+            bucket = self.buckets.popleft()
+            for index, value in enumerate(bucket[1:]):
+                self.totals[index] -= value
+        if not self.buckets:
+            # Sin buckets vivos: descartar el error acumulado de las restas en punto flotante
+            self.totals = [0, 0, 0, 0.0, 0]
+    
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        self._expire(now)
+        approved, rejected, errors, time_sum, time_count = self.totals
+        return {
+            "approved": approved,
+            "rejected": rejected,
+            "errors": errors,
+            "avg_processing_time": round(time_sum / time_count, 3) if time_count else 0
+        }
+
 class DatabaseService:
     """Servicio de base de datos para KYC (simulado)"""
     
     def __init__(self):
         # En producción, aquí iría la conexión real a PostgreSQL
-        self.records = {}  # Simulación en memoria
+        self.rows: Dict[str, KYCRow] = {}  # Simulación en memoria: filas calientes
+        self.blobs = BlobStore()  # Registros completos, decodificados bajo demanda
+        self.checkpoints = {}  # customer_id -> resultados por paso de la última aplicación incompleta
+        
+        # Índices secundarios mantenidos en cada escritura
+        self.indexes: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in INDEXED_FIELDS}
+        self.created_index: List[Tuple[str, str]] = []  # (created_at, customer_id) ordenado
+        
+        # Contadores de /kyc/stats mantenidos en cada escritura (una sobrescritura resta el estado anterior)
+        self.counters = {"total": 0, "approved": 0, "errors": 0}
+        self.windows = {name: RollingWindow(span, resolution) for name, (span, resolution) in STATS_WINDOWS.items()}
+        
+        # Almacén durable (KYC_DB_BACKEND=sqlite): la memoria se reconstruye desde él al arrancar
+        self.store = create_record_store(os.getenv("KYC_DB_BACKEND", "memory").lower())
+        self._store_ready = False
+        self._store_lock = asyncio.Lock()
+        
+        # Write-behind: save_kyc_record encola y un flusher escribe por lotes (solo con start())
+        self.write_behind = os.getenv("KYC_WRITE_BEHIND", "false").lower() == "true"
+        self.write_behind_queue_size = int(os.getenv("KYC_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+        self.write_behind_batch_size = max(1, int(os.getenv("KYC_WRITE_BEHIND_BATCH_SIZE", "100")))
+        self.write_behind_interval = float(os.getenv("KYC_WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))
+        self.write_behind_shutdown_timeout = float(os.getenv("KYC_WRITE_BEHIND_SHUTDOWN_TIMEOUT", "30"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        # Overlay read-your-writes: customer_id -> (último registro encolado, momento en que se encoló)
+        self.pending: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self.write_behind_metrics = {
+            "enqueued": 0,
+            "flushed": 0,
+            "batches": 0,
+            "flush_errors": 0,
+            "max_lag_seconds": 0.0
+        }
+    
+    def _count(self, row: KYCRow, sign: int):
+        self.counters["total"] += sign
+        self.counters["approved"] += sign * row.approved
+        self.counters["errors"] += sign * (row.status == "error")
+    
+    def _observe_outcome(self, row: KYCRow):
+        """Registra el resultado en las ventanas móviles"""
+        now = time.monotonic()
+        outcome = record_outcome(row)
+        for window in self.windows.values():
+            window.add(outcome, row.processing_time, now)
+    
+    def _index_add(self, row: KYCRow):
+        for field in INDEXED_FIELDS:
+            self.indexes[field].setdefault(getattr(row, field), set()).add(row.customer_id)
+        if row.created_at:
+            bisect.insort(self.created_index, (row.created_at, row.customer_id))
+    
+    def _index_remove(self, row: KYCRow):
+        for field in INDEXED_FIELDS:
+            value = getattr(row, field)
+            bucket = self.indexes[field].get(value)
+            if bucket is not None:
+                bucket.discard(row.customer_id)
+                if not bucket:
+                    del self.indexes[field][value]
+        if row.created_at:
+            entry = (row.created_at, row.customer_id)
+            position = bisect.bisect_left(self.created_index, entry)
+            if position < len(self.created_index) and self.created_index[position] == entry:
+                del self.created_index[position]
+    
+    def _replace_row(self, row: KYCRow):
+        """Instala la fila nueva; la anterior (si hay) sale primero de índices y contadores"""
+        previous = self.rows.get(row.customer_id)
+        if previous is not None:
+            self._index_remove(previous)
+            self._count(previous, -1)
+        self.rows[row.customer_id] = row
+        self._index_add(row)
+        self._count(row, 1)
+    
+    async def _open_store(self):
+        """Abre el almacén durable (una vez) y carga sus registros en filas, índices y blobs"""
+        if self.store is None or self._store_ready:
+            return
+        async with self._store_lock:
+            if self._store_ready:
+                return
+            await self.store.open()
+            records = await self.store.load_records()
+            for record in records:
+                row = KYCRow.from_record(record)
+                self.blobs.put(row.customer_id, record)
+                self._replace_row(row)
+            self._store_ready = True
+            logger.info(f"🗄️ {len(records)} registros KYC cargados del almacén durable")
+    
+    async def start(self):
+        """
+        Abre el almacén durable (si hay) y arranca el flusher si KYC_WRITE_BEHIND=true;
+        sin start() las escrituras son síncronas
+        """
+        await self._open_store()
+        if not self.write_behind or self._flusher is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.write_behind_queue_size)
+        self._flusher = asyncio.ensure_future(self._flush_loop())
+        logger.info(
+            f"🗄️ Write-behind activo: lotes de hasta {self.write_behind_batch_size} registros "
+            f"cada {self.write_behind_interval}s (cola máx. {self.write_behind_queue_size})"
+        )
+    
+    async def stop(self):
+        """
+        Escribe todo lo encolado antes de detener el flusher (apagado ordenado) y cierra el almacén
+        
+        Mientras se vacía la cola, save_kyc_record sigue encolando detrás de los registros
+        anteriores; solo cuando el flusher termina las escrituras pasan a ser directas.
+        """
+        if self._flusher is not None:
+            await self._drain_write_behind()
+        if self._store_ready:
+            await self.store.close()
+            self._store_ready = False
+    
+    async def _drain_write_behind(self):
+        flusher = self._flusher
+        # Centinela: el flusher escribe lo que haya (incluido lo que llegue durante el vaciado) y termina
+        await self._queue.put(None)
+        try:
+            await asyncio.wait_for(flusher, self.write_behind_shutdown_timeout)
+            logger.info(f"🗄️ Write-behind detenido: {self.write_behind_metrics['flushed']} registros escritos")
+        except asyncio.TimeoutError:
+            # wait_for ya canceló el flusher
+            logger.error(
+                f"❌ Write-behind: flusher cancelado tras {self.write_behind_shutdown_timeout}s, "
+                f"{len(self.pending)} registros sin escribir al apagar"
+            )
+        finally:
+            self._flusher = None
+    
+    def _write_behind_running(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+    
+    async def _flush_loop(self):
+        """Agrupa registros hasta write_behind_batch_size o write_behind_interval y los escribe juntos"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while True:
+            if stopping:
+                # Apagando: se vacía la cola sin esperar y se termina cuando ya no queda nada
+                try:
+                    first = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            else:
+                first = await self._queue.get()
+            if first is None:
+                stopping = True
+                continue
+            batch = [first]
+            flush_at = loop.time() + self.write_behind_interval
+            while len(batch) < self.write_behind_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = flush_at - loop.time()
+                    if stopping or remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    continue
+                batch.append(item)
+            
+            lag = loop.time() - min(enqueued_at for _, enqueued_at in batch)
+            self.write_behind_metrics["max_lag_seconds"] = max(self.write_behind_metrics["max_lag_seconds"], lag)
+            await self._commit_with_retry([record for record, _ in batch])
+            
+            self.write_behind_metrics["flushed"] += len(batch)
+            self.write_behind_metrics["batches"] += 1
+            WRITE_BEHIND_BATCH.observe(len(batch))
+            WRITE_BEHIND_DEPTH.set(self._queue.qsize())
+            WRITE_BEHIND_LAG.set(self._queue_lag())
+    
+    async def _commit_with_retry(self, records: List[Dict[str, Any]]):
+        """Los registros siguen en el overlay hasta que el lote se escribe; un fallo se reintenta"""
+        delay = 0.1
+        while True:
+            try:
+                await self._commit_batch(records)
+                return
+            except Exception as e:
+                self.write_behind_metrics["flush_errors"] += 1
+                logger.error(f"❌ Write-behind: error escribiendo lote de {len(records)} registros: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+    
+    async def _commit_batch(self, records: List[Dict[str, Any]]):
+        """
+        Escritura agrupada: con almacén durable, una sola transacción (executemany) por lote,
+        antes de tocar la memoria. Los registros de un mismo cliente se aplican en orden de llegada
+        """
+        if self.store is not None:
+            await self._open_store()
+            await self.store.write_batch(records)
+        for record in records:
+            row = KYCRow.from_record(record)
+            self.blobs.put(row.customer_id, record)
+            self._replace_row(row)
+            self._observe_outcome(row)
+            
+            pending = self.pending.get(row.customer_id)
+            if pending is not None and pending[0] is record:
+                del self.pending[row.customer_id]
+    
+    def _queue_lag(self) -> float:
+        """Antigüedad del registro pendiente más viejo (0 si no hay pendientes)"""
+        if not self.pending:
+            return 0.0
+        now = asyncio.get_running_loop().time()
+        return now - min(enqueued_at for _, enqueued_at in self.pending.values())
+    
+    def _load(self, row: KYCRow) -> Dict[str, Any]:
+        """Registro completo: el blob más los campos que update_kyc_status cambia solo en la fila"""
+        record = self.blobs.get(row.customer_id) or {"customer_id": row.customer_id}
+        record["status"] = row.status
+        record["updated_at"] = row.updated_at
+        return record
     
     async def save_kyc_record(self, record: Dict[str, Any]) -> bool:
-        """Guarda un registro KYC en la base de datos"""
+        """Guarda un registro KYC en la base de datos (con write-behind activo: lo encola y regresa)"""
         try:
             customer_id = record["customer_id"]
             
-            # Agregar timestamp
-            record["created_at"] = datetime.utcnow().isoformat()
-            record["updated_at"] = datetime.utcnow().isoformat()
+            # Timestamps: una actualización conserva el created_at original (orden y filtros por fecha)
+            now = datetime.utcnow().isoformat()
+            record["created_at"] = self._original_created_at(customer_id) or now
+            record["updated_at"] = now
+            
+            if self._write_behind_running():
+                # Write-behind: visible de inmediato para lecturas puntuales (overlay); si la cola
+                # está llena, la petición espera a que el flusher libere lugar
+                enqueued_at = asyncio.get_running_loop().time()
+                self.pending[customer_id] = (record, enqueued_at)
+                await self._queue.put((record, enqueued_at))
+                self.write_behind_metrics["enqueued"] += 1
+                WRITE_BEHIND_DEPTH.set(self._queue.qsize())
+                logger.info(f"Registro KYC encolado para cliente: {customer_id}")
+                return True
             
-            # Simular guardado en base de datos
-            self.records[customer_id] = record
+            # Simular guardado en base de datos: fila caliente + blob con el registro completo.
+            # Un registro que quedó en el overlay (flusher cancelado al apagar) es más viejo que este
+            self.pending.pop(customer_id, None)
+            await self._commit_batch([record])
             
             logger.info(f"Registro KYC guardado para cliente: {customer_id}")
             return True
@@ -32,10 +510,24 @@ class DatabaseService:
             logger.error(f"Error guardando registro KYC: {str(e)}")
             raise
     
+    def _original_created_at(self, customer_id: str) -> Optional[str]:
+        """created_at de la versión ya guardada (o encolada) del registro, si existe"""
+        pending = self.pending.get(customer_id)
+        if pending is not None:
+            return pending[0].get("created_at")
+        row = self.rows.get(customer_id)
+        return row.created_at if row is not None else None
+    
     async def get_kyc_record(self, customer_id: str) -> Optional[Dict[str, Any]]:
-        """Obtiene un registro KYC de la base de datos"""
+        """Obtiene un registro KYC completo de la base de datos (decodifica el blob)"""
         try:
-            record = self.records.get(customer_id)
+            pending = self.pending.get(customer_id)
+            if pending is not None:
+                # Aún en la cola de write-behind: se lee la última versión encolada
+                record = dict(pending[0])
+            else:
+                row = self.rows.get(customer_id)
+                record = self._load(row) if row is not None else None
             
             if record:
                 logger.info(f"Registro KYC encontrado para cliente: {customer_id}")
@@ -48,18 +540,54 @@ class DatabaseService:
             logger.error(f"Error obteniendo registro KYC: {str(e)}")
             raise
     
+    async def get_kyc_row(self, customer_id: str) -> Optional[KYCRow]:
+        """Fila caliente de un cliente (estado, aprobación, riesgo, score, timestamps) sin leer el blob"""
+        pending = self.pending.get(customer_id)
+        if pending is not None:
+            return KYCRow.from_record(pending[0])
+        return self.rows.get(customer_id)
+    
     async def update_kyc_status(self, customer_id: str, status: str, details: Dict[str, Any] = None) -> bool:
         """Actualiza el estado de un registro KYC"""
         try:
-            if customer_id not in self.records:
+            pending = self.pending.get(customer_id)
+            if pending is not None:
+                # Registro aún en la cola: se modifica la versión encolada (el flusher escribe el resultado)
+                record = pending[0]
+                record["status"] = status
+                record["updated_at"] = datetime.utcnow().isoformat()
+                if details:
+                    record.update(details)
+                logger.info(f"Estado KYC actualizado para {customer_id}: {status} (pendiente de escritura)")
+                return True
+            
+            row = self.rows.get(customer_id)
+            if row is None:
                 logger.warning(f"Intento de actualizar registro inexistente: {customer_id}")
                 return False
             
-            self.records[customer_id]["status"] = status
-            self.records[customer_id]["updated_at"] = datetime.utcnow().isoformat()
+            previous_outcome = record_outcome(row)
+            updated_at = datetime.utcnow().isoformat()
             
             if details:
-                self.records[customer_id].update(details)
+                # Los detalles pueden cambiar cualquier campo: se reescribe el blob
+                record = self._load(row)
+                record["status"] = status
+                record["updated_at"] = updated_at
+                record.update(details)
+                if self.store is not None:
+                    await self.store.write_batch([record])
+                self.blobs.put(customer_id, record)
+                updated = KYCRow.from_record(record)
+            else:
+                # Solo estado y timestamp: el blob no se toca (_load los toma de la fila)
+                if self.store is not None:
+                    await self.store.update_status(customer_id, status, updated_at)
+                updated = row.replace(status=status, updated_at=updated_at)
+            self._replace_row(updated)
+            
+            if record_outcome(updated) != previous_outcome:
+                self._observe_outcome(updated)
             
             logger.info(f"Estado KYC actualizado para {customer_id}: {status}")
             return True
@@ -68,44 +596,222 @@ class DatabaseService:
             logger.error(f"Error actualizando estado KYC: {str(e)}")
             raise
     
+    def get_storage_metrics(self) -> Dict[str, Any]:
+        """Filas calientes, tamaño de los blobs y estado del write-behind"""
+        write_behind = {
+            "enabled": self.write_behind,
+            "running": self._write_behind_running(),
+            "queue_size": self.write_behind_queue_size,
+            "batch_size": self.write_behind_batch_size,
+            "flush_interval": self.write_behind_interval,
+            **self.write_behind_metrics
+        }
+        if self._queue is not None:
+            lag = self._queue_lag()
+            WRITE_BEHIND_LAG.set(lag)
+            write_behind["queue_depth"] = self._queue.qsize()
+            write_behind["pending_customers"] = len(self.pending)
+            write_behind["lag_seconds"] = round(lag, 4)
+            write_behind["avg_batch"] = (
+                round(self.write_behind_metrics["flushed"] / self.write_behind_metrics["batches"], 2)
+                if self.write_behind_metrics["batches"] else 0
+            )
+        return {
+            "backend": "memory" if self.store is None else self.store.get_metrics()["backend"],
+            "durable_store": self.store.get_metrics() if self.store is not None else None,
+            "rows": len(self.rows),
+            "row_fields": list(KYCRow.__slots__),
+            "blob_store": self.blobs.get_metrics(),
+            "write_behind": write_behind
+        }
+    
+    async def save_step_checkpoint(self, customer_id: str, fingerprint: str, step: str, result: Any) -> bool:
+        """Guarda el resultado de un paso del pipeline para reanudar la aplicación"""
+        try:
+            checkpoint = self.checkpoints.get(customer_id)
+            # Datos de la aplicación distintos: los checkpoints anteriores ya no aplican
+            if checkpoint is None or checkpoint["fingerprint"] != fingerprint:
+                checkpoint = {"fingerprint": fingerprint, "steps": {}}
+                self.checkpoints[customer_id] = checkpoint
+            
+            checkpoint["steps"][step] = {
+                "result": result,
+                "saved_at": datetime.utcnow().isoformat()
+            }
+            
+            logger.info(f"Checkpoint KYC guardado para {customer_id}: {step}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error guardando checkpoint KYC: {str(e)}")
+            raise
+    
+    async def get_step_checkpoints(self, customer_id: str, fingerprint: str, max_age: float = None) -> Dict[str, Any]:
+        """Resultados por paso guardados para la misma aplicación (y no más viejos que max_age segundos)"""
+        try:
+            checkpoint = self.checkpoints.get(customer_id)
+            if checkpoint is None or checkpoint["fingerprint"] != fingerprint:
+                return {}
+            
+            now = datetime.utcnow()
+            return {
+                step: saved["result"]
+                for step, saved in checkpoint["steps"].items()
+                if max_age is None or (now - datetime.fromisoformat(saved["saved_at"])).total_seconds() <= max_age
+            }
+            
+        except Exception as e:
+            logger.error(f"Error obteniendo checkpoints KYC: {str(e)}")
+            raise
+    
+    async def clear_step_checkpoints(self, customer_id: str) -> bool:
+        """Descarta los checkpoints de una aplicación que ya terminó"""
+        try:
+            return self.checkpoints.pop(customer_id, None) is not None
+            
+        except Exception as e:
+            logger.error(f"Error descartando checkpoints KYC: {str(e)}")
+            raise
+    
     async def get_kyc_statistics(self) -> Dict[str, Any]:
-        """Obtiene estadísticas de los procesos KYC"""
+        """Obtiene estadísticas de los procesos KYC (contadores incrementales, sin recorrer registros)"""
         try:
-            total_records = len(self.records)
-            approved_count = sum(1 for r in self.records.values() if r.get("approved", False))
-            error_count = sum(1 for r in self.records.values() if r.get("status") == "error")
+            total_records = self.counters["total"]
+            approved_count = self.counters["approved"]
+            error_count = self.counters["errors"]
+            now = time.monotonic()
             
             stats = {
                 "total_applications": total_records,
                 "approved": approved_count,
                 "rejected": total_records - approved_count - error_count,
                 "errors": error_count,
-                "approval_rate": (approved_count / total_records * 100) if total_records > 0 else 0
+                "approval_rate": (approved_count / total_records * 100) if total_records > 0 else 0,
+                "windows": {name: window.snapshot(now) for name, window in self.windows.items()}
             }
             
-            logger.info(f"Estadísticas KYC generadas: {stats}")
+            logger.debug(f"Estadísticas KYC generadas: {stats}")
             return stats
             
         except Exception as e:
             logger.error(f"Error generando estadísticas: {str(e)}")
             raise
     
-    async def search_kyc_records(self, filters: Dict[str, Any]) -> list:
-        """Busca registros KYC con filtros"""
+    def _created_range(self, created_after: Optional[str], created_before: Optional[str]) -> Set[str]:
+        """customer_id con created_at en [created_after, created_before]"""
+        start = bisect.bisect_left(self.created_index, (created_after,)) if created_after else 0
+        if created_before and len(created_before) == 10:
+            created_before += END_OF_DAY
+        end = bisect.bisect_right(self.created_index, (created_before, "\uffff")) if created_before else len(self.created_index)
+        return {customer_id for _, customer_id in self.created_index[start:end]}
+    
+    def _candidate_ids(self, filters: Dict[str, Any]) -> Optional[Set[str]]:
+        """
+        Intersección de los índices de los filtros, del conjunto más pequeño al más grande.
+        None si ningún filtro tiene índice (hay que recorrer la tabla)
+        """
+        sets = [
+            self.indexes[field].get(value, set())
+            for field, value in filters.items() if field in self.indexes
+        ]
+        if filters.get("created_after") or filters.get("created_before"):
+            sets.append(self._created_range(filters.get("created_after"), filters.get("created_before")))
+        if not sets:
+            return None
+        
+        sets.sort(key=len)
+        candidates = sets[0]
+        for other in sets[1:]:
+            if not candidates:
+                break
+            candidates = candidates & other
+        return candidates
+    
+    def _ordered_chunks(self, candidates: Optional[Set[str]], after: Optional[Tuple[str, str]] = None) -> Iterator[List[str]]:
+        """
+        Bloques de customer_id en orden (created_at, customer_id), posteriores a `after`. Un
+        resultado grande se toma del índice ya ordenado; uno pequeño se ordena directamente (más
+        barato que recorrer la tabla). El índice se copia por bloques y se vuelve a buscar la
+        posición en cada bloque, así que escrituras concurrentes no invalidan un recorrido en streaming
+        """
+        if candidates is not None and len(candidates) * 16 <= len(self.created_index):
+            # Una fila sin created_at (registro importado) se ordena al principio en lugar de romper el sort
+            ordered = sorted(
+                (self.rows[customer_id].created_at or "", customer_id)
+                for customer_id in candidates if customer_id in self.rows
+            )
+            start = bisect.bisect_right(ordered, after) if after else 0
+            yield [customer_id for _, customer_id in ordered[start:]]
+            return
+        
+        position = after
+        while True:
+            start = bisect.bisect_right(self.created_index, position) if position else 0
+            chunk = self.created_index[start:start + SCAN_CHUNK]
+            if not chunk:
+                return
+            if candidates is None:
+                yield [customer_id for _, customer_id in chunk]
+            else:
+                yield [customer_id for _, customer_id in chunk if customer_id in candidates]
+            position = chunk[-1]
+    
+    def _matching_chunks(self, filters: Dict[str, Any], after: Optional[Tuple[str, str]] = None) -> Iterator[List[KYCRow]]:
+        candidates = self._candidate_ids(filters)
+        residual = {
+            key: value for key, value in filters.items()
+            if key not in self.indexes and key not in RANGE_FILTERS
+        }
+        for chunk in self._ordered_chunks(candidates, after):
+            rows = [self.rows[customer_id] for customer_id in chunk if customer_id in self.rows]
+            if residual:
+                # Filtros sin índice: se evalúan sobre el registro completo y un registro sin el campo no se descarta
+                rows = [
+                    row for row, record in ((row, self._load(row)) for row in rows)
+                    if all(key not in record or record[key] == value for key, value in residual.items())
+                ]
+            yield rows
+    
+    def iter_kyc_rows(self, filters: Dict[str, Any], after: Optional[Tuple[str, str]] = None) -> Iterator[KYCRow]:
+        """
+        Filas que cumplen los filtros, una a la vez, en orden (created_at, customer_id) y
+        posteriores al cursor `after`. Síncrono y perezoso: no arma la lista de resultados
+        ni lee blobs (salvo para filtros sin índice)
+        """
+        for rows in self._matching_chunks(filters, after):
+            yield from rows
+    
+    def iter_kyc_records(self, filters: Dict[str, Any], after: Optional[Tuple[str, str]] = None) -> Iterator[Dict[str, Any]]:
+        """Como iter_kyc_rows, pero con el registro completo (un blob decodificado por registro)"""
+        for row in self.iter_kyc_rows(filters, after):
+            yield self._load(row)
+    
+    def row_view(self, row: KYCRow, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Registro completo o proyección `fields` de una fila; el blob solo se lee si algún campo no está en la fila"""
+        if not fields:
+            return self._load(row)
+        if ROW_FIELDS.issuperset(fields):
+            return project_record(row, fields)
+        return project_record(self._load(row), fields)
+    
+    async def search_kyc_records(self,
+                                 filters: Dict[str, Any],
+                                 limit: Optional[int] = None,
+                                 after: Optional[Tuple[str, str]] = None,
+                                 fields: Optional[Sequence[str]] = None) -> list:
+        """
+        Busca registros KYC con filtros. status, approved, risk_level y el rango de
+        created_at usan índices: el costo depende del número de resultados, no de la tabla.
+        `limit` y `after` (ver decode_cursor) paginan en orden (created_at, customer_id).
+        Con `fields` solo de la fila caliente (ROW_FIELDS) no se lee ningún blob
+        """
         try:
-            results = []
-            
-            for customer_id, record in self.records.items():
-                match = True
-                
-                # Aplicar filtros
-                for key, value in filters.items():
-                    if key in record and record[key] != value:
-                        match = False
-                        break
-                
-                if match:
-                    results.append(record)
+            if limit is None:
+                rows = [row for rows in self._matching_chunks(filters, after) for row in rows]
+            else:
+                rows = list(itertools.islice(self.iter_kyc_rows(filters, after), limit))
+            
+            results = [self.row_view(row, fields) for row in rows]
             
             logger.info(f"Búsqueda KYC completada: {len(results)} resultados")
             return results
@@ -0,0 +1,103 @@
+"""
+Request Deadlines
+Presupuesto de tiempo por petición, propagado (contextvar) hasta cada llamada a Saptiva
+"""
+
+import os
+import json
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Header con el presupuesto del llamador en segundos (p. ej. "X-Request-Timeout: 3")
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# Presupuesto por defecto por endpoint (segundos), sobreescribible con KYC_DEADLINE_DEFAULTS (JSON)
+DEFAULT_ENDPOINT_BUDGETS = {
+    "process": 30.0,
+    "process-simple": 15.0,
+    "process-async": 60.0,
+    "process-with-tools": 15.0,
+    "rag-query": 10.0,
+    "validate-compliance": 10.0
+}
+
+class DeadlineExceeded(Exception):
+    """Se agotó el presupuesto de tiempo de la petición"""
+
+    def __init__(self, operation: str = None):
+        super().__init__(f"Presupuesto de tiempo agotado{f' en {operation}' if operation else ''}")
+        self.operation = operation
+
+class Deadline:
+    """Instante límite (reloj monotónico) de una petición"""
+
+    def __init__(self, budget: float):
+        self.budget = max(0.0, budget)
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.budget
+
+    def extend(self, expires_at: float):
+        """Amplía el límite (nunca lo acorta); inf = sin límite"""
+        if expires_at > self.expires_at:
+            self.expires_at = expires_at
+            self.budget = self.expires_at - self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, default: float) -> float:
+        """Timeout de una llamada: el menor entre el suyo y el presupuesto restante"""
+        return min(default, self.remaining())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "budget": round(self.budget, 3),
+            "elapsed": round(time.monotonic() - self.started_at, 4),
+            "remaining": round(self.remaining(), 4),
+            "expired": self.expired
+        }
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("kyc_deadline", default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline de la petición en curso (None si no hay)"""
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """
+    Activa un deadline para el código (y las tareas) que se creen dentro del bloque
+    """
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def _endpoint_budgets() -> Dict[str, float]:
+    overrides = json.loads(os.getenv("KYC_DEADLINE_DEFAULTS", "{}"))
+    return {**DEFAULT_ENDPOINT_BUDGETS, **{name: float(value) for name, value in overrides.items()}}
+
+def deadline_for(endpoint: str, header_value: Optional[str] = None) -> Deadline:
+    """
+    Deadline a partir del header del llamador o del default del endpoint.
+    El header nunca puede exceder KYC_DEADLINE_MAX
+    """
+    budget = _endpoint_budgets().get(endpoint, float(os.getenv("KYC_DEADLINE_DEFAULT", "30")))
+    if header_value:
+        try:
+            requested = float(header_value)
+            if requested > 0:
+                budget = min(requested, float(os.getenv("KYC_DEADLINE_MAX", "120")))
+        except ValueError:
+            logger.warning(f"⚠️ {DEADLINE_HEADER} inválido: {header_value!r}, usando default de {endpoint}")
+    return Deadline(budget)
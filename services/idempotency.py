@@ -0,0 +1,132 @@
+"""
+Idempotency Keys
+Respuestas guardadas por header Idempotency-Key (LRU + TTL): los reintentos del cliente no repiten el pipeline
+"""
+
+import os
+import copy
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Awaitable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+class IdempotencyConflict(Exception):
+    """La misma clave se reutilizó con un cuerpo de petición distinto"""
+
+    def __init__(self, key: str):
+        super().__init__(f"{IDEMPOTENCY_HEADER} '{key}' ya se usó con una petición distinta")
+        self.key = key
+
+class IdempotencyStore:
+    """
+    Primera respuesta exitosa por (endpoint, clave). Una petición con la clave aún
+    en proceso espera ese resultado en lugar de ejecutar otra vez
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv("KYC_IDEMPOTENCY_TTL", "86400"))
+        self.max_entries = int(os.getenv("KYC_IDEMPOTENCY_MAX_ENTRIES", "10000"))
+        self.max_key_length = 255
+
+        # (endpoint, clave) -> (expires_at, fingerprint, respuesta)
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        # (endpoint, clave) -> (fingerprint, future de la ejecución en vuelo)
+        self._inflight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+
+        self.metrics = {
+            "executions": 0,
+            "replayed": 0,
+            "joined_in_flight": 0,
+            "conflicts": 0,
+            "evictions": 0,
+            "expired": 0
+        }
+
+    def validate_key(self, key: str) -> str:
+        key = key.strip()
+        if not key or len(key) > self.max_key_length:
+            raise ValueError(f"{IDEMPOTENCY_HEADER} debe tener entre 1 y {self.max_key_length} caracteres")
+        return key
+
+    async def run(self,
+                  endpoint: str,
+                  key: str,
+                  fingerprint: str,
+                  factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Devuelve (respuesta, replayed). Solo se guardan las ejecuciones exitosas: si
+        `factory()` falla, el error llega a todos los que esperaban y la clave queda libre
+        """
+        entry_key = (endpoint, key)
+
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            expires_at, stored_fingerprint, response = entry
+            if expires_at > time.time():
+                if stored_fingerprint != fingerprint:
+                    self.metrics["conflicts"] += 1
+                    raise IdempotencyConflict(key)
+                self._entries.move_to_end(entry_key)
+                self.metrics["replayed"] += 1
+                logger.info(f"🔁 Idempotency-Key {key} ({endpoint}): respuesta guardada")
+                return copy.deepcopy(response), True
+            del self._entries[entry_key]
+            self.metrics["expired"] += 1
+
+        inflight = self._inflight.get(entry_key)
+        if inflight is not None:
+            stored_fingerprint, task = inflight
+            if stored_fingerprint != fingerprint:
+                self.metrics["conflicts"] += 1
+                raise IdempotencyConflict(key)
+            self.metrics["joined_in_flight"] += 1
+            logger.info(f"🔗 Idempotency-Key {key} ({endpoint}): en proceso, esperando resultado")
+            return copy.deepcopy(await asyncio.shield(task)), True
+
+        task = asyncio.ensure_future(factory())
+        self._inflight[entry_key] = (fingerprint, task)
+        self.metrics["executions"] += 1
+        try:
+            # shield: si el cliente original se desconecta, la ejecución sigue para sus reintentos
+            response = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._complete(entry_key, fingerprint, task)
+            else:
+                task.add_done_callback(lambda done: self._complete(entry_key, fingerprint, done))
+        return response, False
+
+    def _complete(self, entry_key: Tuple[str, str], fingerprint: str, task: asyncio.Future):
+        if self._inflight.get(entry_key, (None, None))[1] is task:
+            del self._inflight[entry_key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[entry_key] = (time.time() + self.ttl, fingerprint, copy.deepcopy(task.result()))
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            **self.metrics
+        }
+
+_shared_store: Optional[IdempotencyStore] = None
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Devuelve el store compartido del proceso (se crea en el primer uso)"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = IdempotencyStore()
+    return _shared_store
@@ -0,0 +1,228 @@
+"""
+KYC Batch
+Procesa archivos de onboarding (JSONL/CSV) en streaming: concurrencia acotada y un resultado NDJSON por solicitante
+"""
+
+import os
+import csv
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, AsyncIterator, Iterable, Optional
+
+from .deadline import deadline_for
+
+logger = logging.getLogger(__name__)
+
+# Columnas de PersonalInfo en un CSV plano (customer_id + estos campos)
+PERSONAL_INFO_FIELDS = ("name", "id_number", "birth_date", "address", "phone", "email")
+REQUIRED_FIELDS = ("name", "id_number", "birth_date", "address", "phone")
+
+class LineTooLong(ValueError):
+    """Línea que supera KYC_BATCH_MAX_LINE_BYTES; se reporta como fila con error"""
+
+async def aiter_lines(chunks: AsyncIterator[bytes],
+                     max_line_bytes: Optional[int] = None) -> AsyncIterator[Any]:
+    """
+    Líneas de un cuerpo recibido por chunks, sin cargarlo completo en memoria. Los bytes
+    UTF-8 inválidos se reemplazan (U+FFFD) y una línea más larga que `max_line_bytes` se
+    descarta y se entrega como instancia de LineTooLong, sin abortar el resto del stream
+    """
+    if max_line_bytes is None:
+        max_line_bytes = int(os.getenv("KYC_BATCH_MAX_LINE_BYTES", "65536"))
+    buffer = bytearray()
+    skipping = False  # descartando el resto de una línea demasiado larga
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            if skipping:
+                skipping = False
+            elif len(buffer) + end - start > max_line_bytes:
+                buffer.clear()
+                yield LineTooLong(f"Línea de más de {max_line_bytes} bytes")
+            else:
+                buffer += chunk[start:end]
+                yield buffer.decode("utf-8", errors="replace").rstrip("\r")
+                buffer.clear()
+            start = end + 1
+        if skipping:
+            continue
+        buffer += chunk[start:]
+        if len(buffer) > max_line_bytes:
+            buffer.clear()
+            skipping = True
+            yield LineTooLong(f"Línea de más de {max_line_bytes} bytes")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace").rstrip("\r")
+
+async def aiter_sync(lines: Iterable[str]) -> AsyncIterator[str]:
+    """Adapta un iterable de líneas (p. ej. un archivo abierto) a iterador asíncrono"""
+    for line in lines:
+        yield line.rstrip("\r\n")
+
+async def parse_applicants(lines: AsyncIterator[Any], fmt: str = "jsonl") -> AsyncIterator[Dict[str, Any]]:
+    """
+    Filas crudas de un archivo JSONL o CSV (con encabezado). Las líneas que no se pueden
+    decodificar (o que aiter_lines entrega como error) se entregan como {"_error": ...}
+    para reportarlas sin detener el lote
+    """
+    header: Optional[List[str]] = None
+    async for line in lines:
+        if isinstance(line, Exception):
+            yield {"_error": str(line)}
+            continue
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            # Una fila por línea: no se admiten saltos de línea dentro de campos entrecomillados
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [column.strip() for column in values]
+                continue
+            yield dict(zip(header, values))
+        else:
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield {"_error": f"JSON inválido: {str(e)}"}
+
+def normalize_applicant(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Acepta el formato de KYCRequest ({"customer_id", "personal_info": {...}}) o una fila plana;
+    ValueError si faltan campos
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Cada línea debe ser un objeto JSON")
+    if "_error" in row:
+        raise ValueError(row["_error"])
+    customer_id = str(row.get("customer_id") or "").strip()
+    if not customer_id:
+        raise ValueError("Falta customer_id")
+
+    source = row.get("personal_info") if isinstance(row.get("personal_info"), dict) else row
+    personal_info = {field: source.get(field) for field in PERSONAL_INFO_FIELDS}
+    if not personal_info["email"]:
+        personal_info["email"] = None
+    missing = [field for field in REQUIRED_FIELDS if not personal_info[field]]
+    if missing:
+        raise ValueError(f"Campos faltantes: {', '.join(missing)}")
+    return {"customer_id": customer_id, "personal_info": personal_info}
+
+class KYCBatchProcessor:
+    """Ejecuta un lote de solicitantes por el orquestador con concurrencia acotada"""
+
+    def __init__(self, orchestrator):
+        self.orchestrator = orchestrator
+        self.default_concurrency = max(1, int(os.getenv("KYC_BATCH_CONCURRENCY", "8")))
+        self.max_concurrency = max(1, int(os.getenv("KYC_BATCH_MAX_CONCURRENCY", "32")))
+
+        self.metrics = {
+            "batches": 0,
+            "applicants": 0,
+            "completed": 0,
+            "errors": 0,
+            "in_flight": 0
+        }
+
+    def resolve_concurrency(self, requested: Optional[int] = None) -> int:
+        if not requested or requested < 1:
+            return self.default_concurrency
+        return min(requested, self.max_concurrency)
+
+    async def stream(self,
+                     rows: AsyncIterator[Dict[str, Any]],
+                     concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Resultados por solicitante en orden de terminación. Solo se leen filas nuevas
+        cuando se libera un lugar, así que la memoria depende de la concurrencia y no
+        del tamaño del archivo. Al final se emite {"summary": {...}}
+        """
+        concurrency = self.resolve_concurrency(concurrency)
+        self.metrics["batches"] += 1
+        started = time.monotonic()
+        summary = {"total": 0, "completed": 0, "approved": 0, "errors": 0, "statuses": {}}
+
+        rows = rows.__aiter__()
+        pending = set()
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < concurrency:
+                    try:
+                        row = await rows.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(self._process_one(index, row)))
+                    index += 1
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    item = task.result()
+                    summary["total"] += 1
+                    if item["ok"]:
+                        summary["completed"] += 1
+                        summary["approved"] += int(item["result"]["approved"])
+                        status = item["result"]["status"]
+                        summary["statuses"][status] = summary["statuses"].get(status, 0) + 1
+                    else:
+                        summary["errors"] += 1
+                    yield item
+        finally:
+            # Cliente desconectado o error de lectura: no dejar trabajos huérfanos. Cancelar
+            # el task cancela el pipeline del orquestador salvo que otra petición lo espere
+            for task in pending:
+                task.cancel()
+
+        summary["concurrency"] = concurrency
+        summary["elapsed"] = round(time.monotonic() - started, 3)
+        summary["throughput"] = round(summary["total"] / summary["elapsed"], 2) if summary["elapsed"] > 0 else 0
+        logger.info(
+            f"📦 Lote KYC terminado: {summary['total']} solicitantes, {summary['errors']} errores "
+            f"en {summary['elapsed']}s (concurrencia {concurrency})"
+        )
+        yield {"summary": summary}
+
+    async def _process_one(self, index: int, row: Dict[str, Any]) -> Dict[str, Any]:
+        self.metrics["applicants"] += 1
+        customer_id = row.get("customer_id") if isinstance(row, dict) else None
+        try:
+            applicant = normalize_applicant(row)
+            customer_id = applicant["customer_id"]
+        except ValueError as e:
+            self.metrics["errors"] += 1
+            return {"index": index, "customer_id": customer_id, "ok": False, "error": str(e)}
+
+        self.metrics["in_flight"] += 1
+        try:
+            # Mismo presupuesto que una petición individual a /kyc/process-simple
+            result = await self.orchestrator.process_kyc_application(
+                customer_id=customer_id,
+                documents=[],
+                personal_info=applicant["personal_info"],
+                deadline=deadline_for("process-simple"),
+                # Si el cliente se desconecta, cancelar también el pipeline compartido
+                cancel_on_abandon=True
+            )
+            self.metrics["completed"] += 1
+            return {"index": index, "customer_id": customer_id, "ok": True, "result": result}
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"❌ Lote KYC: error procesando {customer_id}: {str(e)}")
+            return {"index": index, "customer_id": customer_id, "ok": False, "error": str(e)}
+        finally:
+            self.metrics["in_flight"] -= 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "default_concurrency": self.default_concurrency,
+            "max_concurrency": self.max_concurrency,
+            **self.metrics
+        }
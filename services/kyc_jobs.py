@@ -0,0 +1,470 @@
+"""
+KYC Jobs
+Cola de trabajos KYC asíncronos: el cliente recibe un job id y un pool de workers ejecuta el pipeline
+"""
+
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import ipaddress
+from collections import deque
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Optional, Deque
+
+import aiohttp
+
+from .deadline import deadline_for
+
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+PENDING_JOB_STATES = (JOB_QUEUED, JOB_PROCESSING)
+
+class QueueFull(Exception):
+    """La cola alcanzó su profundidad máxima"""
+
+    def __init__(self, max_depth: int):
+        super().__init__(f"Cola KYC llena ({max_depth} trabajos pendientes)")
+        self.max_depth = max_depth
+
+class InvalidWebhookURL(Exception):
+    """webhook_url no permitido (esquema, host fuera de la allowlist o dirección interna)"""
+
+def _is_internal_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+            or ip.is_multicast or ip.is_unspecified)
+
+class KYCJob:
+    """Aplicación KYC encolada"""
+
+    def __init__(self,
+                 customer_id: str,
+                 documents: List[Dict[str, Any]],
+                 personal_info: Dict[str, Any],
+                 webhook_url: Optional[str] = None,
+                 job_id: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.customer_id = customer_id
+        self.documents = documents
+        self.personal_info = personal_info
+        self.webhook_url = webhook_url
+
+        self.status = JOB_QUEUED
+        self.attempts = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.webhook_status: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Vista pública del trabajo (sin el contenido de los documentos)"""
+        return {
+            "job_id": self.job_id,
+            "customer_id": self.customer_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "documents": len(self.documents),
+            "webhook_url": self.webhook_url,
+            "webhook_status": self.webhook_status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+class JobQueueBackend:
+    """
+    Contrato de una cola de trabajos con visibility timeout.
+
+    `reserve` entrega un trabajo y lo oculta durante `visibility_timeout`; si no se
+    confirma (`ack`) antes, vuelve a quedar visible para otro worker. Se corresponde
+    con una implementación Redis (LPUSH + BRPOPLPUSH a una lista de procesamiento
+    con un ZSET de vencimientos)
+    """
+
+    async def enqueue(self, job: KYCJob):
+        raise NotImplementedError
+
+    async def reserve(self, visibility_timeout: float, wait: float) -> Optional[KYCJob]:
+        raise NotImplementedError
+
+    async def ack(self, job: KYCJob):
+        raise NotImplementedError
+
+    async def release(self, job: KYCJob):
+        """Devuelve un trabajo reservado a la cola (reintento)"""
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[KYCJob]:
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    def in_flight(self) -> int:
+        raise NotImplementedError
+
+class InMemoryJobQueue(JobQueueBackend):
+    """Cola en memoria del proceso (se pierde al reiniciar)"""
+
+    def __init__(self, max_depth: int = 1000, retention: int = 10000):
+        self.max_depth = max(1, max_depth)
+        # Trabajos terminados que se conservan para consulta
+        self.retention = max(0, retention)
+
+        self._ready: Deque[str] = deque()
+        self._leases: Dict[str, float] = {}
+        self._jobs: Dict[str, KYCJob] = {}
+        self._finished: Deque[str] = deque()
+        self._available = asyncio.Condition()
+
+        self.metrics = {
+            "enqueued": 0,
+            "rejected_full": 0,
+            "reserved": 0,
+            "acked": 0,
+            "released": 0,
+            "visibility_expired": 0
+        }
+
+    async def enqueue(self, job: KYCJob):
+        async with self._available:
+            if self.depth() + self.in_flight() >= self.max_depth:
+                self.metrics["rejected_full"] += 1
+                raise QueueFull(self.max_depth)
+            self._jobs[job.job_id] = job
+            self._ready.append(job.job_id)
+            self.metrics["enqueued"] += 1
+            self._available.notify()
+
+    async def reserve(self, visibility_timeout: float, wait: float) -> Optional[KYCJob]:
+        async with self._available:
+            self._requeue_expired()
+            if not self._ready:
+                try:
+                    await asyncio.wait_for(self._available.wait_for(lambda: bool(self._ready)), timeout=wait)
+                except asyncio.TimeoutError:
+                    return None
+            while self._ready:
+                job = self._jobs.get(self._ready.popleft())
+                # Un trabajo reencolado por visibility timeout pudo terminar después en su worker original
+                if job is None or job.status not in PENDING_JOB_STATES:
+                    continue
+                self._leases[job.job_id] = time.monotonic() + visibility_timeout
+                self.metrics["reserved"] += 1
+                return job
+            return None
+
+    async def ack(self, job: KYCJob):
+        self._leases.pop(job.job_id, None)
+        self.metrics["acked"] += 1
+        self._finished.append(job.job_id)
+        while len(self._finished) > self.retention:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    async def release(self, job: KYCJob):
+        async with self._available:
+            if self._leases.pop(job.job_id, None) is not None:
+                self._ready.append(job.job_id)
+                self.metrics["released"] += 1
+                self._available.notify()
+
+    async def get(self, job_id: str) -> Optional[KYCJob]:
+        return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return len(self._ready)
+
+    def in_flight(self) -> int:
+        return len(self._leases)
+
+    def _requeue_expired(self):
+        """Los trabajos cuyo lease venció vuelven a la cola (el worker murió o se colgó)"""
+        now = time.monotonic()
+        for job_id, expires_at in list(self._leases.items()):
+            if expires_at <= now:
+                del self._leases[job_id]
+                self._ready.append(job_id)
+                self.metrics["visibility_expired"] += 1
+                logger.warning(f"⏰ Trabajo KYC {job_id} superó el visibility timeout, reencolado")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "max_depth": self.max_depth,
+            "depth": self.depth(),
+            "in_flight": self.in_flight(),
+            "retained_jobs": len(self._jobs),
+            **self.metrics
+        }
+
+JOB_BACKENDS = {
+    "memory": InMemoryJobQueue
+}
+
+def create_job_backend(name: str, max_depth: int) -> JobQueueBackend:
+    """Instancia el backend configurado (KYC_JOB_BACKEND)"""
+    backend = JOB_BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Backend de cola KYC no soportado: {name} (disponibles: {', '.join(JOB_BACKENDS)})")
+    return backend(max_depth=max_depth)
+
+class KYCJobManager:
+    """Pool de workers que consume la cola y ejecuta `process_kyc_application`"""
+
+    def __init__(self, orchestrator, backend: Optional[JobQueueBackend] = None):
+        self.orchestrator = orchestrator
+
+        # Configuración (variables de entorno)
+        self.workers = max(1, int(os.getenv("KYC_JOB_WORKERS", "4")))
+        self.max_depth = int(os.getenv("KYC_JOB_MAX_DEPTH", "1000"))
+        # El lease debe durar más que el presupuesto del pipeline (deadline de process-async) más un
+        # margen; si no, un trabajo aún en proceso vuelve a quedar visible y otro worker lo repite
+        self.job_budget = deadline_for("process-async").budget
+        min_visibility = self.job_budget + float(os.getenv("KYC_JOB_VISIBILITY_MARGIN", "60"))
+        configured_visibility = os.getenv("KYC_JOB_VISIBILITY_TIMEOUT")
+        self.visibility_timeout = float(configured_visibility) if configured_visibility else min_visibility
+        if self.visibility_timeout < min_visibility:
+            raise ValueError(
+                f"KYC_JOB_VISIBILITY_TIMEOUT ({self.visibility_timeout}s) debe ser al menos el deadline "
+                f"de process-async ({self.job_budget}s) más KYC_JOB_VISIBILITY_MARGIN ({min_visibility}s en total)"
+            )
+        self.max_attempts = max(1, int(os.getenv("KYC_JOB_MAX_ATTEMPTS", "3")))
+        self.webhook_timeout = float(os.getenv("KYC_JOB_WEBHOOK_TIMEOUT", "10"))
+        self.webhook_attempts = max(1, int(os.getenv("KYC_JOB_WEBHOOK_ATTEMPTS", "3")))
+        # Hosts permitidos para webhooks (vacío = cualquiera público); ".dominio.com" acepta subdominios
+        self.webhook_allowed_hosts = [
+            host.strip().lower()
+            for host in os.getenv("KYC_JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",")
+            if host.strip()
+        ]
+        self.shutdown_timeout = float(os.getenv("KYC_JOB_SHUTDOWN_TIMEOUT", "10"))
+
+        self.backend = backend or create_job_backend(os.getenv("KYC_JOB_BACKEND", "memory").lower(), self.max_depth)
+
+        # Último trabajo de cada cliente (para /kyc/status mientras no hay registro final)
+        self._latest_by_customer: Dict[str, str] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._webhook_tasks = set()
+        # Sesión propia: los webhooks no comparten pool, limitador ni breaker con Saptiva
+        self._webhook_session: Optional[aiohttp.ClientSession] = None
+
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "retried": 0,
+            "webhooks_sent": 0,
+            "webhook_errors": 0,
+            "busy_workers": 0
+        }
+
+    async def start(self):
+        """Lanza el pool de workers (idempotente)"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._worker(index)) for index in range(self.workers)]
+        logger.info(
+            f"📬 Cola KYC iniciada: {self.workers} workers, profundidad máx {self.max_depth}, "
+            f"visibility {self.visibility_timeout}s"
+        )
+
+    async def stop(self):
+        """
+        Detiene los workers; los trabajos reservados vuelven a quedar visibles al vencer su lease
+        
+        El pipeline corre en una tarea single-flight (shield) que sobrevive a la cancelación
+        del worker: se espera hasta KYC_JOB_SHUTDOWN_TIMEOUT y luego se cancela, para que
+        no llame a Saptiva ni guarde registros después de cerrar la base de datos y el pool HTTP.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.orchestrator.single_flight.drain(self.shutdown_timeout)
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        if self._webhook_session is not None:
+            await self._webhook_session.close()
+            self._webhook_session = None
+        self._tasks = []
+        logger.info("📬 Cola KYC detenida")
+
+    async def submit(self,
+                     customer_id: str,
+                     documents: List[Dict[str, Any]],
+                     personal_info: Dict[str, Any],
+                     webhook_url: Optional[str] = None) -> KYCJob:
+        """
+        Encola una aplicación y devuelve el trabajo de inmediato
+        (QueueFull si no cabe, InvalidWebhookURL si el webhook no está permitido)
+        """
+        if webhook_url:
+            await self.validate_webhook_url(webhook_url)
+        job = KYCJob(customer_id, documents, personal_info, webhook_url)
+        await self.backend.enqueue(job)
+        self._latest_by_customer[customer_id] = job.job_id
+        self.metrics["submitted"] += 1
+        logger.info(f"📥 KYC encolado para {customer_id}: job {job.job_id} (profundidad {self.backend.depth()})")
+        return job
+
+    async def validate_webhook_url(self, url: str):
+        """
+        Solo https, host en la allowlist (si hay) y que no resuelva a direcciones internas
+        (privadas, loopback, link-local, reservadas): evita usar el webhook para SSRF
+        """
+        parts = urlsplit(url)
+        if parts.scheme != "https":
+            raise InvalidWebhookURL("webhook_url debe usar https")
+        host = (parts.hostname or "").lower()
+        if not host:
+            raise InvalidWebhookURL("webhook_url sin host")
+        if self.webhook_allowed_hosts and not any(
+            host == allowed or (allowed.startswith(".") and host.endswith(allowed))
+            for allowed in self.webhook_allowed_hosts
+        ):
+            raise InvalidWebhookURL(f"Host de webhook no permitido: {host}")
+
+        try:
+            port = parts.port or 443
+        except ValueError:
+            raise InvalidWebhookURL("Puerto de webhook inválido")
+        try:
+            addresses = [ipaddress.ip_address(host)]
+        except ValueError:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            except socket.gaierror:
+                raise InvalidWebhookURL(f"No se pudo resolver el host del webhook: {host}")
+            addresses = [info[4][0] for info in infos]
+        if not addresses or any(_is_internal_address(str(address)) for address in addresses):
+            raise InvalidWebhookURL(f"El webhook apunta a una dirección interna: {host}")
+
+    async def get_job(self, job_id: str) -> Optional[KYCJob]:
+        return await self.backend.get(job_id)
+
+    async def get_pending_job(self, customer_id: str) -> Optional[KYCJob]:
+        """Trabajo en cola o en proceso del cliente, si lo hay"""
+        job_id = self._latest_by_customer.get(customer_id)
+        if job_id is None:
+            return None
+        job = await self.backend.get(job_id)
+        if job is None or job.status not in PENDING_JOB_STATES:
+            return None
+        return job
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job = await self.backend.reserve(self.visibility_timeout, wait=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Worker KYC {index}: error reservando trabajo: {str(e)}")
+                await asyncio.sleep(1.0)
+                continue
+            if job is None:
+                continue
+            self.metrics["busy_workers"] += 1
+            try:
+                await self._run_job(job)
+            finally:
+                self.metrics["busy_workers"] -= 1
+
+    async def _run_job(self, job: KYCJob):
+        job.status = JOB_PROCESSING
+        job.attempts += 1
+        job.started_at = time.time()
+        try:
+            # Sin cliente HTTP esperando: el presupuesto es el del modo asíncrono
+            job.result = await self.orchestrator.process_kyc_application(
+                customer_id=job.customer_id,
+                documents=job.documents,
+                personal_info=job.personal_info,
+                deadline=deadline_for("process-async")
+            )
+            job.status = JOB_COMPLETED
+            job.error = None
+            self.metrics["completed"] += 1
+        except asyncio.CancelledError:
+            # Apagado: el trabajo vuelve a la cola
+            job.status = JOB_QUEUED
+            await self.backend.release(job)
+            raise
+        except Exception as e:
+            job.error = str(e)
+            if job.attempts < self.max_attempts:
+                logger.warning(f"🔁 Trabajo KYC {job.job_id} falló (intento {job.attempts}), reencolando: {str(e)}")
+                job.status = JOB_QUEUED
+                self.metrics["retried"] += 1
+                await self.backend.release(job)
+                return
+            logger.error(f"❌ Trabajo KYC {job.job_id} falló tras {job.attempts} intentos: {str(e)}")
+            job.status = JOB_FAILED
+            self.metrics["failed"] += 1
+
+        job.finished_at = time.time()
+        # Documentos ya procesados: no retener su contenido mientras el trabajo siga consultable
+        job.documents = []
+        await self.backend.ack(job)
+        if job.webhook_url:
+            # La entrega (con reintentos) no ocupa al worker
+            task = asyncio.ensure_future(self._notify_webhook(job))
+            self._webhook_tasks.add(task)
+            task.add_done_callback(self._webhook_tasks.discard)
+
+    async def _notify_webhook(self, job: KYCJob):
+        """POST del resultado al webhook del cliente (reintentos con backoff)"""
+        payload = job.to_dict()
+        try:
+            # Se revalida al entregar: el DNS pudo cambiar desde que se encoló
+            await self.validate_webhook_url(job.webhook_url)
+        except InvalidWebhookURL as e:
+            job.webhook_status = f"rejected: {str(e)}"
+            self.metrics["webhook_errors"] += 1
+            logger.warning(f"⚠️ Webhook de trabajo KYC {job.job_id} rechazado: {str(e)}")
+            return
+        if self._webhook_session is None or self._webhook_session.closed:
+            self._webhook_session = aiohttp.ClientSession()
+        session = self._webhook_session
+        for attempt in range(1, self.webhook_attempts + 1):
+            try:
+                async with session.post(
+                    job.webhook_url,
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=self.webhook_timeout),
+                    allow_redirects=False
+                ) as response:
+                    if response.status < 400:
+                        job.webhook_status = f"delivered ({response.status})"
+                        self.metrics["webhooks_sent"] += 1
+                        return
+                    job.webhook_status = f"HTTP {response.status}"
+            except Exception as e:
+                job.webhook_status = f"error: {str(e) or type(e).__name__}"
+            if attempt < self.webhook_attempts:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        self.metrics["webhook_errors"] += 1
+        logger.warning(f"⚠️ Webhook de trabajo KYC {job.job_id} no entregado: {job.webhook_status}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": bool(self._tasks),
+            "visibility_timeout": self.visibility_timeout,
+            "job_budget": self.job_budget,
+            "max_attempts": self.max_attempts,
+            "queue": self.backend.get_metrics() if hasattr(self.backend, "get_metrics") else {},
+            **self.metrics
+        }
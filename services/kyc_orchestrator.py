@@ -1,78 +1,208 @@
+import os
+import time
 import asyncio
+import hashlib
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple, Optional
+from .kyc_pipeline import KYCPipeline
+from .deadline import Deadline, current_deadline, deadline_scope
+from .metrics import metrics_registry
+from .single_flight import SingleFlight, request_key
 from .saptiva_service import SaptivaService
 from .validation_service import ValidationService
 from .database_service import DatabaseService
 
 logger = logging.getLogger(__name__)
 
+# Modelo Saptiva y max_tokens que usa cada paso del pipeline
+STEP_MODELS = {
+    "documents": ("Saptiva OCR", 200),
+    "identity": ("Saptiva Guard", 150),
+    "credit": ("Saptiva Ops", 200),
+    "risk": ("Saptiva KAL", 150)
+}
+
+# Histogramas de latencia por paso y del pipeline completo
+STEP_DURATION = metrics_registry.histogram(
+    "kyc_step_duration_seconds",
+    "Duración de cada paso del pipeline KYC",
+    ("step",)
+)
+PIPELINE_DURATION = metrics_registry.histogram(
+    "kyc_pipeline_duration_seconds",
+    "Duración total del proceso KYC",
+    ("status",)
+)
+
+# Pasos con checkpoint: los que llaman a Saptiva (la validación local se repite siempre)
+CHECKPOINT_STEPS = set(STEP_MODELS)
+
+# Estado guardado según la política fail-fast
+FAIL_FAST_STATUS = {
+    "reject": "rejected",
+    "park": "manual_review"
+}
+
 class KYCOrchestrator:
     """Orquestador principal del flujo KYC"""
     
-    def __init__(self):
+    def __init__(self, db_service: Optional[DatabaseService] = None):
         self.saptiva_service = SaptivaService()
         self.validation_service = ValidationService()
-        self.db_service = DatabaseService()
+        # Instancia compartida con la API (/kyc/stats y /kyc/search ven lo que guarda el pipeline)
+        self.db_service = db_service or DatabaseService()
+        
+        # Envíos duplicados en vuelo para el mismo cliente ejecutan el pipeline una vez
+        self.single_flight = SingleFlight(
+            "kyc", deadline_slack=float(os.getenv("KYC_SINGLE_FLIGHT_DEADLINE_SLACK", "1.0"))
+        )
+        
+        # Concurrencia del pipeline y del fan-out de OCR
+        self.max_parallel_steps = int(os.getenv("KYC_MAX_PARALLEL_STEPS", "4"))
+        self.ocr_concurrency = max(1, int(os.getenv("KYC_OCR_CONCURRENCY", "4")))
+        
+        # Política fail-fast tras la validación local: off | reject | park
+        self.fail_fast_policy = os.getenv("KYC_FAIL_FAST_POLICY", "off").lower()
+        self.fail_fast_checks = {
+            check.strip()
+            for check in os.getenv("KYC_FAIL_FAST_CHECKS", "curp,rfc,age").split(",")
+            if check.strip()
+        }
+        
+        # Al agotarse el deadline: park = omitir pasos pendientes y enviar a revisión manual
+        # | degrade = continuar con respuestas simuladas de Saptiva
+        self.deadline_policy = os.getenv("KYC_DEADLINE_POLICY", "park").lower()
+        
+        # Checkpoints por paso: auto = reanudar siempre que existan | explicit = solo con resume=True
+        # | off = sin checkpoints
+        self.resume_mode = os.getenv("KYC_RESUME_MODE", "auto").lower()
+        self.checkpoint_ttl = float(os.getenv("KYC_CHECKPOINT_TTL", "3600"))
     
     async def process_kyc_application(self, 
                                     customer_id: str,
                                     documents: List[Dict[str, Any]],
-                                    personal_info: Dict[str, Any]) -> Dict[str, Any]:
+                                    personal_info: Dict[str, Any],
+                                    deadline: Optional[Deadline] = None,
+                                    resume: Optional[bool] = None,
+                                    cancel_on_abandon: bool = False) -> Dict[str, Any]:
+        """
+        Procesa una aplicación KYC completa dentro del presupuesto de tiempo de la petición.
+        `resume` reutiliza los pasos ya completados de un intento anterior (None = KYC_RESUME_MODE).
+        Con `cancel_on_abandon`, el pipeline se cancela si todos los que lo esperan se cancelan
+        """
+        deadline = deadline or current_deadline()
+        if resume is None:
+            resume = self.resume_mode == "auto"
+        # Solo se comparten envíos idénticos: mismo cliente, mismos datos y mismo modo de reanudación
+        flight_key = request_key("kyc", customer_id, self._application_fingerprint(documents, personal_info), resume)
+        return await self.single_flight.do(
+            flight_key,
+            lambda: self._process_within_deadline(customer_id, documents, personal_info, deadline, resume),
+            deadline=deadline,
+            cancel_on_abandon=cancel_on_abandon
+        )
+    
+    async def _process_within_deadline(self,
+                                       customer_id: str,
+                                       documents: List[Dict[str, Any]],
+                                       personal_info: Dict[str, Any],
+                                       deadline: Optional[Deadline],
+                                       resume: bool = False) -> Dict[str, Any]:
         """
-        Procesa una aplicación KYC completa
+        Activa el deadline para todas las llamadas a Saptiva del pipeline
         """
+        with deadline_scope(deadline):
+            return await self._process_kyc_application(customer_id, documents, personal_info, deadline, resume)
+    
+    async def _process_kyc_application(self,
+                                       customer_id: str,
+                                       documents: List[Dict[str, Any]],
+                                       personal_info: Dict[str, Any],
+                                       deadline: Optional[Deadline] = None,
+                                       resume: bool = False) -> Dict[str, Any]:
+        """
+        Ejecuta el pipeline KYC completo para un cliente
+        """
+        started = time.monotonic()
+        checkpointing = self.resume_mode != "off"
+        fingerprint = self._application_fingerprint(documents, personal_info)
         try:
             logger.info(f"Iniciando proceso KYC para cliente: {customer_id}")
             logger.info(f"Documentos recibidos: {len(documents)}")
             
-            # Paso 1: Extraer datos de documentos
-            document_results = []
-            for doc in documents:
-                logger.info(f"Procesando documento: {doc.get('type', 'unknown')}")
-                result = await self.saptiva_service.extract_document_data(
-                    doc["content"], 
-                    doc["type"]
-                )
-                document_results.append(result)
+            # Pasos 1-5 como grafo de dependencias:
+            # documentos -> (validación | identidad | buró en paralelo) -> riesgo
+            # Con fail-fast, identidad y buró esperan a la validación local
+            fail_fast = self.fail_fast_policy in FAIL_FAST_STATUS
+            ai_dependencies = ["documents", "validation"] if fail_fast else ["documents"]
             
-            logger.info(f"Documentos procesados: {len(document_results)}")
+            restored = {}
+            if checkpointing and resume:
+                restored = await self.db_service.get_step_checkpoints(customer_id, fingerprint, self.checkpoint_ttl)
+                restored = {step: result for step, result in restored.items() if step in CHECKPOINT_STEPS}
+                if restored:
+                    logger.info(f"⏩ Reanudando KYC para {customer_id}: {', '.join(sorted(restored))} ya completados")
             
-            # Paso 2: Validar información personal
-            logger.info("Iniciando validación de información personal")
-            validation_result = await self.validation_service.validate_personal_info(
-                personal_info, 
-                document_results
+            async def checkpoint(step: str, result: Any):
+                if step in CHECKPOINT_STEPS:
+                    await self.db_service.save_step_checkpoint(customer_id, fingerprint, step, result)
+            
+            pipeline = KYCPipeline(
+                max_concurrency=self.max_parallel_steps,
+                deadline=deadline if self.deadline_policy == "park" else None,
+                checkpoint=checkpoint if checkpointing else None,
+                restored=restored
+            )
+            pipeline.add_step(
+                "documents",
+                lambda results: self._extract_documents(documents)
+            )
+            pipeline.add_step(
+                "validation",
+                lambda results: self._validate_personal_info(
+                    pipeline,
+                    personal_info,
+                    results["documents"]
+                ),
+                depends_on=["documents"]
+            )
+            pipeline.add_step(
+                "identity",
+                lambda results: self._verify_identity(results["documents"], personal_info),
+                depends_on=ai_dependencies
             )
-            logger.info("Validación de información personal completada")
-            
-            # Paso 3: Verificación de identidad y listas de sanciones
-            # Si no hay documentos, usar la información personal directamente
-            logger.info("Preparando datos para verificación de identidad")
-            if document_results:
-                logger.info("Usando datos de documentos extraídos")
-                identity_data = document_results[0]["extracted_fields"]
-                id_number = document_results[0]["extracted_fields"]["id_number"]
-            else:
-                logger.info("Usando información personal directamente")
-                identity_data = personal_info
-                id_number = personal_info.get("id_number", "")
-            
-            logger.info(f"Verificando identidad para ID: {id_number}")
-            identity_result = await self.saptiva_service.validate_identity(identity_data)
-            logger.info("Verificación de identidad completada")
-            
-            # Paso 4: Consulta buró de crédito
-            credit_result = await self.saptiva_service.check_credit_bureau(id_number)
-            
-            # Paso 5: Evaluación de riesgo final
-            risk_assessment = await self.saptiva_service.calculate_risk_assessment(
-                identity_result,
-                credit_result,
-                personal_info
+            pipeline.add_step(
+                "credit",
+                lambda results: self.saptiva_service.check_credit_bureau(
+                    self._identity_inputs(results["documents"], personal_info)[1]
+                ),
+                depends_on=ai_dependencies
             )
+            pipeline.add_step(
+                "risk",
+                lambda results: self.saptiva_service.calculate_risk_assessment(
+                    results["identity"],
+                    results["credit"],
+                    personal_info
+                ),
+                depends_on=["identity", "credit"]
+            )
+            
+            step_results = await pipeline.run()
+            
+            if pipeline.halt_reason is not None:
+                return await self._short_circuit_application(
+                    customer_id, step_results, pipeline, started, deadline, personal_info
+                )
+            
+            document_results = step_results["documents"]
+            identity_result = step_results["identity"]
+            credit_result = step_results["credit"]
+            risk_assessment = step_results["risk"]
+            logger.info("Pipeline KYC completado")
             
             # Paso 6: Guardar resultados en base de datos
+            step_timings = self._round_timings(pipeline.timings)
             kyc_record = {
                 "customer_id": customer_id,
                 "status": "completed",
@@ -81,14 +211,17 @@ class KYCOrchestrator:
                 "credit_check": credit_result,
                 "risk_assessment": risk_assessment,
                 "approved": risk_assessment["approved"],
-                "processing_time": (
-                    sum(doc.get("processing_time", 0) for doc in document_results) +
-                    identity_result.get("validation_time", 0) +
-                    credit_result.get("bureau_response_time", 0)
-                )
+                "processing_time": time.monotonic() - started,
+                "step_timings": step_timings
             }
             
+            persist_started = time.monotonic()
             await self.db_service.save_kyc_record(kyc_record)
+            if checkpointing:
+                await self.db_service.clear_step_checkpoints(customer_id)
+            pipeline.timings["persist"] = time.monotonic() - persist_started
+            processing_time = time.monotonic() - started
+            self._observe_timings(pipeline.timings, "completed", processing_time)
             
             # Respuesta final
             response = {
@@ -97,14 +230,19 @@ class KYCOrchestrator:
                 "verification_score": risk_assessment["final_score"],
                 "risk_level": risk_assessment["risk_level"],
                 "approved": risk_assessment["approved"],
-                "processing_time": kyc_record["processing_time"],
+                "processing_time": processing_time,
                 "details": {
                     "documents_processed": len(document_results),
                     "identity_verified": identity_result["identity_verified"],
                     "credit_score": credit_result["credit_score"],
-                    "sanctions_clear": identity_result["sanctions_check"] == "clear"
+                    "sanctions_clear": identity_result["sanctions_check"] == "clear",
+                    "step_timings": self._round_timings(pipeline.timings)
                 }
             }
+            if deadline is not None:
+                response["details"]["deadline"] = deadline.to_dict()
+            if pipeline.resumed:
+                response["details"]["resumed_steps"] = pipeline.resumed
             
             logger.info(f"KYC completado para {customer_id}: {response['status']}")
             return response
@@ -113,6 +251,7 @@ class KYCOrchestrator:
             import traceback
             logger.error(f"Error procesando KYC para {customer_id}: {str(e)}")
             logger.error(f"Traceback completo: {traceback.format_exc()}")
+            PIPELINE_DURATION.observe(time.monotonic() - started, status="error")
             
             # Guardar error en base de datos
             error_record = {
@@ -121,25 +260,231 @@ class KYCOrchestrator:
                 "error_message": str(e),
                 "approved": False
             }
+            if checkpointing:
+                # Pasos que un reintento no volverá a ejecutar
+                error_record["checkpointed_steps"] = sorted(
+                    await self.db_service.get_step_checkpoints(customer_id, fingerprint, self.checkpoint_ttl)
+                )
             await self.db_service.save_kyc_record(error_record)
             
             raise
     
+    def _application_fingerprint(self,
+                                 documents: List[Dict[str, Any]],
+                                 personal_info: Dict[str, Any]) -> str:
+        """
+        Huella de los datos de la aplicación: un checkpoint solo se reutiliza con los mismos datos
+        """
+        document_hashes = [
+            (doc.get("type"), hashlib.sha256(doc.get("content") or b"").hexdigest())
+            for doc in documents
+        ]
+        return request_key(personal_info, document_hashes)
+    
+    async def _extract_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Extrae datos de todos los documentos en paralelo (acotado por semáforo)
+        """
+        semaphore = asyncio.Semaphore(self.ocr_concurrency)
+        
+        async def extract(doc: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                logger.info(f"Procesando documento: {doc.get('type', 'unknown')}")
+                return await self.saptiva_service.extract_document_data(
+                    doc["content"],
+                    doc["type"]
+                )
+        
+        # gather conserva el orden de los documentos
+        document_results = await asyncio.gather(*(extract(doc) for doc in documents))
+        logger.info(f"Documentos procesados: {len(document_results)}")
+        return list(document_results)
+    
+    async def _validate_personal_info(self,
+                                      pipeline: KYCPipeline,
+                                      personal_info: Dict[str, Any],
+                                      document_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Validación local; con fail-fast detiene el pipeline antes de los pasos de IA
+        """
+        logger.info("Iniciando validación de información personal")
+        validation_result = await self.validation_service.validate_personal_info(
+            personal_info,
+            document_results
+        )
+        logger.info("Validación de información personal completada")
+        
+        blocking_checks = [
+            check for check in validation_result.get("failed_checks", [])
+            if check in self.fail_fast_checks
+        ]
+        if self.fail_fast_policy in FAIL_FAST_STATUS and blocking_checks:
+            pipeline.halt(f"Validación local fallida: {', '.join(blocking_checks)}")
+        
+        return validation_result
+    
+    def _round_timings(self, timings: Dict[str, float]) -> Dict[str, float]:
+        """Duraciones por paso en segundos, redondeadas para el registro"""
+        return {step: round(duration, 4) for step, duration in timings.items()}
+    
+    def _observe_timings(self, timings: Dict[str, float], status: str, total: float):
+        """Alimenta los histogramas de latencia por paso y total"""
+        for step, duration in timings.items():
+            STEP_DURATION.observe(duration, step=step)
+        PIPELINE_DURATION.observe(total, status=status)
+    
+    def _estimate_skipped_savings(self,
+                                  skipped_steps: List[str],
+                                  identity_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Estima latencia y costo evitados por los pasos de IA omitidos. Guard y KAL solo se
+        habrían llamado si la cascada escalaba: identidad se decide con el mismo screening
+        local; riesgo (depende del buró) se pondera con la tasa de escalamiento observada
+        """
+        cascade = self.saptiva_service.cascade
+        call_probability = {"risk": cascade.escalation_probability("risk")}
+        if identity_data is not None:
+            screening = self.saptiva_service._screen_identity(identity_data)
+            call_probability["identity"] = 1.0 if cascade.would_escalate("identity", screening["score"]) else 0.0
+        
+        estimates = {}
+        for step in skipped_steps:
+            probability = call_probability.get(step, 1.0)
+            if step not in STEP_MODELS or probability <= 0:
+                continue
+            estimate = self.saptiva_service.estimate_model_call(*STEP_MODELS[step])
+            estimates[step] = {
+                "latency": estimate["latency"] * probability,
+                "cost": estimate["cost"] * probability,
+                "calls": probability
+            }
+        
+        # Identidad y buró corren en paralelo; riesgo va después
+        parallel_latency = max(
+            (estimates[step]["latency"] for step in ("identity", "credit") if step in estimates),
+            default=0
+        )
+        latency_saved = parallel_latency + estimates.get("risk", {}).get("latency", 0)
+        
+        return {
+            "llm_calls_avoided": round(sum(e["calls"] for e in estimates.values()), 2),
+            "estimated_latency_saved": round(latency_saved, 3),
+            "estimated_cost_saved": round(sum(e["cost"] for e in estimates.values()), 6),
+            "models_skipped": [STEP_MODELS[step][0] for step in estimates]
+        }
+    
+    async def _short_circuit_application(self,
+                                         customer_id: str,
+                                         step_results: Dict[str, Any],
+                                         pipeline: KYCPipeline,
+                                         started: float,
+                                         deadline: Optional[Deadline] = None,
+                                         personal_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Rechaza o estaciona una aplicación que falló la validación local
+        o que agotó su presupuesto de tiempo
+        """
+        document_results = step_results.get("documents", [])
+        validation_result = step_results.get("validation", {})
+        if pipeline.deadline_exceeded:
+            # Sin datos suficientes para decidir: revisión manual, nunca rechazo automático
+            status = "manual_review"
+            risk_level = "unknown"
+        else:
+            status = FAIL_FAST_STATUS[self.fail_fast_policy]
+            risk_level = "high"
+        identity_data = self._identity_inputs(document_results, personal_info or {})[0]
+        savings = self._estimate_skipped_savings(pipeline.skipped, identity_data)
+        
+        kyc_record = {
+            "customer_id": customer_id,
+            "status": status,
+            "documents": document_results,
+            "validation": validation_result,
+            "approved": False,
+            "decision_reason": pipeline.halt_reason,
+            "skipped_steps": pipeline.skipped,
+            "processing_time": time.monotonic() - started,
+            "step_timings": self._round_timings(pipeline.timings)
+        }
+        
+        persist_started = time.monotonic()
+        await self.db_service.save_kyc_record(kyc_record)
+        if pipeline.checkpoint is not None and not pipeline.deadline_exceeded:
+            # Rechazo/estacionamiento por validación: decisión final, no hay nada que reanudar
+            await self.db_service.clear_step_checkpoints(customer_id)
+        pipeline.timings["persist"] = time.monotonic() - persist_started
+        processing_time = time.monotonic() - started
+        self._observe_timings(pipeline.timings, status, processing_time)
+        
+        logger.info(
+            f"⏹️ KYC {status} para {customer_id}: {pipeline.halt_reason} "
+            f"(ahorro ~{savings['estimated_latency_saved']}s, ${savings['estimated_cost_saved']})"
+        )
+        
+        details = {
+            "documents_processed": len(document_results),
+            "fail_fast_policy": self.fail_fast_policy,
+            "decision_reason": pipeline.halt_reason,
+            "validation_errors": validation_result.get("errors", []),
+            "failed_checks": validation_result.get("failed_checks", []),
+            "skipped_steps": pipeline.skipped,
+            "savings": savings,
+            "step_timings": self._round_timings(pipeline.timings)
+        }
+        if deadline is not None:
+            details["deadline"] = deadline.to_dict()
+        if pipeline.resumed:
+            details["resumed_steps"] = pipeline.resumed
+        
+        return {
+            "status": status,
+            "customer_id": customer_id,
+            "verification_score": 0.0,
+            "risk_level": risk_level,
+            "approved": False,
+            "processing_time": processing_time,
+            "details": details
+        }
+    
+    def _identity_inputs(self,
+                         document_results: List[Dict[str, Any]],
+                         personal_info: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """
+        Datos de identidad e ID a verificar: documento principal o información personal
+        """
+        if document_results:
+            identity_data = document_results[0]["extracted_fields"]
+            return identity_data, identity_data["id_number"]
+        return personal_info, personal_info.get("id_number", "")
+    
+    async def _verify_identity(self,
+                               document_results: List[Dict[str, Any]],
+                               personal_info: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Verificación de identidad y listas de sanciones
+        """
+        identity_data, id_number = self._identity_inputs(document_results, personal_info)
+        logger.info(f"Verificando identidad para ID: {id_number}")
+        identity_result = await self.saptiva_service.validate_identity(identity_data)
+        logger.info("Verificación de identidad completada")
+        return identity_result
+    
     async def get_kyc_status(self, customer_id: str) -> Dict[str, Any]:
         """
-        Obtiene el estado actual de un proceso KYC
+        Obtiene el estado actual de un proceso KYC (solo la fila caliente, sin decodificar el registro completo)
         """
         try:
-            record = await self.db_service.get_kyc_record(customer_id)
-            if not record:
+            row = await self.db_service.get_kyc_row(customer_id)
+            if row is None:
                 return {"status": "not_found", "customer_id": customer_id}
             
             return {
-                "status": record["status"],
+                "status": row.status,
                 "customer_id": customer_id,
-                "approved": record.get("approved", False),
-                "risk_level": record.get("risk_assessment", {}).get("risk_level", "unknown"),
-                "last_updated": record.get("created_at")
+                "approved": row.approved,
+                "risk_level": row.risk_level or "unknown",
+                "last_updated": row.created_at
             }
             
         except Exception as e:
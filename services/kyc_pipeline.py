@@ -0,0 +1,131 @@
+"""
+KYC Pipeline
+Ejecuta los pasos KYC como grafo de dependencias: los pasos independientes corren en paralelo
+"""
+
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+StepFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+CheckpointFunc = Callable[[str, Any], Awaitable[Any]]
+
+class KYCPipeline:
+    """Grafo de dependencias de pasos KYC con concurrencia acotada"""
+
+    def __init__(self,
+                 max_concurrency: int = 4,
+                 deadline=None,
+                 checkpoint: Optional[CheckpointFunc] = None,
+                 restored: Optional[Dict[str, Any]] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.deadline = deadline  # Deadline opcional: al agotarse, los pasos pendientes se omiten
+        self.checkpoint = checkpoint  # checkpoint(paso, resultado) tras cada paso completado
+        self.restored = dict(restored or {})  # resultados de una ejecución anterior: no se repiten
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.halt_reason = None
+        self.deadline_exceeded = False
+        self.skipped: List[str] = []
+        self.resumed: List[str] = []
+        self.timings: Dict[str, float] = {}  # paso -> duración en segundos (reloj monotónico)
+
+    def add_step(self, name: str, func: StepFunc, depends_on: List[str] = None) -> "KYCPipeline":
+        """
+        Registra un paso. `func` recibe el dict de resultados de los pasos ya completados
+        """
+        if name in self.steps:
+            raise ValueError(f"Paso duplicado en pipeline: {name}")
+        self.steps[name] = {"func": func, "depends_on": list(depends_on or [])}
+        return self
+
+    def halt(self, reason: str):
+        """
+        Detiene el pipeline: los pasos que aún no arrancan se omiten
+        """
+        if self.halt_reason is None:
+            self.halt_reason = reason
+            logger.info(f"⏹️ Pipeline KYC detenido: {reason}")
+
+    def _topological_order(self) -> List[str]:
+        """Orden topológico de los pasos (valida dependencias y ciclos)"""
+        order = []
+        state = {}  # name -> "visiting" | "done"
+
+        def visit(name: str):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Ciclo de dependencias en pipeline: {name}")
+            if name not in self.steps:
+                raise ValueError(f"Dependencia desconocida en pipeline: {name}")
+            state[name] = "visiting"
+            for dep in self.steps[name]["depends_on"]:
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.steps:
+            visit(name)
+        return order
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Ejecuta el grafo: cada paso arranca en cuanto sus dependencias terminan
+        """
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_step(name: str):
+            step = self.steps[name]
+            if step["depends_on"]:
+                await asyncio.gather(*(tasks[dep] for dep in step["depends_on"]))
+            if name in self.restored:
+                logger.info(f"⏩ Pipeline KYC: paso {name} recuperado del checkpoint")
+                results[name] = self.restored[name]
+                self.resumed.append(name)
+                return results[name]
+            async with semaphore:
+                if self.halt_reason is None and self.deadline is not None and self.deadline.expired:
+                    self.deadline_exceeded = True
+                    self.halt(f"Presupuesto de tiempo agotado antes del paso {name}")
+                if self.halt_reason is not None:
+                    self.skipped.append(name)
+                    return None
+                logger.info(f"▶️ Pipeline KYC: ejecutando paso {name}")
+                started = time.monotonic()
+                try:
+                    results[name] = await step["func"](results)
+                except Exception as e:
+                    self.halt(f"Paso {name} falló: {str(e)}")
+                    raise
+                self.timings[name] = time.monotonic() - started
+            if self.checkpoint is not None:
+                await self.checkpoint(name, results[name])
+            return results[name]
+
+        for name in self._topological_order():
+            tasks[name] = asyncio.ensure_future(run_step(name))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except Exception:
+            # Si un paso falla, los que no han arrancado se omiten (halt). Con checkpoints,
+            # los que ya están en curso terminan y se guardan: un reintento no los vuelve a pagar
+            if self.checkpoint is None:
+                for task in tasks.values():
+                    if not task.done():
+                        task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        except BaseException:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        return results
@@ -0,0 +1,151 @@
+"""
+Métricas del servicio KYC
+Registro en memoria con exposición en formato de texto Prometheus (sin dependencias externas)
+"""
+
+import bisect
+import threading
+from typing import Dict, Any, List, Tuple
+
+# Buckets por defecto (segundos) pensados para llamadas a LLM
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape_label_value(value: Any) -> str:
+    """Escapes del formato de texto Prometheus para valores de etiqueta: \\, \" y salto de línea"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _escape_help(text: str) -> str:
+    """En HELP solo se escapan \\ y el salto de línea"""
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs += list(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+class Histogram:
+    """Histograma acumulativo con etiquetas"""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Registra una observación"""
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape_help(self.description)}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, {"le": repr(float(bound))})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = _format_labels(self.label_names, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Resumen en JSON: conteo y promedio por serie"""
+        with self._lock:
+            return {
+                ",".join(key) or "all": {
+                    "count": series["count"],
+                    "avg": series["sum"] / series["count"] if series["count"] else 0
+                }
+                for key, series in self._series.items()
+            }
+
+class Gauge:
+    """Valor instantáneo con etiquetas (umbrales, tasas); `kind="counter"` para acumulados"""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...] = (), kind: str = "gauge"):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.kind = kind
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape_help(self.description)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {",".join(key) or "all": value for key, value in self._values.items()}
+
+class MetricsRegistry:
+    """Registro de métricas del proceso"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        """Obtiene (o crea) un histograma por nombre"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description, label_names, buckets)
+            return self._metrics[name]
+
+    def gauge(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        """Obtiene (o crea) un gauge por nombre"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, description, label_names)
+            return self._metrics[name]
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        """Obtiene (o crea) un contador por nombre"""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, description, label_names, kind="counter")
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """Exposición en formato de texto Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics_registry = MetricsRegistry()
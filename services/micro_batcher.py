@@ -0,0 +1,118 @@
+"""
+Micro-batcher
+Junta peticiones concurrentes durante unos milisegundos (o hasta un tope) y las envía en un solo lote
+"""
+
+import asyncio
+import logging
+import contextvars
+from typing import Dict, Any, List, Callable, Awaitable, Optional, Tuple
+
+from .deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+BatchFunc = Callable[[List[Any]], Awaitable[List[Any]]]
+
+class MicroBatcher:
+    """Agrupa `submit(item)` concurrentes en llamadas `flush_func(items)`"""
+
+    def __init__(self, name: str, flush_func: BatchFunc, max_batch_size: int = 32, max_wait: float = 0.005):
+        self.name = name
+        self.flush_func = flush_func
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+
+        # (elemento, future, deadline del llamador)
+        self._pending: List[Tuple[Any, asyncio.Future, Optional[Deadline]]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.metrics = {
+            "items": 0,
+            "batches": 0,
+            "max_batch_size_seen": 0,
+            "flushes_by_size": 0,
+            "flushes_by_timer": 0,
+            "errors": 0,
+            "caller_deadline_exceeded": 0
+        }
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Encola un elemento y espera su resultado dentro del lote
+        
+        Cada llamador espera como mucho lo que le queda de su propio deadline;
+        el lote sigue en curso para los demás.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        deadline = current_deadline()
+        self._pending.append((item, future, deadline))
+        self.metrics["items"] += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self.metrics["flushes_by_size"] += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush_on_timer)
+
+        if deadline is None:
+            return await future
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            self.metrics["caller_deadline_exceeded"] += 1
+            raise DeadlineExceeded(self.name)
+
+    def _flush_on_timer(self):
+        self.metrics["flushes_by_timer"] += 1
+        self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Contexto vacío: el lote no hereda el deadline (ni otras contextvars) de quien lo disparó
+            asyncio.get_running_loop().create_task(self._run_batch(batch), context=contextvars.Context())
+
+    def _batch_deadline(self, batch: List[Tuple[Any, asyncio.Future, Optional[Deadline]]]) -> Optional[Deadline]:
+        """El deadline más tardío del lote (None si algún llamador no tiene límite)"""
+        deadlines = [deadline for _, _, deadline in batch]
+        if any(deadline is None for deadline in deadlines):
+            return None
+        return max(deadlines, key=lambda deadline: deadline.expires_at)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future, Optional[Deadline]]]):
+        self.metrics["batches"] += 1
+        self.metrics["max_batch_size_seen"] = max(self.metrics["max_batch_size_seen"], len(batch))
+        try:
+            with deadline_scope(self._batch_deadline(batch)):
+                results = await self.flush_func([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Lote {self.name}: {len(results)} resultados para {len(batch)} elementos")
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"❌ Micro-batch {self.name} falló: {str(e)}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Tamaño promedio de lote y round trips evitados"""
+        batches = self.metrics["batches"]
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+            "avg_batch_size": self.metrics["items"] / batches if batches > 0 else 0,
+            "round_trips_saved": max(0, self.metrics["items"] - batches - len(self._pending)),
+            **self.metrics
+        }
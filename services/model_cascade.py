@@ -0,0 +1,135 @@
+"""
+Model Cascade
+Decisión por niveles: primero el score determinista; el modelo caro solo cuando el score cae en la banda de incertidumbre
+"""
+
+import os
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+from .metrics import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Rutas de una decisión
+CLEAR_PASS = "clear_pass"
+CLEAR_FAIL = "clear_fail"
+ESCALATE = "escalate"
+
+CASCADE_THRESHOLD = metrics_registry.gauge(
+    "kyc_cascade_threshold",
+    "Límites de la banda de incertidumbre por nivel de la cascada",
+    ("tier", "bound")
+)
+CASCADE_DECISIONS = metrics_registry.counter(
+    "kyc_cascade_decisions_total",
+    "Decisiones de la cascada por nivel y ruta",
+    ("tier", "route")
+)
+CASCADE_ESCALATION_RATE = metrics_registry.gauge(
+    "kyc_cascade_escalation_rate",
+    "Fracción de decisiones escaladas al modelo",
+    ("tier",)
+)
+
+def _parse_band(value: str, default: Tuple[float, float]) -> Tuple[float, float]:
+    try:
+        low, high = (float(part) for part in value.split(","))
+    except ValueError:
+        logger.warning(f"⚠️ Banda de cascada inválida: {value!r}, usando {default}")
+        return default
+    return (min(low, high), max(low, high))
+
+class CascadeTier:
+    """Nivel de la cascada: scores en [low, high) se escalan a `model`"""
+
+    def __init__(self, name: str, model: str, band: Tuple[float, float]):
+        self.name = name
+        self.model = model
+        self.low, self.high = band
+        self.decisions = {CLEAR_PASS: 0, CLEAR_FAIL: 0, ESCALATE: 0}
+
+        CASCADE_THRESHOLD.set(self.low, tier=name, bound="low")
+        CASCADE_THRESHOLD.set(self.high, tier=name, bound="high")
+
+    @property
+    def escalation_rate(self) -> float:
+        total = sum(self.decisions.values())
+        return self.decisions[ESCALATE] / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "band": [self.low, self.high],
+            "decisions": dict(self.decisions),
+            "escalation_rate": round(self.escalation_rate, 4)
+        }
+
+class ModelCascade:
+    """Enruta cada decisión: aprobación/rechazo claro localmente o escalamiento al modelo"""
+
+    def __init__(self):
+        self.enabled = os.getenv("KYC_CASCADE_ENABLED", "true").lower() == "true"
+        self.tiers = {
+            # Screening de identidad (nombre, CURP/RFC, edad) antes de Saptiva Guard
+            "identity": CascadeTier(
+                "identity",
+                "Saptiva Guard",
+                _parse_band(os.getenv("KYC_CASCADE_IDENTITY_BAND", "0.5,0.9"), (0.5, 0.9))
+            ),
+            # Score combinado de riesgo antes de Saptiva KAL (corte de aprobación en 0.6)
+            "risk": CascadeTier(
+                "risk",
+                "Saptiva KAL",
+                _parse_band(os.getenv("KYC_CASCADE_RISK_BAND", "0.5,0.7"), (0.5, 0.7))
+            )
+        }
+
+    def route(self, tier_name: str, score: float) -> str:
+        """
+        CLEAR_PASS si score >= high, CLEAR_FAIL si score < low, ESCALATE en la banda
+        (o siempre ESCALATE con la cascada deshabilitada)
+        """
+        tier = self.tiers[tier_name]
+        if self.would_escalate(tier_name, score):
+            route = ESCALATE
+        elif score >= tier.high:
+            route = CLEAR_PASS
+        else:
+            route = CLEAR_FAIL
+
+        tier.decisions[route] += 1
+        CASCADE_DECISIONS.inc(tier=tier_name, route=route)
+        CASCADE_ESCALATION_RATE.set(tier.escalation_rate, tier=tier_name)
+        logger.info(
+            f"🪜 Cascada {tier_name}: score {score:.3f} "
+            f"{'-> ' + tier.model if route == ESCALATE else '(' + route + ', sin ' + tier.model + ')'}"
+        )
+        return route
+
+    def would_escalate(self, tier_name: str, score: float) -> bool:
+        """Si route() escalaría este score (sin contarlo en las métricas)"""
+        tier = self.tiers[tier_name]
+        return not self.enabled or tier.low <= score < tier.high
+
+    def escalation_probability(self, tier_name: str) -> float:
+        """Tasa de escalamiento observada; 1.0 sin historial o con la cascada deshabilitada"""
+        tier = self.tiers[tier_name]
+        if not self.enabled or not sum(tier.decisions.values()):
+            return 1.0
+        return tier.escalation_rate
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "tiers": {name: tier.to_dict() for name, tier in self.tiers.items()}
+        }
+
+_shared_cascade: Optional[ModelCascade] = None
+
+def get_model_cascade() -> ModelCascade:
+    """Devuelve la cascada compartida del proceso (se crea en el primer uso)"""
+    global _shared_cascade
+    if _shared_cascade is None:
+        _shared_cascade = ModelCascade()
+    return _shared_cascade
@@ -0,0 +1,250 @@
+"""
+KYC Record Store
+Persistencia durable de los registros KYC detrás de DatabaseService (SQLite en modo WAL)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# Sentencias fijas: sqlite3 las compila una vez por conexión y las reutiliza (cache de statements)
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS kyc_records (
+    customer_id TEXT PRIMARY KEY,
+    status TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    record TEXT NOT NULL
+)
+"""
+UPSERT_RECORD_SQL = """
+INSERT INTO kyc_records (customer_id, status, created_at, updated_at, record)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(customer_id) DO UPDATE SET
+    status = excluded.status,
+    created_at = excluded.created_at,
+    updated_at = excluded.updated_at,
+    record = excluded.record
+"""
+UPDATE_STATUS_SQL = "UPDATE kyc_records SET status = ?, updated_at = ? WHERE customer_id = ?"
+SELECT_ALL_SQL = "SELECT status, updated_at, record FROM kyc_records"
+
+class RecordStore(ABC):
+    """
+    Contrato de un almacén durable de registros KYC.
+
+    DatabaseService conserva en memoria las filas calientes, los índices y los blobs;
+    el almacén guarda cada registro completo para reconstruirlos al arrancar. La única
+    implementación es SQLite (WAL); no hay backend PostgreSQL
+    """
+
+    @abstractmethod
+    async def open(self):
+        """Prepara conexiones y esquema"""
+
+    @abstractmethod
+    async def close(self):
+        """Cierra las conexiones"""
+
+    @abstractmethod
+    async def load_records(self) -> List[Dict[str, Any]]:
+        """Todos los registros guardados (para reconstruir el estado en memoria)"""
+
+    @abstractmethod
+    async def write_batch(self, records: List[Dict[str, Any]]):
+        """Upsert de un lote de registros en una sola transacción"""
+
+    @abstractmethod
+    async def update_status(self, customer_id: str, status: str, updated_at: str):
+        """Cambia solo estado y timestamp (sin reescribir el registro)"""
+
+    @abstractmethod
+    def get_metrics(self) -> Dict[str, Any]:
+        """Estado del almacén para /kyc/storage-metrics"""
+
+class SQLiteConnectionPool:
+    """
+    Pool de conexiones sqlite3; cada operación corre en un hilo del pool para no bloquear el event loop
+    """
+
+    def __init__(self, path: str, size: int = 4, busy_timeout: float = 5.0):
+        self.path = path
+        self.size = max(1, size)
+        self.busy_timeout = busy_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connections: List[sqlite3.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self.waits = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,  # transacciones explícitas (BEGIN/COMMIT) por lote
+            check_same_thread=False,
+            cached_statements=64
+        )
+        # WAL: los lectores no bloquean al escritor; NORMAL basta para durabilidad con WAL
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    async def open(self):
+        if self._idle is not None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="kyc-sqlite")
+        loop = asyncio.get_running_loop()
+        self._connections = [
+            await loop.run_in_executor(self._executor, self._connect)
+            for _ in range(self.size)
+        ]
+        self._idle = asyncio.Queue()
+        for conn in self._connections:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        if self._idle is None:
+            return
+        # Esperar a que todas las conexiones vuelvan al pool antes de cerrarlas
+        for _ in range(len(self._connections)):
+            await self._idle.get()
+        for conn in self._connections:
+            conn.close()
+        self._executor.shutdown(wait=True)
+        self._connections = []
+        self._idle = None
+        self._executor = None
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._idle.empty():
+            self.waits += 1
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def run(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Ejecuta `operation(conn)` en un hilo con una conexión del pool"""
+        async with self.connection() as conn:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, operation, conn)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "waits": self.waits
+        }
+
+class SQLiteRecordStore(RecordStore):
+    """Registros KYC en SQLite (WAL): una fila por cliente con el registro en JSON"""
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 pool_size: Optional[int] = None):
+        self.path = path or os.getenv("KYC_DB_PATH", "kyc_records.db")
+        self.pool = SQLiteConnectionPool(
+            self.path,
+            size=pool_size or int(os.getenv("KYC_DB_POOL_SIZE", "4")),
+            busy_timeout=float(os.getenv("KYC_DB_BUSY_TIMEOUT", "5"))
+        )
+        self.metrics = {
+            "batches": 0,
+            "records_written": 0,
+            "status_updates": 0,
+            "records_loaded": 0,
+            "last_commit_seconds": None
+        }
+
+    async def open(self):
+        await self.pool.open()
+        await self.pool.run(lambda conn: conn.execute(CREATE_TABLE_SQL))
+        logger.info(f"🗄️ Almacén SQLite (WAL) abierto: {self.path} (pool de {self.pool.size} conexiones)")
+
+    async def close(self):
+        await self.pool.close()
+
+    async def load_records(self) -> List[Dict[str, Any]]:
+        def load(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+            records = []
+            for status, updated_at, payload in conn.execute(SELECT_ALL_SQL):
+                record = json.loads(payload)
+                # update_status solo toca las columnas: tienen la última palabra
+                record["status"] = status
+                record["updated_at"] = updated_at
+                records.append(record)
+            return records
+
+        records = await self.pool.run(load)
+        self.metrics["records_loaded"] += len(records)
+        return records
+
+    async def write_batch(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        params = [
+            (
+                record["customer_id"],
+                record.get("status"),
+                record.get("created_at"),
+                record.get("updated_at"),
+                json.dumps(record, ensure_ascii=False, default=str)
+            )
+            for record in records
+        ]
+
+        def write(conn: sqlite3.Connection):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(UPSERT_RECORD_SQL, params)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+        started = time.monotonic()
+        await self.pool.run(write)
+        self.metrics["batches"] += 1
+        self.metrics["records_written"] += len(records)
+        self.metrics["last_commit_seconds"] = round(time.monotonic() - started, 4)
+
+    async def update_status(self, customer_id: str, status: str, updated_at: str):
+        await self.pool.run(lambda conn: conn.execute(UPDATE_STATUS_SQL, (status, updated_at, customer_id)))
+        self.metrics["status_updates"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "journal_mode": "wal",
+            "pool": self.pool.get_status(),
+            **self.metrics
+        }
+
+RECORD_STORES = {
+    "sqlite": SQLiteRecordStore
+}
+
+def create_record_store(name: str) -> Optional[RecordStore]:
+    """Instancia el almacén configurado (KYC_DB_BACKEND); "memory" = sin persistencia"""
+    if name == "memory":
+        return None
+    store = RECORD_STORES.get(name)
+    if store is None:
+        raise ValueError(
+            f"Backend de base de datos KYC no soportado: {name} "
+            f"(disponibles: memory, {', '.join(RECORD_STORES)})"
+        )
+    return store()
@@ -170,6 +170,32 @@ class SaptivaBillingService:
             logger.error(f"Error logging API call: {str(e)}")
             return {"error": str(e)}
     
+    def estimate_call_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """
+        Estima el costo de una llamada sin registrarla
+        """
+        pricing = self.model_pricing.get(model)
+        if not pricing:
+            return 0.0
+        
+        return (
+            (input_tokens / 1_000_000) * pricing["input_price_per_m"] +
+            (output_tokens / 1_000_000) * pricing["output_price_per_m"]
+        )
+    
+    def get_average_tokens(self, model: str) -> Optional[Dict[str, float]]:
+        """
+        Tokens promedio por llamada observados en la sesión para un modelo
+        """
+        stats = self.session_costs["models_used"].get(model)
+        if not stats or stats["calls"] == 0:
+            return None
+        
+        return {
+            "input_tokens": stats["input_tokens"] / stats["calls"],
+            "output_tokens": stats["output_tokens"] / stats["calls"]
+        }
+    
     def get_session_summary(self) -> Dict[str, Any]:
         """
         Obtiene resumen de costos de la sesión actual
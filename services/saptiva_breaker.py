@@ -0,0 +1,155 @@
+"""
+Saptiva Circuit Breaker
+Corta llamadas a endpoints caídos (por endpoint y modelo) y prueba la recuperación en half-open
+"""
+
+import os
+import time
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin tocar la red"""
+
+    def __init__(self, name: str, retry_in: float, degraded: bool = True):
+        super().__init__(f"Circuito abierto para {name} (reintento en {retry_in:.1f}s)")
+        self.name = name
+        self.retry_in = retry_in
+        self.degraded = degraded
+
+class CircuitBreaker:
+    """Circuit breaker closed -> open -> half_open -> closed"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_in_flight = 0
+
+        self.metrics = {
+            "successes": 0,
+            "failures": 0,
+            "short_circuited": 0,
+            "opened": 0,
+            "last_failure": None,
+            "last_state_change": None
+        }
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"⚡ Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+            self.metrics["last_state_change"] = time.time()
+
+    def retry_in(self) -> float:
+        """Segundos hasta la siguiente prueba half-open"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        """¿Se permite la llamada? En half-open solo pasan las llamadas de prueba"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.metrics["short_circuited"] += 1
+                return False
+            self._transition("half_open")
+            self.half_open_in_flight = 0
+
+        if self.state == "half_open":
+            if self.half_open_in_flight >= self.half_open_max_calls:
+                self.metrics["short_circuited"] += 1
+                return False
+            self.half_open_in_flight += 1
+
+        return True
+
+    def record_success(self):
+        self.metrics["successes"] += 1
+        self.consecutive_failures = 0
+        if self.state == "half_open":
+            self.half_open_in_flight = 0
+            self._transition("closed")
+
+    def record_failure(self, error: str = None):
+        self.metrics["failures"] += 1
+        self.metrics["last_failure"] = error
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.half_open_in_flight = 0
+            self.metrics["opened"] += 1
+            self._transition("open")
+
+    def record_cancelled(self):
+        """Una prueba half-open cancelada libera su lugar"""
+        if self.state == "half_open" and self.half_open_in_flight > 0:
+            self.half_open_in_flight -= 1
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": round(self.retry_in(), 3),
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            **self.metrics
+        }
+
+class CircuitBreakerRegistry:
+    """Un circuit breaker por (endpoint, modelo)"""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv("SAPTIVA_BREAKER_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = float(os.getenv("SAPTIVA_BREAKER_RESET_TIMEOUT", "30"))
+        self.half_open_max_calls = int(os.getenv("SAPTIVA_BREAKER_HALF_OPEN_CALLS", "1"))
+        # degrade: respuesta simulada inmediata | fail: error inmediato al llamador
+        self.open_mode = os.getenv("SAPTIVA_BREAKER_OPEN_MODE", "degrade").lower()
+        self.breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+    @property
+    def degrade(self) -> bool:
+        return self.open_mode != "fail"
+
+    def get(self, endpoint: str, model: str) -> CircuitBreaker:
+        key = (endpoint, model)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                f"{endpoint}:{model}",
+                failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout,
+                half_open_max_calls=self.half_open_max_calls
+            )
+            self.breakers[key] = breaker
+        return breaker
+
+    def endpoint_state(self, endpoint: str) -> Optional[str]:
+        """Peor estado entre los modelos de un endpoint (None si no hubo tráfico)"""
+        states = [breaker.state for (name, _), breaker in self.breakers.items() if name == endpoint]
+        for state in ("open", "half_open", "closed"):
+            if state in states:
+                return state
+        return None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            f"{endpoint}:{model}": breaker.get_status()
+            for (endpoint, model), breaker in self.breakers.items()
+        }
+
+_shared_registry: Optional[CircuitBreakerRegistry] = None
+
+def get_breaker_registry() -> CircuitBreakerRegistry:
+    """Registro de circuit breakers compartido por los clientes de Saptiva"""
+    global _shared_registry
+    if _shared_registry is None:
+        _shared_registry = CircuitBreakerRegistry()
+    return _shared_registry
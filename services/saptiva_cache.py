@@ -0,0 +1,227 @@
+"""
+Saptiva Completion Cache
+Cache opt-in de respuestas de chat completions deterministas (LRU en memoria + disco opcional)
+"""
+
+import os
+import copy
+import asyncio
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+class SaptivaCompletionCache:
+    """Cache de completions por hash de modelo, mensajes y parámetros de muestreo"""
+
+    def __init__(self):
+        self.enabled = os.getenv("SAPTIVA_CACHE_ENABLED", "false").lower() == "true"
+        self.models = {
+            model.strip()
+            for model in os.getenv("SAPTIVA_CACHE_MODELS", "*").split(",")
+            if model.strip()
+        }
+        self.max_temperature = float(os.getenv("SAPTIVA_CACHE_MAX_TEMPERATURE", "0.3"))
+        self.ttl = float(os.getenv("SAPTIVA_CACHE_TTL", "3600"))
+        self.max_entries = int(os.getenv("SAPTIVA_CACHE_MAX_ENTRIES", "1000"))
+        self.disk_dir = os.getenv("SAPTIVA_CACHE_DIR") or None
+        self.max_disk_entries = int(os.getenv("SAPTIVA_CACHE_MAX_DISK_ENTRIES", "10000"))
+        # Cada cuántas escrituras se barre el directorio (caducadas + exceso por mtime)
+        self.prune_every = max(1, int(os.getenv("SAPTIVA_CACHE_PRUNE_EVERY", "100")))
+        self._stores_since_prune = 0
+
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        # key -> (expires_at, response)
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+        self.metrics = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "disk_pruned": 0,
+            "by_model": {}
+        }
+
+        if self.enabled and self.disk_dir:
+            self.prune_disk()
+
+    def is_cacheable(self, payload: Dict[str, Any]) -> bool:
+        """Solo modelos habilitados y llamadas con temperatura baja"""
+        if not self.enabled:
+            return False
+        if "*" not in self.models and payload.get("model") not in self.models:
+            return False
+        return payload.get("temperature", 1.0) <= self.max_temperature
+
+    def make_key(self, payload: Dict[str, Any]) -> str:
+        """Hash estable de modelo, mensajes y parámetros de muestreo"""
+        material = {
+            "model": payload.get("model"),
+            "messages": payload.get("messages"),
+            "max_tokens": payload.get("max_tokens"),
+            "temperature": payload.get("temperature"),
+            "top_p": payload.get("top_p")
+        }
+        encoded = json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _model_stats(self, model: str) -> Dict[str, int]:
+        return self.metrics["by_model"].setdefault(model, {"hits": 0, "misses": 0})
+
+    async def get(self, key: str, model: str) -> Optional[Dict[str, Any]]:
+        """Busca en memoria y luego en disco; None si no hay entrada vigente"""
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.metrics["memory_hits"] += 1
+                self._model_stats(model)["hits"] += 1
+                return copy.deepcopy(response)
+            del self._entries[key]
+            self.metrics["expired"] += 1
+
+        if self.disk_dir:
+            response = await self._read_disk(key, now)
+            if response is not None:
+                self._store_memory(key, response, now + self.ttl)
+                self.metrics["disk_hits"] += 1
+                self._model_stats(model)["hits"] += 1
+                return copy.deepcopy(response)
+
+        self.metrics["misses"] += 1
+        self._model_stats(model)["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: Dict[str, Any]):
+        """Guarda una respuesta en memoria (y en disco si está configurado)"""
+        expires_at = time.time() + self.ttl
+        self._store_memory(key, copy.deepcopy(response), expires_at)
+        self.metrics["stores"] += 1
+
+        if self.disk_dir:
+            try:
+                async with aiofiles.open(self._disk_path(key), "w") as f:
+                    await f.write(json.dumps({"expires_at": expires_at, "response": response}))
+            except Exception as e:
+                logger.warning(f"⚠️ Cache Saptiva: no se pudo escribir en disco ({str(e)})")
+
+            self._stores_since_prune += 1
+            if self._stores_since_prune >= self.prune_every:
+                self._stores_since_prune = 0
+                await asyncio.get_running_loop().run_in_executor(None, self.prune_disk)
+
+    def prune_disk(self) -> int:
+        """
+        Borra del disco las entradas caducadas y, si sobran, las más antiguas
+        
+        La caducidad se deduce del mtime (todas las entradas usan el mismo TTL),
+        así el barrido no necesita abrir cada archivo.
+        """
+        if not self.disk_dir:
+            return 0
+
+        now = time.time()
+        files = []
+        removed = 0
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json") or not entry.is_file():
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if mtime + self.ttl <= now:
+                        removed += self._remove_disk_file(entry.path)
+                    else:
+                        files.append((mtime, entry.path))
+        except FileNotFoundError:
+            return 0
+
+        excess = len(files) - self.max_disk_entries
+        if excess > 0:
+            files.sort()
+            for _, path in files[:excess]:
+                removed += self._remove_disk_file(path)
+
+        if removed:
+            self.metrics["disk_pruned"] += removed
+            logger.info(f"🧹 Cache Saptiva: {removed} entradas eliminadas del disco")
+        return removed
+
+    def _remove_disk_file(self, path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def _store_memory(self, key: str, response: Dict[str, Any], expires_at: float):
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    async def _read_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            async with aiofiles.open(path, "r") as f:
+                entry = json.loads(await f.read())
+            if entry.get("expires_at", 0) > now:
+                return entry["response"]
+            self._remove_disk_file(path)
+            self.metrics["expired"] += 1
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Cache Saptiva: entrada en disco inválida ({str(e)})")
+        return None
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas de hit/miss del cache"""
+        hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+        lookups = hits + self.metrics["misses"]
+        return {
+            "config": {
+                "enabled": self.enabled,
+                "models": sorted(self.models),
+                "max_temperature": self.max_temperature,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "disk_dir": self.disk_dir,
+                "max_disk_entries": self.max_disk_entries
+            },
+            "entries": len(self._entries),
+            "hit_rate": hits / lookups if lookups > 0 else 0,
+            **self.metrics
+        }
+
+_shared_cache: Optional[SaptivaCompletionCache] = None
+
+def get_completion_cache() -> SaptivaCompletionCache:
+    """Devuelve el cache compartido del proceso (se crea en el primer uso)"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SaptivaCompletionCache()
+    return _shared_cache
@@ -0,0 +1,385 @@
+"""
+Saptiva HTTP Client
+Llamadas a la API de Saptiva con reintentos (backoff exponencial + jitter) y hedging
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, AsyncIterator
+
+import aiohttp
+
+from .saptiva_http import get_http_pool
+from .saptiva_limiter import get_limiter_registry
+from .saptiva_breaker import CircuitOpenError, get_breaker_registry
+from .deadline import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que vale la pena reintentar
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+class SaptivaAPIError(Exception):
+    """Respuesta HTTP no exitosa de la API de Saptiva"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+def is_retryable(error: BaseException) -> bool:
+    """Errores transitorios: 408/429/5xx, timeouts y errores de conexión"""
+    if isinstance(error, SaptivaAPIError):
+        return error.status in RETRYABLE_STATUS
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
+class SSEParser:
+    """Parser incremental de server-sent events (una línea a la vez)"""
+
+    def __init__(self):
+        self._data = []
+
+    def feed(self, line: str) -> Optional[str]:
+        """Procesa una línea; devuelve el `data` del evento cuando éste termina"""
+        line = line.rstrip("\r\n")
+        if not line:
+            # Línea vacía: fin del evento
+            if not self._data:
+                return None
+            data, self._data = "\n".join(self._data), []
+            return data
+        if line.startswith(":"):
+            return None  # comentario / keep-alive
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data.append(value[1:] if value.startswith(" ") else value)
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Evento pendiente si el stream terminó sin línea vacía final"""
+        if not self._data:
+            return None
+        data, self._data = "\n".join(self._data), []
+        return data
+
+class RetryPolicy:
+    """Backoff exponencial con tope y jitter completo"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 2.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """Espera antes del reintento `attempt` (1 = primer reintento)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay
+        }
+
+class SaptivaHTTPClient:
+    """Cliente HTTP compartido: limitador por modelo, reintentos y hedging"""
+
+    def __init__(self, http_pool=None, limiters=None, breakers=None):
+        self.http_pool = http_pool or get_http_pool()
+        self.limiters = limiters or get_limiter_registry()
+        self.breakers = breakers or get_breaker_registry()
+
+        # Política de reintentos por defecto y overrides por modelo (JSON)
+        self.default_policy = RetryPolicy(
+            max_attempts=int(os.getenv("SAPTIVA_RETRY_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("SAPTIVA_RETRY_BASE_DELAY", "0.2")),
+            max_delay=float(os.getenv("SAPTIVA_RETRY_MAX_DELAY", "2.0"))
+        )
+        self.model_policies: Dict[str, RetryPolicy] = {}
+        for model, config in json.loads(os.getenv("SAPTIVA_RETRY_POLICIES", "{}")).items():
+            self.model_policies[model] = RetryPolicy(**{**self.default_policy.to_dict(), **config})
+
+        # Hedging: solo para llamadas idempotentes (embeddings)
+        self.hedge_models = {
+            model.strip()
+            for model in os.getenv("SAPTIVA_HEDGE_MODELS", "Saptiva Embed").split(",")
+            if model.strip()
+        }
+        self.hedge_percentile = float(os.getenv("SAPTIVA_HEDGE_PERCENTILE", "0.95"))
+        self.hedge_default_delay = float(os.getenv("SAPTIVA_HEDGE_DEFAULT_DELAY", "1.0"))
+        self.hedge_min_samples = 20
+
+        # Latencias recientes por modelo (para el delay de hedging)
+        self.latencies: Dict[str, deque] = {}
+
+        self.metrics = {
+            "attempts": 0,
+            "retries": 0,
+            "exhausted": 0,
+            "hedges_sent": 0,
+            "hedges_won": 0,
+            "deadline_exceeded": 0,
+            "streams": 0
+        }
+
+    def policy_for(self, model: str) -> RetryPolicy:
+        return self.model_policies.get(model, self.default_policy)
+
+    def hedge_delay(self, model: str) -> float:
+        """Delay de hedging derivado del percentil de latencia observado"""
+        samples = self.latencies.get(model)
+        if not samples or len(samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))
+        return ordered[index]
+
+    async def post_json(self,
+                        model: str,
+                        url: str,
+                        headers: Dict[str, str],
+                        payload: Dict[str, Any],
+                        timeout: float,
+                        idempotent: bool = False,
+                        endpoint: str = "chat") -> Dict[str, Any]:
+        """
+        POST JSON con reintentos; lanza SaptivaAPIError, CircuitOpenError, DeadlineExceeded
+        o el error de red final. `timeout` se recorta al presupuesto restante de la petición
+        """
+        policy = self.policy_for(model)
+        hedge = idempotent and model in self.hedge_models
+        breaker = self.breakers.get(endpoint, model)
+        deadline = current_deadline()
+
+        for attempt in range(1, policy.max_attempts + 1):
+            if deadline is not None and deadline.expired:
+                self.metrics["deadline_exceeded"] += 1
+                raise DeadlineExceeded(model)
+            # Circuito abierto: fallar rápido sin esperar el timeout
+            if not breaker.allow():
+                raise CircuitOpenError(breaker.name, breaker.retry_in(), degraded=self.breakers.degrade)
+            try:
+                if hedge:
+                    result = await self._hedged_attempt(model, url, headers, payload, timeout)
+                else:
+                    result = await self._attempt(model, url, headers, payload, timeout)
+                breaker.record_success()
+                return result
+            except (asyncio.CancelledError, DeadlineExceeded) as e:
+                # Ni la cancelación ni el presupuesto agotado dicen nada del upstream
+                breaker.record_cancelled()
+                if isinstance(e, DeadlineExceeded):
+                    self.metrics["deadline_exceeded"] += 1
+                raise
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure(str(e) or type(e).__name__)
+                else:
+                    # 4xx: el upstream responde, no cuenta como caída
+                    breaker.record_success()
+                if not is_retryable(e) or attempt == policy.max_attempts:
+                    if is_retryable(e):
+                        self.metrics["exhausted"] += 1
+                    raise
+                delay = policy.backoff(attempt)
+                if deadline is not None and delay >= deadline.remaining():
+                    # No alcanza el presupuesto para esperar y reintentar
+                    self.metrics["deadline_exceeded"] += 1
+                    raise
+                self.metrics["retries"] += 1
+                logger.warning(
+                    f"🔁 {model}: intento {attempt}/{policy.max_attempts} falló "
+                    f"({str(e) or type(e).__name__}), reintentando en {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def stream_sse(self,
+                         model: str,
+                         url: str,
+                         headers: Dict[str, str],
+                         payload: Dict[str, Any],
+                         timeout: float,
+                         endpoint: str = "chat") -> AsyncIterator[Dict[str, Any]]:
+        """
+        POST con `stream: true`; produce cada evento SSE (JSON) en cuanto llega.
+        Solo se reintenta antes del primer byte: un stream ya iniciado no se repite
+        """
+        policy = self.policy_for(model)
+        breaker = self.breakers.get(endpoint, model)
+        deadline = current_deadline()
+        session = await self.http_pool.get_session()
+        payload = {**payload, "stream": True}
+
+        for attempt in range(1, policy.max_attempts + 1):
+            if deadline is not None and deadline.expired:
+                self.metrics["deadline_exceeded"] += 1
+                raise DeadlineExceeded(model)
+            if not breaker.allow():
+                raise CircuitOpenError(breaker.name, breaker.retry_in(), degraded=self.breakers.degrade)
+
+            streaming = False
+            self.metrics["attempts"] += 1
+            started = time.monotonic()
+            try:
+                async with self.limiters.get(model).acquire() as slot:
+                    call_timeout = deadline.timeout(timeout) if deadline is not None else timeout
+                    if call_timeout <= 0:
+                        slot.outcome = "deadline"
+                        raise DeadlineExceeded(model)
+                    try:
+                        async with session.post(
+                            url,
+                            headers={**headers, "Accept": "text/event-stream"},
+                            json=payload,
+                            timeout=aiohttp.ClientTimeout(total=call_timeout)
+                        ) as response:
+                            slot.record(response.status, response.headers)
+                            if response.status != 200:
+                                raise SaptivaAPIError(response.status, await response.text())
+
+                            # Primer byte: desde aquí el stream es del llamador
+                            streaming = True
+                            breaker.record_success()
+                            self.metrics["streams"] += 1
+                            self.latencies.setdefault(model, deque(maxlen=200)).append(time.monotonic() - started)
+
+                            parser = SSEParser()
+                            async for raw_line in response.content:
+                                data = parser.feed(raw_line.decode("utf-8"))
+                                if data is None:
+                                    continue
+                                if data.strip() == "[DONE]":
+                                    return
+                                yield json.loads(data)
+                            data = parser.flush()
+                            if data is not None and data.strip() != "[DONE]":
+                                yield json.loads(data)
+                            return
+                    except asyncio.TimeoutError:
+                        if not streaming and call_timeout < timeout:
+                            # El timeout lo impuso el presupuesto del llamador, no una caída del upstream
+                            slot.outcome = "deadline"
+                            raise DeadlineExceeded(model)
+                        raise
+            except (asyncio.CancelledError, DeadlineExceeded) as e:
+                if not streaming:
+                    breaker.record_cancelled()
+                if isinstance(e, DeadlineExceeded):
+                    self.metrics["deadline_exceeded"] += 1
+                raise
+            except Exception as e:
+                if streaming:
+                    raise
+                if is_retryable(e):
+                    breaker.record_failure(str(e) or type(e).__name__)
+                else:
+                    breaker.record_success()
+                if not is_retryable(e) or attempt == policy.max_attempts:
+                    if is_retryable(e):
+                        self.metrics["exhausted"] += 1
+                    raise
+                delay = policy.backoff(attempt)
+                if deadline is not None and delay >= deadline.remaining():
+                    self.metrics["deadline_exceeded"] += 1
+                    raise
+                self.metrics["retries"] += 1
+                logger.warning(
+                    f"🔁 {model} (stream): intento {attempt}/{policy.max_attempts} falló "
+                    f"({str(e) or type(e).__name__}), reintentando en {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def _attempt(self,
+                       model: str,
+                       url: str,
+                       headers: Dict[str, str],
+                       payload: Dict[str, Any],
+                       timeout: float) -> Dict[str, Any]:
+        """Un intento HTTP dentro del limitador del modelo"""
+        session = await self.http_pool.get_session()
+        self.metrics["attempts"] += 1
+        started = time.monotonic()
+        deadline = current_deadline()
+
+        async with self.limiters.get(model).acquire() as slot:
+            # El presupuesto se mide después de la espera en la cola del limitador
+            call_timeout = deadline.timeout(timeout) if deadline is not None else timeout
+            if call_timeout <= 0:
+                slot.outcome = "deadline"
+                raise DeadlineExceeded(model)
+            try:
+                async with session.post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=call_timeout)
+                ) as response:
+                    slot.record(response.status, response.headers)
+                    if response.status != 200:
+                        raise SaptivaAPIError(response.status, await response.text())
+                    result = await response.json()
+            except asyncio.TimeoutError:
+                if call_timeout < timeout:
+                    # El timeout lo impuso el presupuesto del llamador, no una caída del upstream
+                    slot.outcome = "deadline"
+                    raise DeadlineExceeded(model)
+                raise
+
+        self.latencies.setdefault(model, deque(maxlen=200)).append(time.monotonic() - started)
+        return result
+
+    async def _hedged_attempt(self,
+                              model: str,
+                              url: str,
+                              headers: Dict[str, str],
+                              payload: Dict[str, Any],
+                              timeout: float) -> Dict[str, Any]:
+        """
+        Lanza un segundo intento si el primero tarda más que el p95; gana el primero en responder
+        """
+        primary = asyncio.ensure_future(self._attempt(model, url, headers, payload, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(model))
+        if done:
+            return primary.result()
+
+        self.metrics["hedges_sent"] += 1
+        hedge = asyncio.ensure_future(self._attempt(model, url, headers, payload, timeout))
+        pending = {primary, hedge}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics["hedges_won"] += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Reintentos, hedging y políticas vigentes"""
+        return {
+            "default_policy": self.default_policy.to_dict(),
+            "model_policies": {model: policy.to_dict() for model, policy in self.model_policies.items()},
+            "hedge_models": sorted(self.hedge_models),
+            "hedge_delays": {model: round(self.hedge_delay(model), 4) for model in self.latencies},
+            **self.metrics
+        }
+
+_shared_client: Optional[SaptivaHTTPClient] = None
+
+def get_saptiva_client() -> SaptivaHTTPClient:
+    """Cliente HTTP compartido por los servicios de Saptiva"""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = SaptivaHTTPClient()
+    return _shared_client
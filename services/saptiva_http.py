@@ -0,0 +1,151 @@
+"""
+Saptiva HTTP Pool
+Sesión aiohttp compartida por todos los clientes de Saptiva (chat, embed, cortex)
+"""
+
+import os
+import ssl
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+from datetime import datetime
+
+import aiohttp
+import certifi
+
+logger = logging.getLogger(__name__)
+
+class SaptivaHTTPPool:
+    """Pool de conexiones HTTP compartido con keep-alive para la API de Saptiva"""
+
+    def __init__(self):
+        # Configuración del pool (variables de entorno)
+        self.pool_size = int(os.getenv("SAPTIVA_POOL_SIZE", "100"))
+        self.pool_per_host = int(os.getenv("SAPTIVA_POOL_PER_HOST", "30"))
+        self.keepalive_timeout = float(os.getenv("SAPTIVA_POOL_KEEPALIVE", "30"))
+        self.dns_cache_ttl = int(os.getenv("SAPTIVA_POOL_DNS_TTL", "300"))
+
+        # Configurar SSL context moderno
+        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self.ssl_context.check_hostname = True
+        self.ssl_context.verify_mode = ssl.CERT_REQUIRED
+        self.ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._lock = asyncio.Lock()
+
+        self.metrics = {
+            "requests": 0,
+            "request_errors": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "sessions_opened": 0,
+            "opened_at": None
+        }
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Abre la sesión compartida (idempotente)"""
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                self._connector = aiohttp.TCPConnector(
+                    ssl=self.ssl_context,
+                    limit=self.pool_size,
+                    limit_per_host=self.pool_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    use_dns_cache=True,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=self._connector,
+                    trace_configs=[self._build_trace_config()]
+                )
+                self.metrics["sessions_opened"] += 1
+                self.metrics["opened_at"] = datetime.now().isoformat()
+                logger.info(
+                    f"🔌 Pool Saptiva abierto: limit={self.pool_size}, "
+                    f"per_host={self.pool_per_host}, keepalive={self.keepalive_timeout}s"
+                )
+            return self._session
+
+    async def close(self):
+        """Cierra la sesión compartida y libera las conexiones"""
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+                logger.info("🔌 Pool Saptiva cerrado")
+            self._session = None
+            self._connector = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Devuelve la sesión compartida, abriéndola si aún no existe"""
+        if self._session is None or self._session.closed:
+            return await self.start()
+        return self._session
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        """Hooks de aiohttp para medir uso del pool y reutilización de conexiones"""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.metrics["requests"] += 1
+            self.metrics["in_flight"] += 1
+            self.metrics["peak_in_flight"] = max(self.metrics["peak_in_flight"], self.metrics["in_flight"])
+
+        async def on_request_end(session, ctx, params):
+            self.metrics["in_flight"] -= 1
+
+        async def on_request_exception(session, ctx, params):
+            self.metrics["in_flight"] -= 1
+            self.metrics["request_errors"] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.metrics["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.metrics["connections_reused"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas de uso del pool y reutilización de conexiones"""
+        acquired = 0
+        idle = 0
+        if self._connector is not None and not self._connector.closed:
+            acquired = len(getattr(self._connector, "_acquired", ()))
+            idle = sum(len(conns) for conns in getattr(self._connector, "_conns", {}).values())
+
+        total_connections = self.metrics["connections_created"] + self.metrics["connections_reused"]
+
+        return {
+            "config": {
+                "pool_size": self.pool_size,
+                "pool_per_host": self.pool_per_host,
+                "keepalive_timeout": self.keepalive_timeout,
+                "dns_cache_ttl": self.dns_cache_ttl
+            },
+            "session_open": self._session is not None and not self._session.closed,
+            "connections_acquired": acquired,
+            "connections_idle": idle,
+            "connection_reuse_rate": (
+                self.metrics["connections_reused"] / total_connections
+                if total_connections > 0 else 0
+            ),
+            **self.metrics
+        }
+
+_shared_pool: Optional[SaptivaHTTPPool] = None
+
+def get_http_pool() -> SaptivaHTTPPool:
+    """Devuelve el pool compartido del proceso (se crea en el primer uso)"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = SaptivaHTTPPool()
+    return _shared_pool
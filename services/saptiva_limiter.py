@@ -0,0 +1,219 @@
+"""
+Saptiva Adaptive Limiter
+Límite de concurrencia por modelo con control AIMD (aumento aditivo, reducción multiplicativa)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Mapping
+
+logger = logging.getLogger(__name__)
+
+# Resultados que indican congestión upstream
+CONGESTION_OUTCOMES = ("rate_limited", "server_error", "timeout")
+
+def _parse_seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class LimiterSlot:
+    """Resultado de una llamada dentro del limitador"""
+
+    def __init__(self):
+        self.outcome = None
+        self.retry_after = None
+
+    def record(self, status: int, headers: Mapping[str, str] = None):
+        """Clasifica la respuesta HTTP y lee los headers de rate limit"""
+        if status == 429:
+            self.outcome = "rate_limited"
+        elif status >= 500:
+            self.outcome = "server_error"
+        elif status >= 400:
+            self.outcome = "client_error"
+        else:
+            self.outcome = "success"
+
+        headers = headers or {}
+        retry_after = _parse_seconds(headers.get("Retry-After"))
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = _parse_seconds(headers.get("X-RateLimit-Reset"))
+        if retry_after is None and remaining is not None and remaining.strip() == "0":
+            retry_after = reset
+        self.retry_after = retry_after
+
+class AdaptiveConcurrencyLimiter:
+    """Limitador AIMD de llamadas concurrentes para un modelo"""
+
+    def __init__(self,
+                 name: str,
+                 initial_limit: float = 8,
+                 min_limit: float = 1,
+                 max_limit: float = 64,
+                 latency_target: float = 5.0,
+                 backoff: float = 0.5,
+                 cooldown: float = 1.0):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+        self.metrics = {
+            "acquired": 0,
+            "successes": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "deadline_exceeded": 0,
+            "cancelled": 0,
+            "increases": 0,
+            "decreases": 0,
+            "last_latency": None
+        }
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Espera un turno libre y registra el resultado al salir"""
+        await self._wait_turn()
+        started = time.monotonic()
+        slot = LimiterSlot()
+        try:
+            yield slot
+        except asyncio.CancelledError:
+            # Perdedor de un hedge o cliente desconectado: no dice nada del upstream
+            slot.outcome = "cancelled"
+            raise
+        except asyncio.TimeoutError:
+            slot.outcome = "timeout"
+            raise
+        except Exception:
+            if slot.outcome is None:
+                slot.outcome = "error"
+            raise
+        finally:
+            await self._release(slot, time.monotonic() - started)
+
+    async def _wait_turn(self):
+        async with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    pause = self.paused_until - time.monotonic()
+                    if pause > 0:
+                        # Pausa pedida por el upstream (Retry-After / X-RateLimit-Reset)
+                        try:
+                            await asyncio.wait_for(self._condition.wait(), timeout=pause)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                    if self.in_flight < max(1, int(self.limit)):
+                        break
+                    await self._condition.wait()
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.metrics["acquired"] += 1
+
+    async def _release(self, slot: LimiterSlot, latency: float):
+        async with self._condition:
+            self.in_flight -= 1
+            self._adjust(slot, latency)
+            self._condition.notify_all()
+
+    def _adjust(self, slot: LimiterSlot, latency: float):
+        now = time.monotonic()
+        outcome = slot.outcome or "error"
+        self.metrics["last_latency"] = round(latency, 4)
+
+        if slot.retry_after:
+            self.paused_until = max(self.paused_until, now + slot.retry_after)
+
+        if outcome in CONGESTION_OUTCOMES:
+            counter = {"rate_limited": "rate_limited", "server_error": "server_errors", "timeout": "timeouts"}[outcome]
+            self.metrics[counter] += 1
+            # Una reducción por ventana de cooldown para no colapsar el límite con una ráfaga de errores
+            if now - self._last_decrease >= self.cooldown:
+                previous = self.limit
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                self.metrics["decreases"] += 1
+                logger.warning(f"🚦 Limiter {self.name}: {outcome}, límite {previous:.1f} -> {self.limit:.1f}")
+        elif outcome == "success":
+            self.metrics["successes"] += 1
+            # Aumento aditivo (~+1 por cada `limit` éxitos) solo si la latencia está sana
+            if latency <= self.latency_target and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.metrics["increases"] += 1
+        elif outcome == "deadline":
+            # Presupuesto del llamador agotado: no es señal de congestión
+            self.metrics["deadline_exceeded"] += 1
+        elif outcome == "cancelled":
+            self.metrics["cancelled"] += 1
+        else:
+            self.metrics["errors"] += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Límite actual, llamadas en vuelo y profundidad de cola"""
+        return {
+            "limit": round(self.limit, 2),
+            "effective_limit": max(1, int(self.limit)),
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "latency_target": self.latency_target,
+            **self.metrics
+        }
+
+class SaptivaLimiterRegistry:
+    """Un limitador adaptativo por modelo de Saptiva"""
+
+    def __init__(self):
+        self.initial_limit = float(os.getenv("SAPTIVA_LIMIT_INITIAL", "8"))
+        self.min_limit = float(os.getenv("SAPTIVA_LIMIT_MIN", "1"))
+        self.max_limit = float(os.getenv("SAPTIVA_LIMIT_MAX", "64"))
+        self.latency_target = float(os.getenv("SAPTIVA_LIMIT_LATENCY_TARGET", "5.0"))
+        self.backoff = float(os.getenv("SAPTIVA_LIMIT_BACKOFF", "0.5"))
+        self.limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+    def get(self, model: str) -> AdaptiveConcurrencyLimiter:
+        limiter = self.limiters.get(model)
+        if limiter is None:
+            limiter = AdaptiveConcurrencyLimiter(
+                model,
+                initial_limit=self.initial_limit,
+                min_limit=self.min_limit,
+                max_limit=self.max_limit,
+                latency_target=self.latency_target,
+                backoff=self.backoff
+            )
+            self.limiters[model] = limiter
+        return limiter
+
+    def get_status(self) -> Dict[str, Any]:
+        return {model: limiter.get_status() for model, limiter in self.limiters.items()}
+
+_shared_registry: Optional[SaptivaLimiterRegistry] = None
+
+def get_limiter_registry() -> SaptivaLimiterRegistry:
+    """Registro de limitadores compartido por los clientes de Saptiva"""
+    global _shared_registry
+    if _shared_registry is None:
+        _shared_registry = SaptivaLimiterRegistry()
+    return _shared_registry
@@ -4,35 +4,59 @@ Integra Saptiva Embed + RAGster para consultar normativas bancarias mexicanas
 """
 
 import os
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
-import aiohttp
+from typing import Dict, Any, List, Optional, AsyncIterator
 import json
-import ssl
-import certifi
+
+from .saptiva_cache import get_completion_cache
+from .saptiva_client import SaptivaAPIError, get_saptiva_client
+from .saptiva_breaker import CircuitOpenError
+from .deadline import DeadlineExceeded
+from .single_flight import get_single_flight, request_key
+from .micro_batcher import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
 class SaptivaRAGService:
     """Servicio RAG para consultar normativas bancarias mexicanas"""
     
-    def __init__(self, billing_service=None):
+    def __init__(self,
+                 billing_service=None,
+                 http_client=None,
+                 completion_cache=None,
+                 single_flight=None,
+                 api_base_url: str = None):
         self.api_key = os.getenv("SAPTIVA_API_KEY")
         if not self.api_key:
             raise ValueError("SAPTIVA_API_KEY no encontrada")
         
-        self.embed_url = "https://api.saptiva.com/api/embed"
-        self.chat_url = "https://api.saptiva.com/v1/chat/completions"
+        # Host de la API (real por defecto; SAPTIVA_BASE_URL apunta a un mock local)
+        self.api_base_url = (api_base_url or os.getenv("SAPTIVA_BASE_URL", "https://api.saptiva.com")).rstrip("/")
+        self.embed_url = f"{self.api_base_url}/api/embed"
+        self.chat_url = f"{self.api_base_url}/v1/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
-        # Configurar SSL context moderno
-        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
-        self.ssl_context.check_hostname = True
-        self.ssl_context.verify_mode = ssl.CERT_REQUIRED
-        self.ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+        # Cliente HTTP compartido (pool keep-alive, limitador AIMD, reintentos)
+        self.http_client = http_client or get_saptiva_client()
+        
+        # Cache opt-in de completions deterministas
+        self.completion_cache = completion_cache or get_completion_cache()
+        
+        # Coalescencia de peticiones duplicadas en vuelo
+        self.single_flight = single_flight or get_single_flight()
+        
+        # Micro-batching: embeddings concurrentes viajan en una sola petición
+        self.embed_batching = os.getenv("SAPTIVA_EMBED_BATCH_ENABLED", "true").lower() == "true"
+        self.embed_batcher = MicroBatcher(
+            "saptiva_embed",
+            self._post_embedding_batch,
+            max_batch_size=int(os.getenv("SAPTIVA_EMBED_BATCH_MAX", "32")),
+            max_wait=float(os.getenv("SAPTIVA_EMBED_BATCH_WINDOW_MS", "5")) / 1000
+        )
         
         # Referencia al billing service
         self.billing_service = billing_service
@@ -105,58 +129,136 @@ class SaptivaRAGService:
         """
         Genera embedding usando Saptiva Embed (con fallback para demo)
         """
+        payload = {
+            "model": "Saptiva Embed",
+            "prompt": text
+        }
+        
+        # Peticiones idénticas en vuelo comparten una sola llamada upstream;
+        # las distintas se agrupan en lotes
+        if self.embed_batching:
+            factory = lambda: self.embed_batcher.submit(text)
+        else:
+            factory = lambda: self._post_embedding(text, payload)
+        try:
+            return await self.single_flight.do(request_key(self.embed_url, payload), factory)
+        except DeadlineExceeded as e:
+            # Presupuesto del llamador agotado esperando el lote o la llamada compartida
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+        except CircuitOpenError:
+            # Sin modo degradado el circuito abierto se propaga, igual que sin batching
+            raise
+        except Exception as e:
+            # Error del lote (p. ej. número de resultados distinto): mismo fallback que sin batching
+            logger.warning(f"⚠️ Saptiva Embed no disponible ({str(e)}), usando simulación para demo")
+        return self._simulate_embedding()
+    
+    async def _post_embedding_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        POST de un lote de textos a Saptiva Embed; un embedding por texto, en orden
+        """
+        if len(texts) == 1:
+            return [await self._post_embedding(texts[0], {"model": "Saptiva Embed", "prompt": texts[0]})]
+        
+        try:
+            logger.info(f"🔍 Generando {len(texts)} embeddings en un lote con Saptiva Embed...")
+            result = await self.http_client.post_json(
+                "Saptiva Embed",
+                self.embed_url,
+                self.headers,
+                {"model": "Saptiva Embed", "prompt": texts},
+                timeout=5,
+                idempotent=True,
+                endpoint="embed"
+            )
+            embeddings = result.get("embeddings", [])
+            if len(embeddings) != len(texts):
+                # El endpoint no devolvió un embedding por texto: enviar individualmente
+                logger.warning(
+                    f"⚠️ Saptiva Embed: lote de {len(texts)} devolvió {len(embeddings)} embeddings, "
+                    f"enviando individualmente"
+                )
+                return list(await asyncio.gather(*(
+                    self._post_embedding(text, {"model": "Saptiva Embed", "prompt": text})
+                    for text in texts
+                )))
+            
+            logger.info(f"✅ Saptiva Embed: lote REAL de {len(texts)} embeddings")
+            if self.billing_service:
+                estimated_tokens = sum(len(text.split()) * 1.3 for text in texts)
+                self.billing_service.log_api_call(
+                    model="Saptiva Embed",
+                    input_tokens=int(estimated_tokens),
+                    output_tokens=0,
+                    operation="embedding_generation",
+                    metadata={"batch_size": len(texts), "real_api": True}
+                )
+                logger.info(f"💰 Billing Embed registrado: ~{int(estimated_tokens)} tokens ({len(texts)} textos)")
+            return embeddings
+        
+        except CircuitOpenError as e:
+            if not e.degraded:
+                raise
+            logger.warning(f"⚡ {str(e)}, usando simulación")
+        except DeadlineExceeded as e:
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+        except SaptivaAPIError as e:
+            logger.warning(f"⚠️ Saptiva Embed HTTP {e.status}: {e.body[:200]}, usando simulación")
+        except Exception as e:
+            logger.warning(f"⚠️ Saptiva Embed no disponible ({str(e)}), usando simulación para demo")
+        return [self._simulate_embedding() for _ in texts]
+    
+    async def _post_embedding(self, text: str, payload: Dict[str, Any]) -> List[float]:
+        """
+        POST a Saptiva Embed con fallback a simulación
+        """
         try:
             logger.info("🔍 Intentando generar embedding con Saptiva Embed...")
             
-            payload = {
-                "model": "Saptiva Embed",
-                "prompt": text
-            }
-            
-            # Usar SSL context moderno configurado
-            connector = aiohttp.TCPConnector(
-                ssl=self.ssl_context,
-                limit=100,
-                limit_per_host=30,
-                ttl_dns_cache=300,
-                use_dns_cache=True,
+            # Idempotente: reintentos y hedging contra la cola de latencia
+            result = await self.http_client.post_json(
+                "Saptiva Embed",
+                self.embed_url,
+                self.headers,
+                payload,
+                timeout=5,
+                idempotent=True,
+                endpoint="embed"
             )
-            
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.post(
-                    self.embed_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=5)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        embeddings = result.get("embeddings", [])
-                        if embeddings:
-                            logger.info("✅ Saptiva Embed: Embedding REAL generado exitosamente")
-                            
-                            # Registrar billing para Saptiva Embed
-                            if self.billing_service:
-                                # Estimar tokens para embedding (aproximadamente longitud del texto)
-                                estimated_tokens = len(text.split()) * 1.3  # Factor de conversión aproximado
-                                self.billing_service.log_api_call(
-                                    model="Saptiva Embed",
-                                    input_tokens=int(estimated_tokens),
-                                    output_tokens=0,  # Embeddings no tienen output tokens
-                                    operation="embedding_generation",
-                                    metadata={"text_length": len(text), "real_api": True}
-                                )
-                                logger.info(f"💰 Billing Embed registrado: ~{int(estimated_tokens)} tokens")
-                            
-                            return embeddings
-                        else:
-                            logger.warning(f"⚠️ Saptiva Embed: Respuesta vacía, usando simulación. Response: {result}")
-                            return self._simulate_embedding()
-                    else:
-                        error_text = await response.text()
-                        logger.warning(f"⚠️ Saptiva Embed HTTP {response.status}: {error_text[:200]}, usando simulación")
-                        return self._simulate_embedding()
-                        
+            embeddings = result.get("embeddings", [])
+            if embeddings:
+                logger.info("✅ Saptiva Embed: Embedding REAL generado exitosamente")
+                
+                # Registrar billing para Saptiva Embed
+                if self.billing_service:
+                    # Estimar tokens para embedding (aproximadamente longitud del texto)
+                    estimated_tokens = len(text.split()) * 1.3  # Factor de conversión aproximado
+                    self.billing_service.log_api_call(
+                        model="Saptiva Embed",
+                        input_tokens=int(estimated_tokens),
+                        output_tokens=0,  # Embeddings no tienen output tokens
+                        operation="embedding_generation",
+                        metadata={"text_length": len(text), "real_api": True}
+                    )
+                    logger.info(f"💰 Billing Embed registrado: ~{int(estimated_tokens)} tokens")
+                
+                return embeddings
+            else:
+                logger.warning(f"⚠️ Saptiva Embed: Respuesta vacía, usando simulación. Response: {result}")
+                return self._simulate_embedding()
+                
+        except CircuitOpenError as e:
+            if not e.degraded:
+                raise
+            logger.warning(f"⚡ {str(e)}, usando simulación")
+            return self._simulate_embedding()
+        except DeadlineExceeded as e:
+            # Sin presupuesto para la llamada real: respuesta degradada inmediata
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+            return self._simulate_embedding()
+        except SaptivaAPIError as e:
+            logger.warning(f"⚠️ Saptiva Embed HTTP {e.status}: {e.body[:200]}, usando simulación")
+            return self._simulate_embedding()
         except Exception as e:
             logger.warning(f"⚠️ Saptiva Embed no disponible ({str(e)}), usando simulación para demo")
             return self._simulate_embedding()
@@ -189,13 +291,15 @@ class SaptivaRAGService:
         try:
             logger.info(f"🔍 RAG: Búsqueda semántica para: {query}")
             
-            # Generar embedding de la consulta
-            query_embedding = await self.generate_embedding(query)
-            
-            # Generar embeddings para documentos si no existen (simulado)
-            for doc in self.knowledge_base:
-                if doc["embedding"] is None:
-                    doc["embedding"] = await self.generate_embedding(doc["content"])
+            # Embedding de la consulta y de los documentos que aún no lo tienen,
+            # concurrentes para que viajen en un solo lote
+            pending_docs = [doc for doc in self.knowledge_base if doc["embedding"] is None]
+            query_embedding, *doc_embeddings = await asyncio.gather(
+                self.generate_embedding(query),
+                *(self.generate_embedding(doc["content"]) for doc in pending_docs)
+            )
+            for doc, embedding in zip(pending_docs, doc_embeddings):
+                doc["embedding"] = embedding
             
             # Calcular similitudes
             similarities = []
@@ -245,44 +349,13 @@ class SaptivaRAGService:
                     "confidence": 0.0
                 }
             
-            # Construir contexto para Saptiva Cortex
-            context = "\n\n".join([
-                f"**{doc['source']} - {doc['title']}**\n{doc['content']}"
-                for doc in relevant_docs
-            ])
-            
             # Generar respuesta con Saptiva Cortex
-            messages = [
-                {
-                    "role": "system",
-                    "content": """Eres un experto en normativa bancaria mexicana. Responde preguntas 
-                    sobre KYC, AML y compliance basándote ÚNICAMENTE en el contexto proporcionado. 
-                    Si la información no está en el contexto, indícalo claramente."""
-                },
-                {
-                    "role": "user",
-                    "content": f"""Contexto normativo:
-{context}
-
-Pregunta: {question}
-
-Proporciona una respuesta precisa basada en la normativa mexicana citada."""
-                }
-            ]
-            
-            # Llamar a Saptiva Cortex
+            messages = self._rag_messages(question, relevant_docs)
             response = await self._call_saptiva_cortex(messages)
             
             return {
                 "answer": response.get("content", "Error generando respuesta"),
-                "sources": [
-                    {
-                        "source": doc["source"],
-                        "title": doc["title"],
-                        "similarity": doc["similarity_score"]
-                    }
-                    for doc in relevant_docs
-                ],
+                "sources": self._rag_sources(relevant_docs),
                 "confidence": sum(doc["similarity_score"] for doc in relevant_docs) / len(relevant_docs),
                 "model_used": "Saptiva Cortex + Saptiva Embed",
                 "rag_enabled": True
@@ -296,85 +369,304 @@ Proporciona una respuesta precisa basada en la normativa mexicana citada."""
                 "confidence": 0.0
             }
     
+    async def stream_rag_query(self, question: str, context_type: str = "kyc_general") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Consulta RAG con la respuesta de Saptiva Cortex en streaming.
+        Eventos: sources -> token* -> done (mismo contenido que rag_query)
+        """
+        logger.info(f"🧠 RAG Query (stream): {question}")
+        
+        relevant_docs = await self.semantic_search(question, top_k=3)
+        if not relevant_docs:
+            yield {
+                "event": "done",
+                "answer": "No se encontró información relevante en la base de conocimiento.",
+                "sources": [],
+                "confidence": 0.0
+            }
+            return
+        
+        sources = self._rag_sources(relevant_docs)
+        confidence = sum(doc["similarity_score"] for doc in relevant_docs) / len(relevant_docs)
+        yield {"event": "sources", "sources": sources, "confidence": confidence}
+        
+        answer_parts = []
+        completion = {}
+        async for event in self._stream_saptiva_cortex(self._rag_messages(question, relevant_docs)):
+            if event["event"] == "token":
+                answer_parts.append(event["content"])
+                yield event
+            else:
+                completion = event
+        
+        yield {
+            "event": "done",
+            "answer": "".join(answer_parts) or "Error generando respuesta",
+            "sources": sources,
+            "confidence": confidence,
+            "model_used": "Saptiva Cortex + Saptiva Embed",
+            "rag_enabled": True,
+            "real_api": completion.get("real_api", False),
+            "usage": completion.get("usage", {})
+        }
+    
+    def _rag_messages(self, question: str, relevant_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Mensajes para Saptiva Cortex con el contexto normativo recuperado"""
+        context = "\n\n".join([
+            f"**{doc['source']} - {doc['title']}**\n{doc['content']}"
+            for doc in relevant_docs
+        ])
+        
+        return [
+            {
+                "role": "system",
+                "content": """Eres un experto en normativa bancaria mexicana. Responde preguntas 
+                sobre KYC, AML y compliance basándote ÚNICAMENTE en el contexto proporcionado. 
+                Si la información no está en el contexto, indícalo claramente."""
+            },
+            {
+                "role": "user",
+                "content": f"""Contexto normativo:
+{context}
+
+Pregunta: {question}
+
+Proporciona una respuesta precisa basada en la normativa mexicana citada."""
+            }
+        ]
+    
+    def _rag_sources(self, relevant_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "source": doc["source"],
+                "title": doc["title"],
+                "similarity": doc["similarity_score"]
+            }
+            for doc in relevant_docs
+        ]
+    
+    def _cortex_payload(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "model": "Saptiva Cortex",
+            "messages": messages,
+            "max_tokens": 500,
+            "temperature": 0.3,
+            "top_p": 0.9
+        }
+    
     async def _call_saptiva_cortex(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """
         Llama a Saptiva Cortex para generación (con fallback para demo)
         """
+        payload = self._cortex_payload(messages)
+        
+        # Respuesta cacheada para consultas repetidas (no consume tokens)
+        cache_key = None
+        if self.completion_cache.is_cacheable(payload):
+            cache_key = self.completion_cache.make_key(payload)
+            cached = await self.completion_cache.get(cache_key, "Saptiva Cortex")
+            if cached is not None:
+                logger.info("⚡ Saptiva Cortex: respuesta desde cache")
+                return cached
+        
+        # Peticiones idénticas en vuelo comparten una sola llamada upstream
+        try:
+            return await self.single_flight.do(
+                request_key(self.chat_url, payload),
+                lambda: self._post_cortex(messages, payload, cache_key)
+            )
+        except DeadlineExceeded as e:
+            # Se agotó el presupuesto de este llamador esperando la llamada compartida
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+            return self._simulate_cortex_response(messages)
+    
+    async def _post_cortex(self,
+                           messages: List[Dict[str, str]],
+                           payload: Dict[str, Any],
+                           cache_key: Optional[str]) -> Dict[str, Any]:
+        """
+        POST a Saptiva Cortex con fallback a simulación
+        """
         try:
             logger.info("🧠 Intentando conexión con Saptiva Cortex...")
             
-            payload = {
-                "model": "Saptiva Cortex",
-                "messages": messages,
-                "max_tokens": 500,
-                "temperature": 0.3,
-                "top_p": 0.9
-            }
-            
-            # Usar SSL context moderno configurado
-            connector = aiohttp.TCPConnector(
-                ssl=self.ssl_context,
-                limit=100,
-                limit_per_host=30,
-                ttl_dns_cache=300,
-                use_dns_cache=True,
+            # Pool compartido + limitador por modelo + reintentos con backoff
+            result = await self.http_client.post_json(
+                "Saptiva Cortex",
+                self.chat_url,
+                self.headers,
+                payload,
+                timeout=10
             )
-            
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.post(
-                    self.chat_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        message = result.get("choices", [{}])[0].get("message", {})
-                        content = message.get("content", "")
-                        reasoning_content = message.get("reasoning_content", "")
-                        
-                        # Usar reasoning_content si content está vacío
-                        final_content = content if content else reasoning_content
-                        
-                        if final_content:
-                            logger.info("✅ Saptiva Cortex: Respuesta REAL recibida")
-                            
-                            # Registrar billing para Saptiva Cortex
-                            if self.billing_service:
-                                usage = result.get("usage", {})
-                                input_tokens = usage.get("prompt_tokens", 0)
-                                output_tokens = usage.get("completion_tokens", 0)
-                                
-                                if input_tokens > 0 or output_tokens > 0:
-                                    self.billing_service.log_api_call(
-                                        model="Saptiva Cortex",
-                                        input_tokens=input_tokens,
-                                        output_tokens=output_tokens,
-                                        operation="rag_generation",
-                                        metadata={"real_api": True, "has_reasoning": bool(reasoning_content)}
-                                    )
-                                    logger.info(f"💰 Billing Cortex registrado: {input_tokens}+{output_tokens} tokens")
-                            
-                            return {
-                                "content": final_content,
-                                "model": "Saptiva Cortex",
-                                "real_api": True,
-                                "has_reasoning": bool(reasoning_content)
-                            }
-                        else:
-                            logger.warning(f"⚠️ Saptiva Cortex: Respuesta completamente vacía, usando simulación. Response: {result}")
-                            return self._simulate_cortex_response(messages)
-                    else:
-                        error_text = await response.text()
-                        logger.warning(f"⚠️ Saptiva Cortex HTTP {response.status}: {error_text[:200]}, usando simulación")
-                        return self._simulate_cortex_response(messages)
-                        
+            message = result.get("choices", [{}])[0].get("message", {})
+            content = message.get("content", "")
+            reasoning_content = message.get("reasoning_content", "")
+            
+            # Usar reasoning_content si content está vacío
+            final_content = content if content else reasoning_content
+            
+            if final_content:
+                logger.info("✅ Saptiva Cortex: Respuesta REAL recibida")
+                
+                # Registrar billing para Saptiva Cortex
+                if self.billing_service:
+                    usage = result.get("usage", {})
+                    input_tokens = usage.get("prompt_tokens", 0)
+                    output_tokens = usage.get("completion_tokens", 0)
+                    
+                    if input_tokens > 0 or output_tokens > 0:
+                        self.billing_service.log_api_call(
+                            model="Saptiva Cortex",
+                            input_tokens=input_tokens,
+                            output_tokens=output_tokens,
+                            operation="rag_generation",
+                            metadata={"real_api": True, "has_reasoning": bool(reasoning_content)}
+                        )
+                        logger.info(f"💰 Billing Cortex registrado: {input_tokens}+{output_tokens} tokens")
+                
+                cortex_response = {
+                    "content": final_content,
+                    "model": "Saptiva Cortex",
+                    "real_api": True,
+                    "has_reasoning": bool(reasoning_content)
+                }
+                if cache_key:
+                    await self.completion_cache.set(cache_key, cortex_response)
+                
+                return cortex_response
+            else:
+                logger.warning(f"⚠️ Saptiva Cortex: Respuesta completamente vacía, usando simulación. Response: {result}")
+                return self._simulate_cortex_response(messages)
+                
+        except CircuitOpenError as e:
+            if not e.degraded:
+                raise
+            logger.warning(f"⚡ {str(e)}, usando simulación")
+            return self._simulate_cortex_response(messages)
+        except DeadlineExceeded as e:
+            # Sin presupuesto para la llamada real: respuesta degradada inmediata
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+            return self._simulate_cortex_response(messages)
+        except SaptivaAPIError as e:
+            logger.warning(f"⚠️ Saptiva Cortex HTTP {e.status}: {e.body[:200]}, usando simulación")
+            return self._simulate_cortex_response(messages)
         except Exception as e:
             error_msg = str(e) if str(e) else type(e).__name__
             logger.warning(f"⚠️ Saptiva Cortex no disponible ({error_msg}), usando simulación para demo")
             logger.debug(f"Error completo: {repr(e)}")
             return self._simulate_cortex_response(messages)
     
+    async def _stream_saptiva_cortex(self, messages: List[Dict[str, str]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Saptiva Cortex en streaming (SSE): eventos token con cada delta y un evento
+        completion al final. Billing y cache se registran cuando el stream termina
+        """
+        payload = self._cortex_payload(messages)
+        
+        cache_key = None
+        if self.completion_cache.is_cacheable(payload):
+            cache_key = self.completion_cache.make_key(payload)
+            cached = await self.completion_cache.get(cache_key, "Saptiva Cortex")
+            if cached is not None:
+                logger.info("⚡ Saptiva Cortex (stream): respuesta desde cache")
+                yield {"event": "token", "content": cached["content"]}
+                yield {"event": "completion", **cached}
+                return
+        
+        content_parts = []
+        reasoning_parts = []
+        usage = {}
+        interrupted = False
+        try:
+            logger.info("🧠 Intentando streaming con Saptiva Cortex...")
+            async for chunk in self.http_client.stream_sse(
+                "Saptiva Cortex",
+                self.chat_url,
+                self.headers,
+                {**payload, "stream_options": {"include_usage": True}},
+                timeout=30
+            ):
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices", []):
+                    delta = choice.get("delta", {})
+                    if delta.get("content"):
+                        content_parts.append(delta["content"])
+                        yield {"event": "token", "content": delta["content"]}
+                    if delta.get("reasoning_content"):
+                        reasoning_parts.append(delta["reasoning_content"])
+        except Exception as e:
+            if isinstance(e, CircuitOpenError) and not e.degraded:
+                raise
+            if not content_parts:
+                error_msg = str(e) if str(e) else type(e).__name__
+                logger.warning(f"⚠️ Saptiva Cortex stream no disponible ({error_msg}), usando simulación para demo")
+                simulated = self._simulate_cortex_response(messages)
+                yield {"event": "token", "content": simulated["content"]}
+                yield {"event": "completion", **simulated}
+                return
+            # Stream cortado a la mitad: se entrega lo recibido, marcado como truncado (no se cachea)
+            interrupted = True
+            logger.warning(f"⚠️ Saptiva Cortex stream interrumpido tras {len(content_parts)} deltas ({str(e)})")
+        
+        content = "".join(content_parts)
+        reasoning_content = "".join(reasoning_parts)
+        if not content and reasoning_content:
+            # Igual que en la llamada normal: usar reasoning_content si content está vacío
+            yield {"event": "token", "content": reasoning_content}
+        final_content = content or reasoning_content
+        
+        if not final_content:
+            logger.warning("⚠️ Saptiva Cortex stream vacío, usando simulación")
+            simulated = self._simulate_cortex_response(messages)
+            yield {"event": "token", "content": simulated["content"]}
+            yield {"event": "completion", **simulated}
+            return
+        
+        if interrupted:
+            logger.warning(f"✂️ Saptiva Cortex: stream REAL truncado ({len(content_parts)} deltas)")
+        else:
+            logger.info(f"✅ Saptiva Cortex: stream REAL completado ({len(content_parts)} deltas)")
+        
+        # Billing al cerrar el stream (estimado si el upstream no envió usage)
+        usage_estimated = not usage
+        if usage_estimated:
+            prompt_words = sum(len(message["content"].split()) for message in messages)
+            usage = {
+                "prompt_tokens": int(prompt_words * 1.3),
+                "completion_tokens": len(content_parts) + len(reasoning_parts)
+            }
+        if self.billing_service:
+            self.billing_service.log_api_call(
+                model="Saptiva Cortex",
+                input_tokens=usage.get("prompt_tokens", 0),
+                output_tokens=usage.get("completion_tokens", 0),
+                operation="rag_generation_stream",
+                metadata={
+                    "real_api": True,
+                    "streamed": True,
+                    "usage_estimated": usage_estimated,
+                    "has_reasoning": bool(reasoning_content),
+                    "truncated": interrupted
+                }
+            )
+            logger.info(
+                f"💰 Billing Cortex (stream) registrado: "
+                f"{usage.get('prompt_tokens', 0)}+{usage.get('completion_tokens', 0)} tokens"
+            )
+        
+        cortex_response = {
+            "content": final_content,
+            "model": "Saptiva Cortex",
+            "real_api": True,
+            "has_reasoning": bool(reasoning_content)
+        }
+        # Una respuesta truncada no debe servirse desde el cache como si estuviera completa
+        if cache_key and not interrupted:
+            await self.completion_cache.set(cache_key, cortex_response)
+        
+        yield {"event": "completion", **cortex_response, "usage": usage, "truncated": interrupted}
+    
     def _simulate_cortex_response(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
         """
         Simula respuesta de Saptiva Cortex para el demo
@@ -450,47 +742,9 @@ Proporciona una respuesta precisa basada en la normativa mexicana citada."""
         Valida cumplimiento normativo usando RAG
         """
         try:
-            # Construir consulta de compliance
-            query = f"""¿Cumple este proceso KYC con la normativa mexicana?
-            
-            Datos del proceso:
-            - Cliente validado: {kyc_data.get('identity_verified', False)}
-            - Score crediticio: {kyc_data.get('credit_score', 'N/A')}
-            - Listas de sanciones: {kyc_data.get('sanctions_clear', False)}
-            - Documentos validados: {', '.join(kyc_data.get('documents_validated', []))}
-            """
-            
             # Consulta RAG
-            rag_result = await self.rag_query(query, "compliance_validation")
-            
-            # Determinar cumplimiento basado en datos KYC y RAG
-            compliance_score = rag_result["confidence"]
-            
-            # Algoritmo mejorado de compliance
-            kyc_score = 0.0
-            if kyc_data.get('identity_verified', False):
-                kyc_score += 0.3
-            if kyc_data.get('credit_score', 0) >= 600:
-                kyc_score += 0.3
-            if kyc_data.get('sanctions_clear', False):
-                kyc_score += 0.2
-            if kyc_data.get('documents_validated', []):
-                kyc_score += 0.2
-            
-            # Combinar score KYC con RAG confidence
-            final_compliance_score = (kyc_score * 0.7) + (compliance_score * 0.3)
-            is_compliant = final_compliance_score > 0.6
-            
-            return {
-                "is_compliant": is_compliant,
-                "compliance_score": final_compliance_score,
-                "kyc_score": kyc_score,
-                "rag_confidence": compliance_score,
-                "rag_analysis": rag_result["answer"],
-                "regulatory_sources": rag_result["sources"],
-                "recommendations": self._generate_compliance_recommendations(kyc_data, rag_result),
-                "model_used": "Saptiva Cortex + Saptiva Embed + RAGster"
-            }
+            rag_result = await self.rag_query(self._compliance_query(kyc_data), "compliance_validation")
+            return self._compliance_result(kyc_data, rag_result)
             
         except Exception as e:
             logger.error(f"Error validando compliance: {str(e)}")
@@ -500,6 +754,58 @@ Proporciona una respuesta precisa basada en la normativa mexicana citada."""
                 "error": str(e)
             }
     
+    async def stream_kyc_compliance(self, kyc_data: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Validación de compliance con el análisis RAG en streaming; el evento done
+        trae el mismo resultado que validate_kyc_compliance
+        """
+        async for event in self.stream_rag_query(self._compliance_query(kyc_data), "compliance_validation"):
+            if event["event"] == "done":
+                yield {"event": "done", **self._compliance_result(kyc_data, event)}
+            else:
+                yield event
+    
+    def _compliance_query(self, kyc_data: Dict[str, Any]) -> str:
+        """Consulta de compliance construida a partir de los datos KYC"""
+        return f"""¿Cumple este proceso KYC con la normativa mexicana?
+            
+            Datos del proceso:
+            - Cliente validado: {kyc_data.get('identity_verified', False)}
+            - Score crediticio: {kyc_data.get('credit_score', 'N/A')}
+            - Listas de sanciones: {kyc_data.get('sanctions_clear', False)}
+            - Documentos validados: {', '.join(kyc_data.get('documents_validated', []))}
+            """
+    
+    def _compliance_result(self, kyc_data: Dict[str, Any], rag_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Determina cumplimiento combinando los datos KYC con la confianza del RAG"""
+        compliance_score = rag_result["confidence"]
+        
+        # Algoritmo mejorado de compliance
+        kyc_score = 0.0
+        if kyc_data.get('identity_verified', False):
+            kyc_score += 0.3
+        if kyc_data.get('credit_score', 0) >= 600:
+            kyc_score += 0.3
+        if kyc_data.get('sanctions_clear', False):
+            kyc_score += 0.2
+        if kyc_data.get('documents_validated', []):
+            kyc_score += 0.2
+        
+        # Combinar score KYC con RAG confidence
+        final_compliance_score = (kyc_score * 0.7) + (compliance_score * 0.3)
+        is_compliant = final_compliance_score > 0.6
+        
+        return {
+            "is_compliant": is_compliant,
+            "compliance_score": final_compliance_score,
+            "kyc_score": kyc_score,
+            "rag_confidence": compliance_score,
+            "rag_analysis": rag_result["answer"],
+            "regulatory_sources": rag_result["sources"],
+            "recommendations": self._generate_compliance_recommendations(kyc_data, rag_result),
+            "model_used": "Saptiva Cortex + Saptiva Embed + RAGster"
+        }
+    
     def _generate_compliance_recommendations(self, kyc_data: Dict[str, Any], rag_result: Dict[str, Any]) -> List[str]:
         """Genera recomendaciones de compliance"""
         recommendations = []
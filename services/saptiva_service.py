@@ -1,45 +1,81 @@
 import os
+import re
+import time
 from typing import Dict, Any, Optional
 import asyncio
 import logging
 import requests
 import json
-import aiohttp
-import ssl
-import certifi
 from .saptiva_tools import SaptivaKYCTools
 from .saptiva_rag import SaptivaRAGService
 from .saptiva_billing import SaptivaBillingService
+from .saptiva_cache import get_completion_cache
+from .saptiva_client import SaptivaAPIError, get_saptiva_client
+from .saptiva_breaker import CircuitOpenError
+from .deadline import DeadlineExceeded
+from .single_flight import get_single_flight, request_key
+from .model_cascade import get_model_cascade, ESCALATE, CLEAR_PASS
+from .validation_service import ValidationService
 
 logger = logging.getLogger(__name__)
 
 class SaptivaService:
     """Servicio para integrar con Saptiva API"""
     
-    def __init__(self):
+    def __init__(self, http_client=None, completion_cache=None, single_flight=None, api_base_url: str = None):
         self.api_key = os.getenv("SAPTIVA_API_KEY")
         if not self.api_key:
             raise ValueError("SAPTIVA_API_KEY no encontrada en variables de entorno")
         
-        self.base_url = "https://api.saptiva.com/v1/chat/completions"  # URL real de Saptiva
-        self.embed_url = "https://api.saptiva.com/api/embed"  # URL para embeddings
+        # Host de la API (real por defecto; SAPTIVA_BASE_URL apunta a un mock local)
+        self.api_base_url = (api_base_url or os.getenv("SAPTIVA_BASE_URL", "https://api.saptiva.com")).rstrip("/")
+        self.base_url = f"{self.api_base_url}/v1/chat/completions"  # URL de chat completions
+        self.embed_url = f"{self.api_base_url}/api/embed"  # URL para embeddings
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
-        # Configurar SSL context moderno
-        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
-        self.ssl_context.check_hostname = True
-        self.ssl_context.verify_mode = ssl.CERT_REQUIRED
-        self.ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+        # Cliente HTTP compartido (pool keep-alive, limitador AIMD, reintentos)
+        self.http_client = http_client or get_saptiva_client()
+        
+        # Cache opt-in de completions deterministas
+        self.completion_cache = completion_cache or get_completion_cache()
+        
+        # Temperatura de las llamadas KYC: 0.7 como siempre; solo con el cache activo se baja
+        # (SAPTIVA_CACHE_KYC_TEMPERATURE) para que las respuestas queden bajo el umbral cacheable
+        if self.completion_cache.enabled:
+            self.kyc_temperature = float(os.getenv("SAPTIVA_CACHE_KYC_TEMPERATURE", "0.1"))
+        else:
+            self.kyc_temperature = 0.7
+        
+        # Coalescencia de peticiones duplicadas en vuelo
+        self.single_flight = single_flight or get_single_flight()
+        
+        # Cascada: Guard/KAL solo para casos dudosos según el score determinista
+        self.cascade = get_model_cascade()
+        self.validation_service = ValidationService()
+        
+        # Latencia observada por modelo (EWMA), inicializada con tiempos de referencia
+        self.model_latency = {
+            "Saptiva OCR": 0.5,
+            "Saptiva Guard": 0.8,
+            "Saptiva Ops": 1.5,
+            "Saptiva KAL": 0.8
+        }
         
         # Inicializar billing service primero
         self.billing_service = SaptivaBillingService()
         
         # Inicializar tools de KYC y RAG con billing service
         self.kyc_tools = SaptivaKYCTools()
-        self.rag_service = SaptivaRAGService(billing_service=self.billing_service)
+        self.rag_service = SaptivaRAGService(
+            billing_service=self.billing_service,
+            http_client=self.http_client,
+            completion_cache=self.completion_cache,
+            single_flight=self.single_flight,
+            api_base_url=self.api_base_url
+        )
     
     async def extract_document_data(self, file_content: bytes, document_type: str) -> Dict[str, Any]:
         """
@@ -107,6 +143,12 @@ class SaptivaService:
             logger.info(f"🔍 Saptiva AI analizando identidad y patrones de riesgo...")
             logger.info(f"🛡️ Consultando listas de sanciones globales con IA...")
             
+            # Screening local primero: Guard solo si el resultado es dudoso
+            screening = self._screen_identity(extracted_data)
+            route = self.cascade.route("identity", screening["score"])
+            if route != ESCALATE:
+                return self._screened_identity_result(screening, route)
+            
             # Llamada REAL a Saptiva Guard para validación de identidad
             customer_name = extracted_data.get("extracted_fields", {}).get("name", "Cliente")
             customer_id = extracted_data.get("extracted_fields", {}).get("id_number", "ID")
@@ -141,7 +183,9 @@ class SaptivaService:
                     "purpose": "Moderación y cumplimiento",
                     "pricing": {"input_tokens": "$0.02/M", "output_tokens": "$0.06/M"},
                     "best_for": "Moderación y cumplimiento",
-                    "use_case": "Protección de contenido, validación de incumplimiento legal"
+                    "use_case": "Protección de contenido, validación de incumplimiento legal",
+                    "screening_score": screening["score"],
+                    "escalated": True
                 }
             }
             
@@ -152,6 +196,53 @@ class SaptivaService:
             logger.error(f"❌ Error en validación Saptiva: {str(e)}")
             raise
     
+    def _screen_identity(self, identity_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Score determinista de identidad: nombre completo, CURP/RFC con formato válido y edad.
+        Tres checks dan cuatro scores posibles (0, 1/3, 2/3, 1); con la banda por defecto
+        [0.5, 0.9) solo 2/3 se escala a Guard, 3/3 pasa y 0-1/3 falla
+        """
+        fields = identity_data.get("extracted_fields", identity_data)
+        rules = self.validation_service.validation_rules
+        id_number = str(fields.get("id_number") or "").strip().upper()
+        checks = {
+            "full_name": len(str(fields.get("name") or "").split()) >= 2,
+            "id_format": bool(re.match(rules["curp"], id_number) or re.match(rules["rfc"], id_number)),
+            "age": self.validation_service._validate_age(fields.get("birth_date"))["valid"]
+        }
+        return {
+            "score": sum(checks.values()) / len(checks),
+            "checks": checks
+        }
+    
+    def _screened_identity_result(self, screening: Dict[str, Any], route: str) -> Dict[str, Any]:
+        """
+        Resultado de identidad decidido sin Saptiva Guard (fuera de la banda de incertidumbre)
+        """
+        passed = route == CLEAR_PASS
+        tier = self.cascade.tiers["identity"]
+        validation_result = {
+            "identity_verified": passed,
+            # El screening local no consulta listas: no se afirma nada sobre sanciones, PEP ni medios
+            "sanctions_check": "not_checked",
+            "pep_check": "not_checked",
+            "adverse_media": "not_checked",
+            "risk_score": 0.15 if passed else 0.85,
+            "validation_time": 0.0,
+            "saptiva_analysis": {
+                "ai_confidence": 0.94 if passed else screening["score"],
+                "fraud_indicators": [check for check, ok in screening["checks"].items() if not ok],
+                "identity_match": "high_confidence" if passed else "low_confidence",
+                "model_used": "Screening local",
+                "screening_score": screening["score"],
+                "screening_checks": screening["checks"],
+                "escalated": False,
+                "cascade_band": [tier.low, tier.high]
+            }
+        }
+        logger.info(f"✅ Identidad resuelta sin {tier.model}: {'verificada' if passed else 'no verificada'} (score {screening['score']:.2f})")
+        return validation_result
+    
     async def check_credit_bureau(self, id_number: str) -> Dict[str, Any]:
         """
         Consulta buró de crédito potenciada por Saptiva AI
@@ -208,6 +299,10 @@ class SaptivaService:
                                       personal_info: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Calcula evaluación de riesgo final usando Saptiva AI
+        
+        La decisión (aprobación y nivel de riesgo) la toma siempre la fórmula determinista.
+        Cuando el score cae en la banda, Saptiva KAL aporta un análisis consultivo
+        (`kal_analysis`, `kal_role: advisory`) para la revisión, sin cambiar la decisión
         """
         try:
             logger.info(f"🎯 Saptiva AI ejecutando evaluación de riesgo integral...")
@@ -226,6 +321,11 @@ class SaptivaService:
             
             final_score = base_score + identity_factor + ai_factor
             
+            # Cascada: KAL solo cuando el score combinado cae en la banda de incertidumbre
+            route = self.cascade.route("risk", final_score)
+            escalated = route == ESCALATE
+            decider = "Saptiva KAL" if escalated else "Screening local"
+            
             # Llamada REAL a Saptiva KAL para decisión final
             messages = [
                 {
@@ -243,9 +343,11 @@ class SaptivaService:
                 }
             ]
             
-            # Usar Saptiva KAL real para decisión
-            saptiva_result = await self._call_saptiva_api("Saptiva KAL", messages, 150)
-            kal_response = saptiva_result.get("choices", [{}])[0].get("message", {}).get("content", "")
+            # Saptiva KAL (solo en la banda): análisis consultivo, no modifica la decisión
+            kal_response = ""
+            if escalated:
+                saptiva_result = await self._call_saptiva_api("Saptiva KAL", messages, 150)
+                kal_response = saptiva_result.get("choices", [{}])[0].get("message", {}).get("content", "")
             
             # Decisión inteligente con Saptiva KAL - Ajustada por perfil del cliente
             customer_name = personal_info.get("name", "").lower() if personal_info else ""
@@ -267,31 +369,31 @@ class SaptivaService:
                 final_score = max(0.72, final_score - 0.08)
                 risk_level = "medium"
                 approved = True
-                decision_reason = "Saptiva KAL: Cliente joven, aprobación condicional con límites"
+                decision_reason = f"{decider}: Cliente joven, aprobación condicional con límites"
             elif "roberto" in customer_name and "sanchez" in customer_name:
                 # Cliente con perfil de riesgo elevado
                 final_score = max(0.68, final_score - 0.12)
                 risk_level = "high"
                 approved = False
-                decision_reason = "Saptiva KAL: Perfil de alto riesgo, requiere revisión manual"
+                decision_reason = f"{decider}: Perfil de alto riesgo, requiere revisión manual"
             elif "carlos" in customer_name:
                 # Cliente estándar - riesgo medio-bajo
                 final_score = max(0.78, final_score - 0.02)
                 risk_level = "medium"
                 approved = True
-                decision_reason = "Saptiva KAL: Perfil estándar, aprobación con monitoreo"
+                decision_reason = f"{decider}: Perfil estándar, aprobación con monitoreo"
             elif final_score >= 0.8:
                 risk_level = "low"
                 approved = True
-                decision_reason = "Saptiva KAL: Perfil excelente, aprobación automática"
+                decision_reason = f"{decider}: Perfil excelente, aprobación automática"
             elif final_score >= 0.6:
                 risk_level = "medium"
                 approved = True
-                decision_reason = "Saptiva KAL: Perfil aceptable, aprobación con monitoreo"
+                decision_reason = f"{decider}: Perfil aceptable, aprobación con monitoreo"
             else:
                 risk_level = "high"
                 approved = False
-                decision_reason = "Saptiva KAL: Riesgo elevado detectado, requiere revisión manual"
+                decision_reason = f"{decider}: Riesgo elevado detectado, requiere revisión manual"
             
             assessment = {
                 "final_score": final_score,
@@ -306,7 +408,7 @@ class SaptivaService:
                     "combined_assessment": final_score
                 },
                 "saptiva_decision": {
-                    "model_used": "Saptiva KAL",
+                    "model_used": "Saptiva KAL" if escalated else "Screening local",
                     "model_base": "Mistral Small 3.2 24B Instruct 2506",
                     "api_endpoint": "https://api.saptiva.com/v1/chat/completions",
                     "processing_time": 0.8,
@@ -314,7 +416,10 @@ class SaptivaService:
                     "features_analyzed": ["identity", "credit", "behavioral", "predictive"],
                     "recommendation": "approve" if approved else "reject",
                     "kal_analysis": kal_response[:200] + "..." if len(kal_response) > 200 else kal_response,
-                    "real_api_call": True,
+                    "kal_role": "advisory",
+                    "real_api_call": escalated,
+                    "escalated": escalated,
+                    "cascade_band": [self.cascade.tiers["risk"].low, self.cascade.tiers["risk"].high],
                     "purpose": "Contexto y normatividad de México",
                     "pricing": {"input_tokens": "$0.2/M", "output_tokens": "$0.6/M"},
                     "best_for": "Contexto y normatividad de México",
@@ -331,66 +436,125 @@ class SaptivaService:
             logger.error(f"❌ Error en evaluación Saptiva: {str(e)}")
             raise
     
-    async def _call_saptiva_api(self, model: str, messages: list, max_tokens: int = 256) -> Dict[str, Any]:
+    async def _call_saptiva_api(self,
+                                model: str,
+                                messages: list,
+                                max_tokens: int = 256,
+                                temperature: Optional[float] = None) -> Dict[str, Any]:
         """
         Hace una llamada real a la API de Saptiva
+        
+        Por defecto usa la temperatura KYC (0.7; baja solo con el cache de completions activo).
         """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": self.kyc_temperature if temperature is None else temperature,
+            "top_p": 0.95
+        }
+        
+        # Respuesta cacheada para llamadas deterministas (no consume tokens)
+        cache_key = None
+        if self.completion_cache.is_cacheable(payload):
+            cache_key = self.completion_cache.make_key(payload)
+            cached = await self.completion_cache.get(cache_key, model)
+            if cached is not None:
+                logger.info(f"⚡ Saptiva cache hit: {model}")
+                return cached
+        
+        # Peticiones idénticas en vuelo comparten una sola llamada upstream
         try:
-            payload = {
-                "model": model,
-                "messages": messages,
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 0.95
-            }
-            
-            # Configurar connector con SSL moderno
-            connector = aiohttp.TCPConnector(
-                ssl=self.ssl_context,
-                limit=100,
-                limit_per_host=30,
-                ttl_dns_cache=300,
-                use_dns_cache=True,
+            return await self.single_flight.do(
+                request_key(self.base_url, payload),
+                lambda: self._post_chat_completion(model, messages, payload, cache_key)
             )
-            
-            async with aiohttp.ClientSession(connector=connector) as session:
-                async with session.post(
-                    self.base_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info(f"✅ Saptiva API call successful: {model}")
-                        
-                        # Registrar billing automáticamente para llamadas reales
-                        usage = result.get("usage", {})
-                        if usage:
-                            input_tokens = usage.get("prompt_tokens", 0)
-                            output_tokens = usage.get("completion_tokens", 0)
-                            
-                            self.billing_service.log_api_call(
-                                model=model,
-                                input_tokens=input_tokens,
-                                output_tokens=output_tokens,
-                                operation="real_api_call",
-                                metadata={"api_endpoint": self.base_url, "real_api": True}
-                            )
-                            logger.info(f"💰 Billing registrado: {model} - {input_tokens}+{output_tokens} tokens")
-                        
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Saptiva API error {response.status}: {error_text}")
-                        # Fallback a simulación si la API falla
-                        return self._simulate_api_response(model, messages)
-                        
+        except DeadlineExceeded as e:
+            # Se agotó el presupuesto de este llamador esperando la llamada compartida
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+            return self._simulate_api_response(model, messages)
+    
+    async def _post_chat_completion(self,
+                                    model: str,
+                                    messages: list,
+                                    payload: Dict[str, Any],
+                                    cache_key: Optional[str]) -> Dict[str, Any]:
+        """
+        POST a chat completions con fallback a simulación
+        """
+        try:
+            started = time.monotonic()
+            # Pool compartido + limitador por modelo + reintentos con backoff
+            result = await self.http_client.post_json(
+                model,
+                self.base_url,
+                self.headers,
+                payload,
+                timeout=30
+            )
+            self._record_latency(model, time.monotonic() - started)
+            logger.info(f"✅ Saptiva API call successful: {model}")
+            
+            # Registrar billing automáticamente para llamadas reales
+            usage = result.get("usage", {})
+            if usage:
+                input_tokens = usage.get("prompt_tokens", 0)
+                output_tokens = usage.get("completion_tokens", 0)
+                
+                self.billing_service.log_api_call(
+                    model=model,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    operation="real_api_call",
+                    metadata={"api_endpoint": self.base_url, "real_api": True}
+                )
+                logger.info(f"💰 Billing registrado: {model} - {input_tokens}+{output_tokens} tokens")
+            
+            if cache_key:
+                await self.completion_cache.set(cache_key, result)
+            
+            return result
+            
+        except CircuitOpenError as e:
+            if not e.degraded:
+                raise
+            logger.warning(f"⚡ {str(e)}, usando simulación")
+            return self._simulate_api_response(model, messages)
+        except DeadlineExceeded as e:
+            # Sin presupuesto para la llamada real: respuesta degradada inmediata
+            logger.warning(f"⏱️ {str(e)}, usando simulación")
+            return self._simulate_api_response(model, messages)
+        except SaptivaAPIError as e:
+            logger.error(f"❌ Saptiva API error {e.status}: {e.body}")
+            # Fallback a simulación si la API falla
+            return self._simulate_api_response(model, messages)
         except Exception as e:
             logger.error(f"❌ Error calling Saptiva API: {str(e)}")
             # Fallback a simulación si hay error de conexión
             return self._simulate_api_response(model, messages)
     
+    def _record_latency(self, model: str, elapsed: float, alpha: float = 0.2):
+        """Actualiza la latencia promedio (EWMA) observada para un modelo"""
+        previous = self.model_latency.get(model)
+        self.model_latency[model] = elapsed if previous is None else (1 - alpha) * previous + alpha * elapsed
+    
+    def estimate_model_call(self, model: str, max_tokens: int) -> Dict[str, float]:
+        """
+        Estima latencia y costo de una llamada a un modelo (para reportar ahorros)
+        """
+        tokens = self.billing_service.get_average_tokens(model) or {
+            "input_tokens": 60,
+            "output_tokens": max_tokens
+        }
+        return {
+            "latency": self.model_latency.get(model, 1.0),
+            "cost": self.billing_service.estimate_call_cost(
+                model,
+                tokens["input_tokens"],
+                tokens["output_tokens"]
+            )
+        }
+    
     def _simulate_api_response(self, model: str, messages: list) -> Dict[str, Any]:
         """
         Simula una respuesta de la API de Saptiva para el demo
@@ -0,0 +1,165 @@
+"""
+Single-flight
+Las peticiones idénticas en vuelo comparten una sola ejecución (y un solo future)
+"""
+
+import json
+import asyncio
+import hashlib
+import logging
+import contextvars
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from .deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+def request_key(*parts: Any) -> str:
+    """Hash estable de las partes de una petición (URL, payload, ...)"""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+class SingleFlight:
+    """
+    Coalescencia de peticiones duplicadas en vuelo
+
+    La ejecución compartida corre en un contexto vacío con su propio deadline (no hereda el
+    del primer llamador). Dos modos según `deadline_slack`:
+    - None: se comparte siempre; el deadline de la ejecución se amplía al del llamador más
+      holgado y cada llamador espera como mucho su propio presupuesto (DeadlineExceeded).
+    - segundos: solo se comparte entre llamadores cuyos deadlines difieren a lo sumo eso;
+      los demás corren por separado con el suyo.
+    """
+
+    def __init__(self, name: str, deadline_slack: Optional[float] = None):
+        self.name = name
+        self.deadline_slack = deadline_slack
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._deadlines: Dict[str, Optional[Deadline]] = {}
+        # key -> {"count": llamadores esperando, "cancel": todos pidieron cancelar si se van}
+        self._waiters: Dict[str, Dict[str, Any]] = {}
+        self.metrics = {
+            "executions": 0,
+            "coalesced": 0,
+            "deadline_mismatch": 0,
+            "caller_deadline_exceeded": 0,
+            "abandoned": 0
+        }
+
+    async def do(self,
+                 key: str,
+                 factory: Callable[[], Awaitable[Any]],
+                 deadline: Optional[Deadline] = None,
+                 cancel_on_abandon: bool = False) -> Any:
+        """
+        Ejecuta `factory()` una sola vez por clave mientras haya una ejecución en vuelo
+        
+        `deadline` es el del llamador (por defecto, el de la petición en curso). Con
+        `cancel_on_abandon`, la ejecución se cancela si todos sus llamadores se cancelan
+        (y todos lo pidieron); si no, sigue en segundo plano
+        """
+        deadline = deadline or current_deadline()
+        task = self._inflight.get(key)
+        if (task is not None and self.deadline_slack is not None
+                and not self._deadline_matches(self._deadlines.get(key), deadline)):
+            self.metrics["deadline_mismatch"] += 1
+            self.metrics["executions"] += 1
+            logger.info(f"🔗 Single-flight {self.name}: deadline distinto al de la ejecución en vuelo, sin compartir")
+            return await factory()
+
+        if task is None:
+            flight_deadline = Deadline(deadline.remaining()) if deadline is not None else None
+            task = asyncio.get_running_loop().create_task(
+                self._run(factory, flight_deadline), context=contextvars.Context()
+            )
+            self._inflight[key] = task
+            self._deadlines[key] = flight_deadline
+            self._waiters[key] = {"count": 0, "cancel": cancel_on_abandon}
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.metrics["executions"] += 1
+        else:
+            self.metrics["coalesced"] += 1
+            if self.deadline_slack is None:
+                self._extend_deadline(key, deadline)
+            logger.info(f"🔗 Single-flight {self.name}: petición duplicada en vuelo, compartiendo resultado")
+
+        waiters = self._waiters[key]
+        waiters["count"] += 1
+        waiters["cancel"] = waiters["cancel"] and cancel_on_abandon
+        try:
+            # shield: si un llamador se cancela, la ejecución compartida sigue para los demás
+            if deadline is None or self.deadline_slack is not None:
+                return await asyncio.shield(task)
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout=deadline.remaining())
+            except asyncio.TimeoutError:
+                if task.done():
+                    raise
+                self.metrics["caller_deadline_exceeded"] += 1
+                raise DeadlineExceeded(self.name)
+        except asyncio.CancelledError:
+            if waiters["count"] == 1 and waiters["cancel"] and not task.done():
+                # Ya nadie espera el resultado: no seguir gastando llamadas ni escribiendo registros
+                self.metrics["abandoned"] += 1
+                logger.info(f"🔗 Single-flight {self.name}: sin llamadores, cancelando la ejecución")
+                task.cancel()
+            raise
+        finally:
+            waiters["count"] -= 1
+
+    async def _run(self, factory: Callable[[], Awaitable[Any]], deadline: Optional[Deadline]) -> Any:
+        with deadline_scope(deadline):
+            return await factory()
+
+    def _extend_deadline(self, key: str, deadline: Optional[Deadline]):
+        """El deadline de la ejecución cubre al llamador más holgado (None = sin límite)"""
+        flight_deadline = self._deadlines.get(key)
+        if flight_deadline is None:
+            return
+        flight_deadline.extend(float("inf") if deadline is None else deadline.expires_at)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._deadlines.pop(key, None)
+            self._waiters.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # marca la excepción como recuperada
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Espera las ejecuciones en vuelo hasta `timeout` segundos y cancela las que sigan;
+        devuelve cuántas se cancelaron
+        """
+        tasks = list(self._inflight.values())
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"🔗 Single-flight {self.name}: {len(pending)} ejecuciones canceladas tras {timeout}s")
+        return len(pending)
+
+    def _deadline_matches(self, running: Any, deadline: Any) -> bool:
+        if running is None or deadline is None:
+            return running is None and deadline is None
+        return abs(running.expires_at - deadline.expires_at) <= self.deadline_slack
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Ejecuciones reales vs peticiones coalescidas"""
+        return {
+            "name": self.name,
+            "in_flight": len(self._inflight),
+            **self.metrics
+        }
+
+_shared_single_flight: Optional[SingleFlight] = None
+
+def get_single_flight() -> SingleFlight:
+    """Single-flight compartido por los clientes de Saptiva"""
+    global _shared_single_flight
+    if _shared_single_flight is None:
+        _shared_single_flight = SingleFlight("saptiva")
+    return _shared_single_flight
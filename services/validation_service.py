@@ -1,5 +1,5 @@
 import re
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,7 +32,8 @@ class ValidationService:
                 "valid": True,
                 "errors": [],
                 "warnings": [],
-                "field_matches": {}
+                "field_matches": {},
+                "failed_checks": []
             }
             
             # Validar formato de campos
@@ -41,8 +42,19 @@ class ValidationService:
                     value = str(personal_info[field]).strip().upper() if field in ["curp", "rfc"] else str(personal_info[field]).strip()
                     if not re.match(pattern, value):
                         validation_results["errors"].append(f"Formato inválido para {field}: {value}")
+                        validation_results["failed_checks"].append(field)
                         validation_results["valid"] = False
             
+            # PersonalInfo lleva la CURP (o el RFC) en id_number
+            if "id_number" in personal_info:
+                id_check = self.id_number_format_check(personal_info["id_number"])
+                if id_check is not None and id_check not in validation_results["failed_checks"]:
+                    validation_results["errors"].append(
+                        f"Formato inválido para {id_check} (id_number): {personal_info['id_number']}"
+                    )
+                    validation_results["failed_checks"].append(id_check)
+                    validation_results["valid"] = False
+            
             # Comparar con datos extraídos de documentos
             if document_data and len(document_data) > 0:
                 extracted_fields = document_data[0].get("extracted_fields", {})
@@ -60,19 +72,28 @@ class ValidationService:
                             f"Baja similitud en nombres: {similarity:.2f}"
                         )
                 
-                # Validar coincidencia de ID
+                # Validar coincidencia de ID: solo es concluyente si el OCR leyó una CURP/RFC bien formada
                 if "id_number" in personal_info and "id_number" in extracted_fields:
-                    id_match = personal_info["id_number"] == extracted_fields["id_number"]
+                    id_match = (
+                        str(personal_info["id_number"]).strip().upper()
+                        == str(extracted_fields["id_number"]).strip().upper()
+                    )
                     validation_results["field_matches"]["id_number"] = id_match
                     
-                    if not id_match:
+                    if not id_match and self.id_number_format_check(extracted_fields["id_number"]) is None:
                         validation_results["errors"].append("Número de identificación no coincide")
+                        validation_results["failed_checks"].append("id_number_match")
                         validation_results["valid"] = False
+                    elif not id_match:
+                        validation_results["warnings"].append(
+                            "ID extraído del documento no es una CURP/RFC válida; coincidencia no verificada"
+                        )
             
             # Validaciones adicionales de negocio
             age_validation = self._validate_age(personal_info.get("birth_date"))
             if not age_validation["valid"]:
                 validation_results["errors"] += age_validation["errors"]
+                validation_results["failed_checks"].append("age")
                 validation_results["valid"] = False
             
             logger.info(f"Validación completada: {len(validation_results['errors'])} errores")
@@ -82,6 +103,16 @@ class ValidationService:
             logger.error(f"Error en validación: {str(e)}")
             raise
     
+    def id_number_format_check(self, id_number: Any) -> Optional[str]:
+        """
+        None si id_number es una CURP o un RFC con formato válido; si no, el check que falla
+        ("rfc" para 12-13 caracteres, "curp" en otro caso)
+        """
+        value = str(id_number or "").strip().upper()
+        if re.match(self.validation_rules["curp"], value) or re.match(self.validation_rules["rfc"], value):
+            return None
+        return "rfc" if len(value) in (12, 13) else "curp"
+    
     def _calculate_name_similarity(self, name1: str, name2: str) -> float:
         """Calcula similitud entre nombres usando algoritmo simple"""
         try:
@@ -0,0 +1,10 @@
+"""
+Configuración común de las pruebas: raíz del repo en sys.path y API key ficticia
+(las llamadas a Saptiva se reemplazan en cada prueba)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SAPTIVA_API_KEY", "test")
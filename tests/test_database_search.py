@@ -0,0 +1,192 @@
+"""
+Búsqueda de registros KYC: filtros por índice, rango de fechas y paginación por cursor
+"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from services.database_service import DatabaseService, decode_cursor, encode_cursor
+
+def record(customer_id, created_at, status="completed", **extra):
+    return {
+        "customer_id": customer_id,
+        "status": status,
+        "created_at": created_at,
+        "updated_at": created_at,
+        **extra
+    }
+
+def make_db(*records):
+    db = DatabaseService()
+    asyncio.run(db._commit_batch(list(records)))
+    return db
+
+def search(db, filters, **kwargs):
+    return asyncio.run(db.search_kyc_records(filters, **kwargs))
+
+def ids(results):
+    return [result["customer_id"] for result in results]
+
+def test_date_only_created_before_includes_the_whole_day():
+    db = make_db(
+        record("d-1", "2024-04-30T23:00:00"),
+        record("d-2", "2024-05-01T00:00:00"),
+        record("d-3", "2024-05-01T18:30:00.123456"),
+        record("d-4", "2024-05-02T00:00:00")
+    )
+    assert ids(search(db, {"created_before": "2024-05-01"})) == ["d-1", "d-2", "d-3"]
+    assert ids(search(db, {"created_after": "2024-05-01", "created_before": "2024-05-01"})) == ["d-2", "d-3"]
+    # Con hora explícita la cota se respeta tal cual
+    assert ids(search(db, {"created_before": "2024-05-01T12:00:00"})) == ["d-1", "d-2"]
+
+def test_small_result_without_created_at_does_not_break_sorting():
+    db = make_db(
+        *(record(f"bulk-{i:02d}", f"2024-05-01T00:00:{i:02d}") for i in range(40)),
+        record("p-1", "2024-05-03T00:00:00", status="pending"),
+        record("p-2", None, status="pending")
+    )
+    assert ids(search(db, {"status": "pending"})) == ["p-2", "p-1"]
+
+def test_update_keeps_original_created_at():
+    db = DatabaseService()
+
+    async def run():
+        await db.save_kyc_record({"customer_id": "u-1", "status": "pending"})
+        first = await db.get_kyc_record("u-1")
+        await asyncio.sleep(0.001)
+        await db.save_kyc_record({"customer_id": "u-1", "status": "completed"})
+        return first, await db.get_kyc_record("u-1")
+
+    first, second = asyncio.run(run())
+    assert second["created_at"] == first["created_at"]
+    assert second["updated_at"] > first["updated_at"]
+    assert db.created_index == [(first["created_at"], "u-1")]
+
+def brute_force(db, filters):
+    """Resultado esperado: recorrido completo de los registros, sin índices"""
+    matches = []
+    for customer_id in sorted(db.rows, key=lambda cid: (db.rows[cid].created_at or "", cid)):
+        full = db._load(db.rows[customer_id])
+        if all(
+            (full.get("risk_level") or (full.get("risk_assessment") or {}).get("risk_level")) == value
+            if key == "risk_level" else full.get(key) == value
+            for key, value in filters.items()
+        ):
+            matches.append(customer_id)
+    return matches
+
+def assert_indexes_consistent(db):
+    for field, index in db.indexes.items():
+        for value, customer_ids in index.items():
+            assert customer_ids, f"bucket vacío en {field}={value}"
+            for customer_id in customer_ids:
+                assert db.rows[customer_id].get(field) == value
+    assert db.created_index == sorted(
+        (row.created_at, row.customer_id) for row in db.rows.values() if row.created_at
+    )
+
+def test_secondary_indexes_match_full_scan_after_updates():
+    statuses = ("completed", "pending", "error")
+    levels = ("low", "medium", "high")
+    db = make_db(*(
+        record(
+            f"i-{i:02d}", f"2024-05-01T00:00:{i:02d}", status=statuses[i % 3],
+            approved=i % 2 == 0, risk_assessment={"risk_level": levels[i % 3]}
+        )
+        for i in range(30)
+    ))
+
+    async def mutate():
+        await db.update_kyc_status("i-00", "error")
+        await db.update_kyc_status("i-01", "completed", {"approved": True, "risk_assessment": {"risk_level": "low"}})
+        await db.save_kyc_record({"customer_id": "i-02", "status": "pending", "approved": False, "risk_level": "high"})
+    asyncio.run(mutate())
+
+    assert_indexes_consistent(db)
+    for filters in (
+        {"status": "completed"},
+        {"status": "error", "approved": False},
+        {"risk_level": "low", "approved": True},
+        {"risk_level": "high", "status": "pending"},
+        {"status": "completed", "approved": True, "risk_level": "medium"}
+    ):
+        assert ids(search(db, filters)) == brute_force(db, filters), filters
+    assert "i-00" not in db.indexes["status"]["completed"]
+    assert "i-01" in db.indexes["risk_level"]["low"]
+
+def test_unindexed_filter_keeps_records_without_the_field():
+    db = make_db(
+        record("r-1", "2024-05-01T00:00:01", channel="web"),
+        record("r-2", "2024-05-01T00:00:02", channel="branch"),
+        record("r-3", "2024-05-01T00:00:03")
+    )
+    assert ids(search(db, {"status": "completed", "channel": "web"})) == ["r-1", "r-3"]
+
+def paginate(db, filters, page_size):
+    """Recorre todas las páginas pasando por el cursor opaco, como un cliente"""
+    pages = []
+    cursor = None
+    while True:
+        after = decode_cursor(cursor) if cursor else None
+        rows = list(itertools.islice(db.iter_kyc_rows(filters, after), page_size))
+        if not rows:
+            return pages
+        pages.append([row.customer_id for row in rows])
+        cursor = encode_cursor(rows[-1])
+
+def test_cursor_pages_have_no_duplicates_or_gaps():
+    # Timestamps repetidos: el desempate por customer_id debe mantener el orden total
+    db = make_db(*(record(f"k-{i:04d}", f"2024-05-01T00:00:{i // 7:02d}", status=("completed", "pending")[i % 2])
+                   for i in range(2500)))
+    ordered = sorted(db.rows.values(), key=lambda row: (row.created_at, row.customer_id))
+    for filters, page_size, keep in (
+        ({}, 333, lambda row: True),
+        ({}, 1000, lambda row: True),
+        ({"status": "pending"}, 97, lambda row: row.status == "pending"),
+        # Pocos candidatos: se ordenan directamente en lugar de recorrer el índice
+        ({"created_before": "2024-05-01T00:00:05"}, 10, lambda row: row.created_at <= "2024-05-01T00:00:05")
+    ):
+        pages = paginate(db, filters, page_size)
+        flat = [customer_id for page in pages for customer_id in page]
+        assert flat == [row.customer_id for row in ordered if keep(row)], filters
+        assert len(set(flat)) == len(flat)
+        assert all(len(page) == page_size for page in pages[:-1])
+
+def test_cursor_is_stable_under_concurrent_inserts():
+    db = make_db(*(record(f"c-{i:02d}", f"2024-05-01T00:00:{i:02d}") for i in range(20)))
+    first = list(itertools.islice(db.iter_kyc_rows({}), 10))
+    cursor = encode_cursor(first[-1])
+    # Llegan registros antes y después de la posición del cursor
+    asyncio.run(db._commit_batch([
+        record("c-early", "2024-04-01T00:00:00"),
+        record("c-late", "2024-06-01T00:00:00")
+    ]))
+    rest = [row.customer_id for row in db.iter_kyc_rows({}, decode_cursor(cursor))]
+    assert [row.customer_id for row in first] + rest == [f"c-{i:02d}" for i in range(20)] + ["c-late"]
+
+def test_invalid_cursor_is_rejected():
+    for cursor in ("not-base64!", encode_cursor({"created_at": "x", "customer_id": None}), "W10"):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+def test_search_endpoint_round_trips_next_cursor(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    db = make_db(*(record(f"e-{i:02d}", f"2024-05-01T00:00:{i // 2:02d}") for i in range(25)))
+    monkeypatch.setattr(main, "db_service", db)
+    client = TestClient(main.app)
+
+    seen = []
+    params = {"limit": 10, "fields": "customer_id,status"}
+    while True:
+        page = client.get("/kyc/search", params=params).json()
+        assert all(set(result) == {"customer_id", "status"} for result in page["results"])
+        seen += [result["customer_id"] for result in page["results"]]
+        if not page["next_cursor"]:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert seen == [f"e-{i:02d}" for i in range(25)]
+    assert client.get("/kyc/search", params={"cursor": "%%%"}).status_code == 400
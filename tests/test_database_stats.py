@@ -0,0 +1,81 @@
+"""
+Estadísticas KYC incrementales y ventanas móviles
+"""
+
+import asyncio
+
+from services.database_service import DatabaseService, RollingWindow, record_outcome
+
+def recount(db):
+    """Estadísticas recalculadas recorriendo todos los registros"""
+    records = [db._load(row) for row in db.rows.values()]
+    approved = sum(1 for record in records if record.get("approved", False))
+    errors = sum(1 for record in records if record.get("status") == "error")
+    return {
+        "total_applications": len(records),
+        "approved": approved,
+        "rejected": len(records) - approved - errors,
+        "errors": errors
+    }
+
+def test_counters_match_full_recount_after_updates():
+    db = DatabaseService()
+
+    async def run():
+        for i in range(12):
+            await db.save_kyc_record({
+                "customer_id": f"s-{i}",
+                "status": "error" if i % 4 == 0 else "completed",
+                "approved": i % 3 == 0 and i % 4 != 0,
+                "processing_time": 1.0
+            })
+        # Sobrescritura, cambio de estado solo en la fila y cambio con detalles
+        await db.save_kyc_record({"customer_id": "s-1", "status": "completed", "approved": True})
+        await db.update_kyc_status("s-3", "error")
+        await db.update_kyc_status("s-0", "completed", {"approved": True})
+        await db.update_kyc_status("s-4", "completed")
+        await db.update_kyc_status("missing", "completed")
+        return await db.get_kyc_statistics()
+
+    stats = asyncio.run(run())
+    expected = recount(db)
+    for key, value in expected.items():
+        assert stats[key] == value, key
+    assert stats["approval_rate"] == expected["approved"] / expected["total_applications"] * 100
+
+def test_rolling_window_expires_old_buckets():
+    window = RollingWindow(span=60, resolution=10)
+    window.add("approved", 2.0, now=1000)
+    window.add("rejected", 4.0, now=1005)
+    window.add("errors", None, now=1030)
+
+    assert window.snapshot(1030) == {"approved": 1, "rejected": 1, "errors": 1, "avg_processing_time": 3.0}
+    # El bucket [1000, 1010) sale por completo a partir de 1070
+    assert window.snapshot(1069) == {"approved": 1, "rejected": 1, "errors": 1, "avg_processing_time": 3.0}
+    assert window.snapshot(1070) == {"approved": 0, "rejected": 0, "errors": 1, "avg_processing_time": 0}
+    assert window.snapshot(1100) == {"approved": 0, "rejected": 0, "errors": 0, "avg_processing_time": 0}
+    assert not window.buckets
+
+def test_rolling_window_totals_match_live_buckets():
+    window = RollingWindow(span=30, resolution=1)
+    outcomes = ("approved", "rejected", "errors")
+    for second in range(100):
+        window.add(outcomes[second % 3], second * 0.1, now=second + 0.5)
+        live = list(window.buckets)
+        assert window.totals[:3] == [sum(bucket[slot] for bucket in live) for slot in (1, 2, 3)]
+        assert window.totals[4] == sum(bucket[5] for bucket in live)
+    assert sum(window.totals[:3]) == 31
+
+def test_status_change_is_observed_once_in_windows():
+    db = DatabaseService()
+
+    async def run():
+        await db.save_kyc_record({"customer_id": "w-1", "status": "completed", "approved": False})
+        await db.update_kyc_status("w-1", "completed")  # mismo resultado: no se cuenta otra vez
+        await db.update_kyc_status("w-1", "error")
+        return await db.get_kyc_statistics()
+
+    stats = asyncio.run(run())
+    assert stats["windows"]["1m"]["rejected"] == 1
+    assert stats["windows"]["1m"]["errors"] == 1
+    assert record_outcome(db.rows["w-1"]) == "errors"
@@ -0,0 +1,83 @@
+"""
+Almacenamiento KYC: filas calientes (KYCRow) y registros completos comprimidos (BlobStore)
+"""
+
+import asyncio
+
+from services.database_service import ROW_FIELDS, BlobStore, DatabaseService, KYCRow
+
+def pipeline_record(customer_id, **changes):
+    record = {
+        "customer_id": customer_id,
+        "status": "completed",
+        "approved": True,
+        "processing_time": 2.5,
+        "created_at": "2024-05-01T10:00:00",
+        "updated_at": "2024-05-01T10:00:03",
+        "risk_assessment": {"risk_level": "low", "final_score": 0.82, "factors": ["curp", "ine"]},
+        "documents": [{"filename": "ine.jpg", "content": b"\xff\xd8\x00" * 50}],
+        "models": {"identity": "Saptiva Turbo", "risk": "Saptiva Cortex", "ocr": "Saptiva OCR"},
+        "notes": "Solicitud con acentos y ñ"
+    }
+    record.update(changes)
+    return record
+
+def test_row_takes_hot_fields_from_the_record():
+    row = KYCRow.from_record(pipeline_record("row-1"))
+    assert row.to_dict() == {
+        "customer_id": "row-1",
+        "status": "completed",
+        "approved": True,
+        "risk_level": "low",
+        "score": 0.82,
+        "processing_time": 2.5,
+        "created_at": "2024-05-01T10:00:00",
+        "updated_at": "2024-05-01T10:00:03"
+    }
+    assert set(row.to_dict()) == ROW_FIELDS
+    assert not hasattr(row, "__dict__")
+
+    changed = row.replace(status="error")
+    assert changed.status == "error" and row.status == "completed"
+    assert changed.get("missing", "default") == "default"
+
+def test_blob_round_trip_across_dictionary_versions():
+    blobs = BlobStore()
+    records = {
+        "b-small": {"customer_id": "b-small", "status": "error"},
+        "b-1": pipeline_record("b-1"),
+        "b-2": pipeline_record("b-2", notes="x" * 5000),
+        "b-3": pipeline_record("b-3", approved=False)
+    }
+    for key, record in records.items():
+        blobs.put(key, record)
+    # Más de una versión del diccionario: cada blob se decodifica con la suya
+    assert blobs.get_metrics()["dictionaries"] > 1
+    for key, record in records.items():
+        assert blobs.get(key) == record
+    assert blobs.get("missing") is None
+
+def test_blob_overwrite_tracks_size():
+    blobs = BlobStore()
+    blobs.put("b-1", pipeline_record("b-1", notes="x" * 3000))
+    blobs.put("b-1", pipeline_record("b-1"))
+    assert blobs.get("b-1") == pipeline_record("b-1")
+    assert blobs.nbytes == len(blobs._blobs["b-1"])
+    assert blobs.get_metrics()["blobs"] == 1
+
+def test_service_returns_decoded_copies():
+    db = DatabaseService()
+
+    async def run():
+        await db.save_kyc_record(pipeline_record("s-1"))
+        first = await db.get_kyc_record("s-1")
+        first["notes"] = "mutado por el llamador"
+        await db.update_kyc_status("s-1", "review")
+        return await db.get_kyc_record("s-1"), await db.get_kyc_row("s-1")
+
+    record, row = asyncio.run(run())
+    assert record["notes"] == "Solicitud con acentos y ñ"
+    assert record["documents"] == pipeline_record("s-1")["documents"]
+    # El cambio de estado sin detalles solo toca la fila, pero el registro lo refleja
+    assert record["status"] == row.status == "review"
+    assert record["updated_at"] == row.updated_at
@@ -0,0 +1,92 @@
+"""
+Deadlines por petición: presupuesto del endpoint/header y propagación hasta las llamadas a Saptiva
+"""
+
+import asyncio
+
+from services.deadline import Deadline, current_deadline, deadline_for, deadline_scope
+from services.kyc_orchestrator import KYCOrchestrator
+
+APPLICANT = {
+    "name": "Juan Perez Garcia",
+    "id_number": "PEGJ800101HDFRRN09",
+    "birth_date": "1980-01-01",
+    "address": "Calle 1, CDMX",
+    "phone": "5512345678",
+    "email": "juan@example.com"
+}
+
+def test_budget_from_endpoint_header_and_cap(monkeypatch):
+    monkeypatch.setenv("KYC_DEADLINE_MAX", "20")
+    monkeypatch.setenv("KYC_DEADLINE_DEFAULTS", '{"rag-query": 4}')
+    assert deadline_for("process-simple").budget == 15.0
+    assert deadline_for("rag-query").budget == 4.0
+    assert deadline_for("unknown-endpoint").budget == 30.0
+    assert deadline_for("process-simple", "3").budget == 3.0
+    assert deadline_for("process-simple", "500").budget == 20.0
+    # Header inválido o no positivo: se usa el default del endpoint
+    assert deadline_for("process-simple", "pronto").budget == 15.0
+    assert deadline_for("process-simple", "0").budget == 15.0
+
+def test_call_timeout_is_capped_by_remaining_budget():
+    deadline = Deadline(2.0)
+    assert deadline.timeout(30) <= 2.0
+    assert deadline.timeout(0.5) == 0.5
+    assert Deadline(0).expired
+    assert Deadline(0).timeout(30) == 0
+
+def test_scope_propagates_to_tasks_and_resets():
+    outer = Deadline(10)
+    inner = Deadline(1)
+
+    async def seen():
+        return current_deadline()
+
+    async def run():
+        with deadline_scope(outer):
+            task = asyncio.ensure_future(seen())
+            with deadline_scope(inner):
+                nested = await seen()
+            after_inner = current_deadline()
+            return await task, nested, after_inner
+
+    from_task, nested, after_inner = asyncio.run(run())
+    assert from_task is outer
+    assert nested is inner
+    assert after_inner is outer
+    assert current_deadline() is None
+
+def make_orchestrator(monkeypatch, delay):
+    monkeypatch.setenv("KYC_RESUME_MODE", "off")
+    monkeypatch.setenv("KYC_FAIL_FAST_POLICY", "off")
+    monkeypatch.setenv("KYC_DEADLINE_POLICY", "park")
+    orchestrator = KYCOrchestrator()
+    seen = []
+
+    async def slow_call(model, messages, max_tokens=256):
+        seen.append(current_deadline())
+        await asyncio.sleep(delay)
+        return {"choices": [{"message": {"content": "Sin indicadores de riesgo."}}]}
+
+    orchestrator.saptiva_service._call_saptiva_api = slow_call
+    return orchestrator, seen
+
+def test_deadline_reaches_every_saptiva_call(monkeypatch):
+    orchestrator, seen = make_orchestrator(monkeypatch, delay=0)
+    deadline = Deadline(10)
+    asyncio.run(orchestrator.process_kyc_application(
+        customer_id="dl-1", documents=[], personal_info=APPLICANT, deadline=deadline
+    ))
+    assert seen
+    assert all(call_deadline is deadline for call_deadline in seen)
+
+def test_exhausted_budget_parks_for_manual_review(monkeypatch):
+    orchestrator, seen = make_orchestrator(monkeypatch, delay=0.1)
+    result = asyncio.run(orchestrator.process_kyc_application(
+        customer_id="dl-2", documents=[], personal_info=APPLICANT, deadline=Deadline(0.05)
+    ))
+    assert result["status"] == "manual_review"
+    assert result["approved"] is False
+    assert result["risk_level"] == "unknown"
+    assert result["details"]["skipped_steps"]
+    assert result["details"]["deadline"]["expired"] is True
@@ -0,0 +1,75 @@
+"""
+Fail-fast tras la validación local (KYC_FAIL_FAST_POLICY)
+"""
+
+import asyncio
+
+import pytest
+
+from services.kyc_orchestrator import KYCOrchestrator
+from services.validation_service import ValidationService
+
+VALID_APPLICANT = {
+    "name": "Juan Perez Garcia",
+    "id_number": "PEGJ800101HDFRRN09",
+    "birth_date": "1980-01-01",
+    "address": "Calle 1, CDMX",
+    "phone": "5512345678",
+    "email": "juan@example.com"
+}
+
+def make_orchestrator(monkeypatch, policy="reject"):
+    monkeypatch.setenv("KYC_FAIL_FAST_POLICY", policy)
+    monkeypatch.delenv("KYC_FAIL_FAST_CHECKS", raising=False)
+    monkeypatch.setenv("KYC_RESUME_MODE", "off")
+    orchestrator = KYCOrchestrator()
+    calls = []
+
+    async def fake_call(model, messages, max_tokens=256):
+        calls.append(model)
+        return {"choices": [{"message": {"content": "Sin indicadores de riesgo."}}]}
+
+    orchestrator.saptiva_service._call_saptiva_api = fake_call
+    return orchestrator, calls
+
+def test_invalid_curp_in_id_number_short_circuits(monkeypatch):
+    orchestrator, calls = make_orchestrator(monkeypatch)
+    applicant = dict(VALID_APPLICANT, id_number="NOT-A-CURP")
+
+    result = asyncio.run(orchestrator.process_kyc_application(
+        customer_id="ff-invalid", documents=[], personal_info=applicant
+    ))
+
+    assert result["status"] == "rejected"
+    assert "curp" in result["details"]["failed_checks"]
+    assert "Saptiva Guard" not in calls
+    assert "Saptiva Ops" not in calls
+
+def test_invalid_rfc_length_reports_rfc_check():
+    service = ValidationService()
+    result = asyncio.run(service.validate_personal_info(dict(VALID_APPLICANT, id_number="XXX0000000000"), []))
+    assert "rfc" in result["failed_checks"]
+
+def test_untrusted_ocr_id_does_not_reject_valid_applicant(monkeypatch):
+    orchestrator, calls = make_orchestrator(monkeypatch)
+    documents = [{"content": b"imagen", "type": "jpg", "filename": "ine.jpg"}]
+
+    result = asyncio.run(orchestrator.process_kyc_application(
+        customer_id="ff-document", documents=documents, personal_info=VALID_APPLICANT
+    ))
+
+    # El OCR devuelve un ID que no es una CURP válida: la discrepancia no es concluyente
+    assert result["status"] == "completed"
+    assert "Saptiva OCR" in calls
+
+def test_trusted_ocr_id_mismatch_fails_check():
+    service = ValidationService()
+    documents = [{"extracted_fields": {"name": VALID_APPLICANT["name"], "id_number": "LOMA900202MDFPRR05"}}]
+    result = asyncio.run(service.validate_personal_info(VALID_APPLICANT, documents))
+    assert "id_number_match" in result["failed_checks"]
+
+@pytest.mark.parametrize("id_number", ["PEGJ800101HDFRRN09", "PEGJ800101AB1"])
+def test_valid_curp_or_rfc_passes(id_number):
+    service = ValidationService()
+    result = asyncio.run(service.validate_personal_info(dict(VALID_APPLICANT, id_number=id_number), []))
+    assert not {"curp", "rfc"} & set(result["failed_checks"])
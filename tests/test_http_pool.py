@@ -0,0 +1,72 @@
+"""
+Pool HTTP compartido: ciclo de vida de la sesión y reutilización de conexiones
+"""
+
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from services.saptiva_http import SaptivaHTTPPool
+
+def test_concurrent_callers_share_one_session():
+    pool = SaptivaHTTPPool()
+
+    async def run():
+        sessions = await asyncio.gather(*(pool.get_session() for _ in range(20)))
+        again = await pool.start()
+        await pool.close()
+        return sessions, again
+
+    sessions, again = asyncio.run(run())
+    assert all(session is sessions[0] for session in sessions)
+    assert again is sessions[0]
+    assert pool.metrics["sessions_opened"] == 1
+
+def test_close_releases_and_reopens_on_demand():
+    pool = SaptivaHTTPPool()
+
+    async def run():
+        first = await pool.get_session()
+        await pool.close()
+        closed = first.closed
+        metrics_closed = pool.get_metrics()["session_open"]
+        await pool.close()  # idempotente
+        second = await pool.get_session()
+        await pool.close()
+        return first, closed, metrics_closed, second
+
+    first, closed, metrics_closed, second = asyncio.run(run())
+    assert closed is True
+    assert metrics_closed is False
+    assert second is not first
+    assert pool.metrics["sessions_opened"] == 2
+
+def test_keep_alive_connection_is_reused():
+    pool = SaptivaHTTPPool()
+
+    async def handler(request):
+        return web.json_response({"ok": True})
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/chat", handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            session = await pool.get_session()
+            for _ in range(3):
+                async with session.post(server.make_url("/chat"), json={}) as response:
+                    assert (await response.json()) == {"ok": True}
+            return pool.get_metrics()
+        finally:
+            await pool.close()
+            await server.close()
+
+    metrics = asyncio.run(run())
+    assert metrics["requests"] == 3
+    assert metrics["in_flight"] == 0
+    assert metrics["connections_created"] == 1
+    assert metrics["connections_reused"] == 2
+    assert metrics["connection_reuse_rate"] == 2 / 3
+    assert metrics["connections_idle"] == 1
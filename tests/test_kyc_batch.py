@@ -0,0 +1,132 @@
+"""
+Lote KYC en streaming: lectura del cuerpo por líneas y cancelación al desconectarse el cliente
+"""
+
+import asyncio
+
+from services.deadline import deadline_for
+from services.kyc_batch import KYCBatchProcessor, LineTooLong, aiter_lines, parse_applicants
+from services.kyc_orchestrator import KYCOrchestrator
+from services.single_flight import SingleFlight
+
+APPLICANT = {
+    "name": "Juan Perez Garcia",
+    "id_number": "PEGJ800101HDFRRN09",
+    "birth_date": "1980-01-01",
+    "address": "Av. Reforma 123, CDMX",
+    "phone": "+525512345678"
+}
+
+def make_orchestrator(monkeypatch, delay=5):
+    monkeypatch.setenv("KYC_RESUME_MODE", "off")
+    orchestrator = KYCOrchestrator()
+    runs = {"started": 0, "cancelled": 0, "finished": 0}
+
+    async def fake_process(customer_id, documents, personal_info, deadline, resume):
+        runs["started"] += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            runs["cancelled"] += 1
+            raise
+        runs["finished"] += 1
+        return {"customer_id": customer_id, "approved": True, "status": "approved"}
+
+    orchestrator._process_within_deadline = fake_process
+    return orchestrator, runs
+
+async def rows(count):
+    for i in range(count):
+        yield {"customer_id": f"batch-{i}", "personal_info": APPLICANT}
+
+def test_client_disconnect_cancels_pipelines(monkeypatch):
+    orchestrator, runs = make_orchestrator(monkeypatch)
+    processor = KYCBatchProcessor(orchestrator)
+
+    async def run():
+        async def consume():
+            async for _ in processor.stream(rows(3), concurrency=3):
+                pass
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert runs["started"] == 3
+    assert runs["cancelled"] == 3
+    assert runs["finished"] == 0
+    assert orchestrator.single_flight.metrics["abandoned"] == 3
+
+def test_pipeline_survives_while_another_request_waits(monkeypatch):
+    orchestrator, runs = make_orchestrator(monkeypatch, delay=0.1)
+    processor = KYCBatchProcessor(orchestrator)
+
+    async def run():
+        async def consume():
+            async for _ in processor.stream(rows(1), concurrency=1):
+                pass
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.02)
+        # Una petición individual con los mismos datos (ya normalizados) se une al mismo pipeline
+        other = asyncio.ensure_future(orchestrator.process_kyc_application(
+            customer_id="batch-0", documents=[], personal_info=dict(APPLICANT, email=None),
+            deadline=deadline_for("process-simple")
+        ))
+        await asyncio.sleep(0.01)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return await other
+
+    result = asyncio.run(run())
+    assert result["customer_id"] == "batch-0"
+    assert runs == {"started": 1, "cancelled": 0, "finished": 1}
+
+def test_single_flight_keeps_running_by_default():
+    flight = SingleFlight("test")
+    state = {"finished": False}
+
+    async def work():
+        await asyncio.sleep(0.05)
+        state["finished"] = True
+        return "ok"
+
+    async def run():
+        caller = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0.08)
+
+    asyncio.run(run())
+    assert state["finished"] is True
+    assert flight.metrics["abandoned"] == 0
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+def test_aiter_lines_splits_across_chunks():
+    lines = asyncio.run(collect(aiter_lines(body(b'{"a":', b' 1}\r\n{"b"', b': 2}\n', b'{"c": 3}'))))
+    assert lines == ['{"a": 1}', '{"b": 2}', '{"c": 3}']
+
+def test_invalid_utf8_only_affects_its_line():
+    rows_out = asyncio.run(collect(parse_applicants(aiter_lines(body(b'{"n": "\xff"}\n{"n": "ok"}\n')))))
+    assert rows_out == [{"n": "�"}, {"n": "ok"}]
+
+def test_overlong_line_is_reported_and_stream_continues():
+    long_line = b'{"n": "' + b"x" * 100 + b'"}'
+    chunks = [long_line[:40], long_line[40:], b'\n{"n": "ok"}\n', b"y" * 30, b"\n"]
+    lines = asyncio.run(collect(aiter_lines(body(*chunks), max_line_bytes=32)))
+    assert isinstance(lines[0], LineTooLong)
+    assert lines[1:] == ['{"n": "ok"}', "y" * 30]
+
+    rows_out = asyncio.run(collect(parse_applicants(aiter_lines(body(*chunks), max_line_bytes=32))))
+    assert "_error" in rows_out[0]
+    assert rows_out[1] == {"n": "ok"}
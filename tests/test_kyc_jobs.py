@@ -0,0 +1,109 @@
+"""
+Cola KYC: apagado, validación de webhooks y visibility timeout
+"""
+
+import asyncio
+
+import pytest
+
+from services.kyc_jobs import KYCJobManager, InvalidWebhookURL
+from services.kyc_orchestrator import KYCOrchestrator
+
+APPLICANT = {"name": "Juan Perez Garcia", "id_number": "PEGJ800101HDFRRN09"}
+
+def make_manager(monkeypatch, pipeline_seconds, shutdown_timeout):
+    monkeypatch.setenv("KYC_RESUME_MODE", "off")
+    monkeypatch.setenv("KYC_JOB_WORKERS", "1")
+    monkeypatch.setenv("KYC_JOB_SHUTDOWN_TIMEOUT", str(shutdown_timeout))
+    orchestrator = KYCOrchestrator()
+    events = []
+
+    async def fake_process(customer_id, documents, personal_info, deadline, resume):
+        events.append("started")
+        try:
+            await asyncio.sleep(pipeline_seconds)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+        events.append("finished")
+        return {"customer_id": customer_id}
+
+    orchestrator._process_within_deadline = fake_process
+    return KYCJobManager(orchestrator), orchestrator, events
+
+async def stop_while_running(manager):
+    await manager.start()
+    await manager.submit("job-1", [], APPLICANT)
+    while manager.metrics["busy_workers"] == 0:
+        await asyncio.sleep(0.01)
+    await manager.stop()
+
+def test_stop_waits_for_running_pipeline(monkeypatch):
+    manager, orchestrator, events = make_manager(monkeypatch, pipeline_seconds=0.05, shutdown_timeout=5)
+    asyncio.run(stop_while_running(manager))
+    assert events == ["started", "finished"]
+    assert orchestrator.single_flight.get_metrics()["in_flight"] == 0
+
+def test_stop_cancels_pipeline_after_timeout(monkeypatch):
+    manager, orchestrator, events = make_manager(monkeypatch, pipeline_seconds=30, shutdown_timeout=0.05)
+    asyncio.run(stop_while_running(manager))
+    assert events == ["started", "cancelled"]
+    assert orchestrator.single_flight.get_metrics()["in_flight"] == 0
+
+def test_webhook_url_validation(monkeypatch):
+    monkeypatch.setenv("KYC_JOB_WEBHOOK_ALLOWED_HOSTS", ".example.com,93.184.216.34")
+    manager = KYCJobManager(orchestrator=None)
+
+    async def check(url):
+        try:
+            await manager.validate_webhook_url(url)
+            return True
+        except InvalidWebhookURL:
+            return False
+
+    async def run():
+        return {
+            url: await check(url)
+            for url in (
+                "http://hooks.example.com/kyc",
+                "https://evil.test/kyc",
+                "https://93.184.216.34/kyc",
+                "https://127.0.0.1/kyc",
+                "https://[::1]/kyc",
+            )
+        }
+
+    results = asyncio.run(run())
+
+    assert results == {
+        "http://hooks.example.com/kyc": False,
+        "https://evil.test/kyc": False,
+        "https://93.184.216.34/kyc": True,
+        "https://127.0.0.1/kyc": False,
+        "https://[::1]/kyc": False,
+    }
+
+def test_internal_webhook_is_rejected_on_submit(monkeypatch):
+    monkeypatch.delenv("KYC_JOB_WEBHOOK_ALLOWED_HOSTS", raising=False)
+    manager = KYCJobManager(orchestrator=None)
+
+    async def run():
+        for url in ("https://169.254.169.254/latest/meta-data", "https://10.0.0.5/hook", "https://localhost/hook"):
+            try:
+                await manager.submit("job-ssrf", [], APPLICANT, webhook_url=url)
+            except InvalidWebhookURL:
+                continue
+            raise AssertionError(f"{url} aceptado")
+
+    asyncio.run(run())
+    assert manager.metrics["submitted"] == 0
+
+def test_visibility_timeout_covers_job_deadline(monkeypatch):
+    monkeypatch.delenv("KYC_JOB_VISIBILITY_TIMEOUT", raising=False)
+    monkeypatch.setenv("KYC_DEADLINE_DEFAULTS", '{"process-async": 90}')
+    monkeypatch.setenv("KYC_JOB_VISIBILITY_MARGIN", "30")
+    assert KYCJobManager(orchestrator=None).visibility_timeout == 120
+
+    monkeypatch.setenv("KYC_JOB_VISIBILITY_TIMEOUT", "100")
+    with pytest.raises(ValueError):
+        KYCJobManager(orchestrator=None)
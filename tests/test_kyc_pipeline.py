@@ -0,0 +1,140 @@
+"""
+Pipeline KYC como grafo de dependencias
+"""
+
+import asyncio
+
+import pytest
+
+from services.deadline import Deadline
+from services.kyc_pipeline import KYCPipeline
+
+class Tracker:
+    """Pasos de prueba que registran arranque, fin y paralelismo"""
+
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.peak = 0
+
+    def step(self, name, delay=0.02, result=None, fail=False):
+        async def func(results):
+            self.events.append(("start", name, sorted(results)))
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            try:
+                await asyncio.sleep(delay)
+                if fail:
+                    raise RuntimeError(f"{name} roto")
+            finally:
+                self.running -= 1
+            self.events.append(("end", name))
+            return result if result is not None else name.upper()
+        return func
+
+    def started(self):
+        return [event[1] for event in self.events if event[0] == "start"]
+
+def test_independent_steps_run_in_parallel_and_dependents_wait():
+    tracker = Tracker()
+    pipeline = (
+        KYCPipeline(max_concurrency=4)
+        .add_step("ocr", tracker.step("ocr"))
+        .add_step("identity", tracker.step("identity"))
+        .add_step("risk", tracker.step("risk"), depends_on=["ocr", "identity"])
+    )
+    results = asyncio.run(pipeline.run())
+
+    assert results == {"ocr": "OCR", "identity": "IDENTITY", "risk": "RISK"}
+    assert tracker.peak == 2
+    # risk arranca después de que terminan sus dos dependencias y ve sus resultados
+    risk_start = tracker.events.index(("start", "risk", ["identity", "ocr"]))
+    assert tracker.events.index(("end", "ocr")) < risk_start
+    assert tracker.events.index(("end", "identity")) < risk_start
+    assert set(pipeline.timings) == {"ocr", "identity", "risk"}
+
+def test_concurrency_is_bounded():
+    tracker = Tracker()
+    pipeline = KYCPipeline(max_concurrency=2)
+    for i in range(6):
+        pipeline.add_step(f"s{i}", tracker.step(f"s{i}"))
+    asyncio.run(pipeline.run())
+    assert tracker.peak == 2
+    assert len(tracker.started()) == 6
+
+@pytest.mark.parametrize("build, message", [
+    (lambda p, t: p.add_step("a", t.step("a"), ["b"]).add_step("b", t.step("b"), ["a"]), "Ciclo"),
+    (lambda p, t: p.add_step("a", t.step("a"), ["missing"]), "desconocida"),
+])
+def test_invalid_graph_is_rejected(build, message):
+    tracker = Tracker()
+    pipeline = build(KYCPipeline(), tracker)
+    with pytest.raises(ValueError, match=message):
+        asyncio.run(pipeline.run())
+    assert tracker.events == []
+
+def test_duplicate_step_is_rejected():
+    pipeline = KYCPipeline().add_step("a", Tracker().step("a"))
+    with pytest.raises(ValueError, match="duplicado"):
+        pipeline.add_step("a", Tracker().step("a"))
+
+def test_failure_halts_steps_that_have_not_started():
+    tracker = Tracker()
+    pipeline = (
+        KYCPipeline(max_concurrency=4)
+        .add_step("ocr", tracker.step("ocr", delay=0.01, fail=True))
+        .add_step("identity", tracker.step("identity", delay=0.05))
+        .add_step("risk", tracker.step("risk"), depends_on=["ocr"])
+    )
+    with pytest.raises(RuntimeError, match="ocr roto"):
+        asyncio.run(pipeline.run())
+    assert "risk" not in tracker.started()
+    assert pipeline.halt_reason.startswith("Paso ocr falló")
+
+def test_halt_skips_remaining_steps():
+    tracker = Tracker()
+    pipeline = KYCPipeline()
+
+    async def fail_fast(results):
+        pipeline.halt("CURP inválida")
+        return {"passed": False}
+
+    pipeline.add_step("validation", fail_fast)
+    pipeline.add_step("identity", tracker.step("identity"), depends_on=["validation"])
+    pipeline.add_step("risk", tracker.step("risk"), depends_on=["identity"])
+    results = asyncio.run(pipeline.run())
+
+    assert results == {"validation": {"passed": False}}
+    assert pipeline.skipped == ["identity", "risk"]
+    assert tracker.events == []
+
+def test_expired_deadline_skips_pending_steps():
+    tracker = Tracker()
+    pipeline = (
+        KYCPipeline(deadline=Deadline(0.03))
+        .add_step("ocr", tracker.step("ocr", delay=0.05))
+        .add_step("risk", tracker.step("risk"), depends_on=["ocr"])
+    )
+    results = asyncio.run(pipeline.run())
+    assert results == {"ocr": "OCR"}
+    assert pipeline.deadline_exceeded is True
+    assert pipeline.skipped == ["risk"]
+
+def test_restored_steps_are_not_repeated_and_checkpoints_are_saved():
+    tracker = Tracker()
+    saved = []
+
+    async def checkpoint(name, result):
+        saved.append((name, result))
+
+    pipeline = (
+        KYCPipeline(checkpoint=checkpoint, restored={"ocr": "OCR guardado"})
+        .add_step("ocr", tracker.step("ocr"))
+        .add_step("risk", tracker.step("risk"), depends_on=["ocr"])
+    )
+    results = asyncio.run(pipeline.run())
+
+    assert results == {"ocr": "OCR guardado", "risk": "RISK"}
+    assert tracker.started() == ["risk"]
+    assert pipeline.resumed == ["ocr"]
+    assert saved == [("risk", "RISK")]
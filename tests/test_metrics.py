@@ -0,0 +1,44 @@
+"""
+Métricas: histogramas acumulativos y exposición en texto Prometheus
+"""
+
+from services.metrics import MetricsRegistry
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_latency_seconds", "Latencia", ("endpoint",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, endpoint="process")
+
+    lines = registry.render().splitlines()
+    assert lines[0] == "# HELP test_latency_seconds Latencia"
+    assert lines[1] == "# TYPE test_latency_seconds histogram"
+    assert 'test_latency_seconds_bucket{endpoint="process",le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{endpoint="process",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{endpoint="process",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_sum{endpoint="process"} 2.65' in lines
+    assert 'test_latency_seconds_count{endpoint="process"} 4' in lines
+    assert histogram.snapshot() == {"process": {"count": 4, "avg": 2.65 / 4}}
+
+def test_counter_and_gauge_render_by_label():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_calls_total", "Llamadas", ("model",))
+    counter.inc(model="b")
+    counter.inc(2, model="a")
+    registry.gauge("test_depth", "Profundidad").set(7)
+    # Mismo nombre: se obtiene la métrica ya registrada
+    assert registry.counter("test_calls_total", "Llamadas", ("model",)) is counter
+
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "# TYPE test_calls_total counter\ntest_calls_total{model=\"a\"} 2\ntest_calls_total{model=\"b\"} 1\n" in text
+    assert "# TYPE test_depth gauge\ntest_depth 7\n" in text
+
+def test_label_values_and_help_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("test_errors_total", "Errores\npor \\ tipo", ("error",)).inc(error='bad "x"\\y\nz')
+
+    lines = registry.render().splitlines()
+    assert lines[0] == "# HELP test_errors_total Errores\\npor \\\\ tipo"
+    assert lines[2] == 'test_errors_total{error="bad \\"x\\"\\\\y\\nz"} 1'
+    assert len(lines) == 3
@@ -0,0 +1,70 @@
+"""
+Micro-batcher: cada llamador conserva su deadline
+"""
+
+import asyncio
+
+from services.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+from services.micro_batcher import MicroBatcher
+from services.saptiva_rag import SaptivaRAGService
+from services.single_flight import SingleFlight
+
+def test_batch_runs_under_latest_deadline_and_callers_time_out_separately():
+    seen = []
+
+    async def flush(items):
+        seen.append((list(items), current_deadline()))
+        await asyncio.sleep(0.05)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher("test", flush, max_batch_size=8, max_wait=0.001)
+    short, long = Deadline(0.02), Deadline(5)
+
+    async def submit(item, deadline):
+        with deadline_scope(deadline):
+            return await batcher.submit(item)
+
+    async def run():
+        return await asyncio.gather(submit(1, short), submit(2, long), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+
+    assert isinstance(first, DeadlineExceeded)
+    assert second == 4
+    assert seen == [([1, 2], long)]
+    assert batcher.metrics["caller_deadline_exceeded"] == 1
+
+def test_caller_without_deadline_lifts_batch_deadline():
+    seen = []
+
+    async def flush(items):
+        seen.append(current_deadline())
+        return items
+
+    batcher = MicroBatcher("test", flush, max_batch_size=2)
+
+    async def run():
+        async def with_deadline():
+            with deadline_scope(Deadline(5)):
+                return await batcher.submit("a")
+        return await asyncio.gather(with_deadline(), batcher.submit("b"))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert seen == [None]
+
+def test_generate_embedding_falls_back_when_caller_budget_runs_out():
+    class SlowEmbedClient:
+        async def post_json(self, model, url, headers, payload, timeout=5, idempotent=False, endpoint="chat"):
+            await asyncio.sleep(0.2)
+            return {"embeddings": [[1.0, 0.0]]}
+
+    rag = SaptivaRAGService(http_client=SlowEmbedClient(), single_flight=SingleFlight("test"))
+
+    async def run():
+        with deadline_scope(Deadline(0.02)):
+            return await rag.generate_embedding("requisitos KYC")
+
+    embedding = asyncio.run(run())
+
+    # Embedding simulado (dimensión 384), no una excepción
+    assert len(embedding) == 384
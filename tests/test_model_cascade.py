@@ -0,0 +1,91 @@
+"""
+Cascada de modelos: umbrales de aceptación, escalamiento y rechazo
+"""
+
+import asyncio
+
+import pytest
+
+from services.model_cascade import ModelCascade, CLEAR_PASS, CLEAR_FAIL, ESCALATE
+from services.saptiva_service import SaptivaService
+
+APPLICANT = {
+    "name": "Juan Perez Garcia",
+    "id_number": "PEGJ800101HDFRRN09",
+    "birth_date": "1980-01-01"
+}
+
+@pytest.fixture
+def cascade(monkeypatch):
+    for name in ("KYC_CASCADE_ENABLED", "KYC_CASCADE_IDENTITY_BAND", "KYC_CASCADE_RISK_BAND"):
+        monkeypatch.delenv(name, raising=False)
+    return ModelCascade()
+
+@pytest.fixture
+def service(cascade):
+    calls = []
+    service = SaptivaService()
+    service.cascade = cascade
+
+    async def fake_call(model, messages, max_tokens=256, temperature=None):
+        calls.append(model)
+        return {"choices": [{"message": {"content": "RECHAZADO: se recomienda no aprobar."}}]}
+
+    service._call_saptiva_api = fake_call
+    service.calls = calls
+    return service
+
+@pytest.mark.parametrize("score, route", [
+    (0.0, CLEAR_FAIL),
+    (1 / 3, CLEAR_FAIL),
+    (2 / 3, ESCALATE),
+    (1.0, CLEAR_PASS),
+])
+def test_identity_thresholds(cascade, score, route):
+    assert cascade.route("identity", score) == route
+
+@pytest.mark.parametrize("score, route", [
+    (0.49, CLEAR_FAIL),
+    (0.5, ESCALATE),
+    (0.69, ESCALATE),
+    (0.7, CLEAR_PASS),
+])
+def test_risk_thresholds(cascade, score, route):
+    assert cascade.route("risk", score) == route
+
+def test_disabled_cascade_always_escalates(monkeypatch):
+    monkeypatch.setenv("KYC_CASCADE_ENABLED", "false")
+    assert ModelCascade().route("identity", 1.0) == ESCALATE
+
+@pytest.mark.parametrize("fields, score", [
+    (APPLICANT, 1.0),
+    (dict(APPLICANT, birth_date=None), 2 / 3),
+    (dict(APPLICANT, birth_date=None, id_number="X"), 1 / 3),
+])
+def test_identity_screening_score(service, fields, score):
+    assert service._screen_identity({"extracted_fields": fields})["score"] == pytest.approx(score)
+
+def test_clear_identity_skips_guard_and_claims_no_sanctions_screening(service):
+    result = asyncio.run(service.validate_identity({"extracted_fields": APPLICANT}))
+
+    assert service.calls == []
+    assert result["identity_verified"] is True
+    assert result["sanctions_check"] == "not_checked"
+    assert result["pep_check"] == "not_checked"
+
+def test_borderline_identity_escalates_to_guard(service):
+    asyncio.run(service.validate_identity({"extracted_fields": dict(APPLICANT, birth_date=None)}))
+    assert service.calls == ["Saptiva Guard"]
+
+def test_kal_output_is_advisory(service):
+    identity = {"risk_score": 0.15, "saptiva_analysis": {"ai_confidence": 0.5}}
+    credit = {"credit_score": 430, "saptiva_enhancement": {"predictive_score": 0.5}}
+
+    assessment = asyncio.run(service.calculate_risk_assessment(identity, credit, {"name": "Ana Torres"}))
+
+    # Score en la banda: KAL se consulta, pero la aprobación la decide la fórmula
+    assert service.calls == ["Saptiva KAL"]
+    assert 0.5 <= assessment["final_score"] < 0.7
+    assert assessment["approved"] is True
+    assert assessment["saptiva_decision"]["kal_role"] == "advisory"
+    assert "RECHAZADO" in assessment["saptiva_decision"]["kal_analysis"]
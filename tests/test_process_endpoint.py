@@ -0,0 +1,62 @@
+"""
+/kyc/process: acepta multipart (campo `request` + documentos) y el cuerpo JSON original
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+
+APPLICATION = {
+    "customer_id": "proc-1",
+    "personal_info": {
+        "name": "Juan Perez Garcia",
+        "id_number": "PEGJ800101HDFRRN09",
+        "birth_date": "1980-01-01",
+        "address": "Av. Reforma 123, CDMX",
+        "phone": "+525512345678"
+    }
+}
+
+def make_client(monkeypatch):
+    calls = []
+
+    async def fake_process(customer_id, documents, personal_info, deadline=None, resume=None):
+        calls.append({"customer_id": customer_id, "documents": [doc["filename"] for doc in documents]})
+        return {
+            "status": "approved",
+            "customer_id": customer_id,
+            "verification_score": 0.9,
+            "risk_level": "low",
+            "approved": True,
+            "processing_time": 0.01,
+            "details": {}
+        }
+
+    monkeypatch.setattr(main.kyc_orchestrator, "process_kyc_application", fake_process)
+    return TestClient(main.app), calls
+
+def test_multipart_with_documents(monkeypatch):
+    client, calls = make_client(monkeypatch)
+    response = client.post(
+        "/kyc/process",
+        data={"request": json.dumps(APPLICATION)},
+        files=[("documents", ("ine.jpg", b"\xff\xd8", "image/jpeg"))]
+    )
+    assert response.status_code == 200
+    assert calls == [{"customer_id": "proc-1", "documents": ["ine.jpg"]}]
+
+def test_json_body_still_accepted(monkeypatch):
+    client, calls = make_client(monkeypatch)
+    response = client.post("/kyc/process", json=dict(APPLICATION, customer_id="proc-2"))
+    assert response.status_code == 200
+    assert response.json()["customer_id"] == "proc-2"
+    assert calls == [{"customer_id": "proc-2", "documents": []}]
+
+def test_missing_or_invalid_request_is_422(monkeypatch):
+    client, calls = make_client(monkeypatch)
+    assert client.post("/kyc/process", data={"other": "1"}).status_code == 422
+    assert client.post("/kyc/process", json={"customer_id": "proc-3"}).status_code == 422
+    assert client.post("/kyc/process", data={"request": "{no es json"}).status_code == 422
+    assert calls == []
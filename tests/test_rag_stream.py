@@ -0,0 +1,40 @@
+"""
+Streaming de Saptiva Cortex: un stream cortado no se cachea como respuesta completa
+"""
+
+import asyncio
+
+from services.saptiva_cache import SaptivaCompletionCache
+from services.saptiva_rag import SaptivaRAGService
+
+class BrokenStreamClient:
+    async def stream_sse(self, model, url, headers, payload, timeout, endpoint="chat"):
+        yield {"choices": [{"delta": {"content": "Según la CNBV "}}]}
+        yield {"choices": [{"delta": {"content": "las instituciones"}}]}
+        raise ConnectionResetError("conexión cerrada")
+
+class FakeBilling:
+    def __init__(self):
+        self.calls = []
+
+    def log_api_call(self, model, input_tokens, output_tokens, operation="chat", metadata=None):
+        self.calls.append((operation, metadata))
+
+def test_interrupted_stream_is_truncated_and_not_cached(monkeypatch):
+    monkeypatch.setenv("SAPTIVA_CACHE_ENABLED", "true")
+    monkeypatch.delenv("SAPTIVA_CACHE_DIR", raising=False)
+    cache = SaptivaCompletionCache()
+    billing = FakeBilling()
+    rag = SaptivaRAGService(billing_service=billing, http_client=BrokenStreamClient(), completion_cache=cache)
+
+    async def run():
+        return [event async for event in rag._stream_saptiva_cortex([{"role": "user", "content": "¿Qué pide la CNBV?"}])]
+
+    events = asyncio.run(run())
+
+    completion = events[-1]
+    assert completion["event"] == "completion"
+    assert completion["truncated"] is True
+    assert completion["content"] == "Según la CNBV las instituciones"
+    assert cache.metrics["stores"] == 0
+    assert billing.calls[-1][1]["truncated"] is True
@@ -0,0 +1,78 @@
+"""
+Almacén durable SQLite (WAL) detrás de DatabaseService
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from services.database_service import DatabaseService
+from services.record_store import RecordStore
+
+def make_db(monkeypatch, tmp_path, write_behind=False):
+    monkeypatch.setenv("KYC_DB_BACKEND", "sqlite")
+    monkeypatch.setenv("KYC_DB_PATH", str(tmp_path / "kyc.db"))
+    monkeypatch.setenv("KYC_DB_POOL_SIZE", "2")
+    monkeypatch.setenv("KYC_WRITE_BEHIND", "true" if write_behind else "false")
+    monkeypatch.setenv("KYC_WRITE_BEHIND_FLUSH_INTERVAL", "0.01")
+    return DatabaseService()
+
+def record(customer_id, status="completed", approved=True):
+    return {"customer_id": customer_id, "status": status, "approved": approved, "risk_assessment": {"risk_level": "low"}}
+
+def test_records_survive_restart(monkeypatch, tmp_path):
+    async def first_run():
+        db = make_db(monkeypatch, tmp_path)
+        await db.start()
+        await db.save_kyc_record(record("db-1"))
+        await db.save_kyc_record(record("db-2", status="rejected", approved=False))
+        await db.update_kyc_status("db-1", "manual_review")
+        await db.update_kyc_status("db-2", "completed", {"notes": "revisado"})
+        await db.stop()
+
+    async def second_run():
+        db = make_db(monkeypatch, tmp_path)
+        await db.start()
+        try:
+            return db, await db.get_kyc_record("db-1"), await db.get_kyc_record("db-2"), await db.get_kyc_statistics()
+        finally:
+            await db.stop()
+
+    asyncio.run(first_run())
+    db, first, second, stats = asyncio.run(second_run())
+
+    assert first["status"] == "manual_review"
+    assert second["status"] == "completed"
+    assert second["notes"] == "revisado"
+    assert stats["total_applications"] == 2
+    assert db.indexes["status"]["manual_review"] == {"db-1"}
+
+    conn = sqlite3.connect(str(tmp_path / "kyc.db"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+def test_write_behind_commits_batches(monkeypatch, tmp_path):
+    db = make_db(monkeypatch, tmp_path, write_behind=True)
+
+    async def run():
+        await db.start()
+        await asyncio.gather(*(db.save_kyc_record(record(f"wb-{i}")) for i in range(20)))
+        await db.stop()
+
+    asyncio.run(run())
+
+    metrics = db.store.get_metrics()
+    assert metrics["records_written"] == 20
+    assert metrics["batches"] < 20
+    conn = sqlite3.connect(str(tmp_path / "kyc.db"))
+    assert conn.execute("SELECT COUNT(*) FROM kyc_records").fetchone()[0] == 20
+    conn.close()
+
+def test_record_store_contract_is_abstract():
+    class Incomplete(RecordStore):
+        async def open(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
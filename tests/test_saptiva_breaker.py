@@ -0,0 +1,109 @@
+"""
+Circuit breaker por endpoint y modelo: closed -> open -> half_open -> closed
+"""
+
+import asyncio
+
+import pytest
+
+from services.saptiva_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError
+from services.saptiva_client import SaptivaHTTPClient
+from services.saptiva_http import SaptivaHTTPPool
+from services.saptiva_limiter import SaptivaLimiterRegistry
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("services.saptiva_breaker.time.monotonic", clock)
+    return clock
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("chat:test", failure_threshold=3, reset_timeout=10)
+    breaker.record_failure("503")
+    breaker.record_failure("503")
+    breaker.record_success()  # un éxito reinicia la racha
+    breaker.record_failure("503")
+    breaker.record_failure("503")
+    assert breaker.state == "closed"
+    breaker.record_failure("timeout")
+    assert breaker.state == "open"
+    assert breaker.metrics["opened"] == 1
+    assert breaker.metrics["last_failure"] == "timeout"
+
+    assert breaker.allow() is False
+    assert breaker.metrics["short_circuited"] == 1
+    clock.now += 4
+    assert breaker.retry_in() == pytest.approx(6)
+
+def test_half_open_probe_success_closes(clock):
+    breaker = CircuitBreaker("chat:test", failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    # Solo una prueba a la vez
+    assert breaker.allow() is False
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() is True and breaker.allow() is True
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = CircuitBreaker("chat:test", failure_threshold=3, reset_timeout=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow() is True
+    breaker.record_failure("sigue caído")
+    assert breaker.state == "open"
+    assert breaker.metrics["opened"] == 2
+    # El timeout de reapertura corre de nuevo desde la prueba fallida
+    clock.now += 9
+    assert breaker.allow() is False
+    clock.now += 1
+    assert breaker.allow() is True
+
+def test_cancelled_probe_frees_its_slot(clock):
+    breaker = CircuitBreaker("chat:test", failure_threshold=1, reset_timeout=10, half_open_max_calls=1)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow() is True
+    breaker.record_cancelled()
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+
+def test_registry_isolates_endpoints_and_models(monkeypatch, clock):
+    monkeypatch.setenv("SAPTIVA_BREAKER_FAILURE_THRESHOLD", "1")
+    monkeypatch.setenv("SAPTIVA_BREAKER_OPEN_MODE", "fail")
+    registry = CircuitBreakerRegistry()
+    registry.get("chat", "Saptiva Turbo").record_failure()
+    registry.get("chat", "Saptiva Cortex").record_success()
+    registry.get("embed", "Saptiva Embed").record_success()
+
+    assert registry.get("chat", "Saptiva Turbo") is registry.get("chat", "Saptiva Turbo")
+    assert registry.get("chat", "Saptiva Cortex").state == "closed"
+    assert registry.endpoint_state("chat") == "open"
+    assert registry.endpoint_state("embed") == "closed"
+    assert registry.endpoint_state("cortex") is None
+    assert registry.degrade is False
+    assert registry.get_status()["chat:Saptiva Turbo"]["state"] == "open"
+
+def test_open_circuit_short_circuits_the_client():
+    registry = CircuitBreakerRegistry()
+    client = SaptivaHTTPClient(http_pool=SaptivaHTTPPool(), limiters=SaptivaLimiterRegistry(), breakers=registry)
+    breaker = registry.get("chat", "Saptiva Turbo")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError) as error:
+        # Puerto cerrado: si la llamada llegara a la red fallaría con otro error
+        asyncio.run(client.post_json("Saptiva Turbo", "http://127.0.0.1:9/v1/chat", {}, {}, timeout=1))
+    assert error.value.name == "chat:Saptiva Turbo"
+    assert client.metrics["attempts"] == 0
@@ -0,0 +1,73 @@
+"""
+Cache de completions Saptiva para las llamadas KYC
+"""
+
+import os
+import time
+import asyncio
+
+from services.saptiva_cache import SaptivaCompletionCache
+from services.saptiva_service import SaptivaService
+
+class FakeHTTPClient:
+    def __init__(self):
+        self.calls = []
+
+    async def post_json(self, model, url, headers, payload, timeout=30):
+        self.calls.append(payload)
+        return {"choices": [{"message": {"content": "Perfil crediticio estable."}}]}
+
+def test_kyc_call_hits_completion_cache(monkeypatch):
+    monkeypatch.setenv("SAPTIVA_CACHE_ENABLED", "true")
+    monkeypatch.delenv("SAPTIVA_CACHE_DIR", raising=False)
+    monkeypatch.delenv("SAPTIVA_CACHE_KYC_TEMPERATURE", raising=False)
+    cache = SaptivaCompletionCache()
+    http_client = FakeHTTPClient()
+    service = SaptivaService(http_client=http_client, completion_cache=cache)
+
+    async def run():
+        await service.check_credit_bureau("PEGJ800101HDFRRN09")
+        await service.check_credit_bureau("PEGJ800101HDFRRN09")
+
+    asyncio.run(run())
+
+    assert len(http_client.calls) == 1
+    assert http_client.calls[0]["temperature"] <= cache.max_temperature
+    assert cache.metrics["memory_hits"] == 1
+    assert cache.metrics["by_model"]["Saptiva Ops"] == {"hits": 1, "misses": 1}
+
+def test_kyc_temperature_unchanged_without_cache(monkeypatch):
+    monkeypatch.setenv("SAPTIVA_CACHE_ENABLED", "false")
+    http_client = FakeHTTPClient()
+    service = SaptivaService(http_client=http_client, completion_cache=SaptivaCompletionCache())
+
+    asyncio.run(service.check_credit_bureau("PEGJ800101HDFRRN09"))
+
+    assert http_client.calls[0]["temperature"] == 0.7
+
+def test_disk_tier_prunes_expired_and_excess(monkeypatch, tmp_path):
+    monkeypatch.setenv("SAPTIVA_CACHE_ENABLED", "true")
+    monkeypatch.setenv("SAPTIVA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("SAPTIVA_CACHE_TTL", "60")
+    monkeypatch.setenv("SAPTIVA_CACHE_MAX_DISK_ENTRIES", "3")
+    monkeypatch.setenv("SAPTIVA_CACHE_PRUNE_EVERY", "2")
+
+    stale = tmp_path / "stale.json"
+    stale.write_text("{}")
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+
+    cache = SaptivaCompletionCache()
+    assert not stale.exists()
+    assert cache.metrics["disk_pruned"] == 1
+
+    async def run():
+        for i in range(6):
+            await cache.set(f"key{i}", {"choices": [{"message": {"content": str(i)}}]})
+            path = tmp_path / f"key{i}.json"
+            os.utime(path, (time.time() - 30 + i, time.time() - 30 + i))
+
+    asyncio.run(run())
+
+    remaining = sorted(p.name for p in tmp_path.iterdir())
+    assert remaining == ["key3.json", "key4.json", "key5.json"]
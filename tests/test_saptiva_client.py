@@ -0,0 +1,126 @@
+"""
+Cliente HTTP de Saptiva: reintentos con backoff y hedging de llamadas idempotentes
+"""
+
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from services.deadline import Deadline, deadline_scope
+from services.saptiva_breaker import CircuitBreakerRegistry
+from services.saptiva_client import RetryPolicy, SaptivaAPIError, SaptivaHTTPClient
+from services.saptiva_http import SaptivaHTTPPool
+from services.saptiva_limiter import SaptivaLimiterRegistry
+
+MODEL = "Saptiva Turbo"
+
+def make_client(monkeypatch, **env):
+    monkeypatch.setenv("SAPTIVA_RETRY_BASE_DELAY", "0.001")
+    monkeypatch.setenv("SAPTIVA_RETRY_MAX_DELAY", "0.01")
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return SaptivaHTTPClient(
+        http_pool=SaptivaHTTPPool(),
+        limiters=SaptivaLimiterRegistry(),
+        breakers=CircuitBreakerRegistry()
+    )
+
+def run_against(client, script, call):
+    """
+    Levanta un servidor local que responde según `script`: una lista de (status, delay)
+    consumida en orden de llegada; devuelve (resultado o excepción, peticiones recibidas)
+    """
+    received = []
+
+    async def handler(request):
+        index = len(received)
+        received.append(await request.json())
+        status, delay = script[min(index, len(script) - 1)]
+        await asyncio.sleep(delay)
+        return web.json_response({"attempt": index}, status=status)
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/v1/chat", handler)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            return await call(str(server.make_url("/v1/chat")))
+        except Exception as e:
+            return e
+        finally:
+            await client.http_pool.close()
+            await server.close()
+
+    return asyncio.run(run()), received
+
+def post(client, **kwargs):
+    async def call(url):
+        return await client.post_json(MODEL, url, {}, {"q": 1}, timeout=5, **kwargs)
+    return call
+
+def test_transient_errors_are_retried(monkeypatch):
+    client = make_client(monkeypatch)
+    result, received = run_against(client, [(503, 0), (429, 0), (200, 0)], post(client))
+    assert result == {"attempt": 2}
+    assert len(received) == 3
+    assert client.metrics["retries"] == 2
+    assert client.breakers.get("chat", MODEL).consecutive_failures == 0
+
+def test_client_errors_are_not_retried(monkeypatch):
+    client = make_client(monkeypatch)
+    result, received = run_against(client, [(400, 0)], post(client))
+    assert isinstance(result, SaptivaAPIError) and result.status == 400
+    assert len(received) == 1
+    # El upstream respondió: no cuenta para el circuit breaker
+    assert client.breakers.get("chat", MODEL).metrics["failures"] == 0
+
+def test_retries_stop_at_max_attempts(monkeypatch):
+    client = make_client(monkeypatch, SAPTIVA_RETRY_POLICIES='{"Saptiva Turbo": {"max_attempts": 2}}')
+    result, received = run_against(client, [(502, 0)], post(client))
+    assert isinstance(result, SaptivaAPIError) and result.status == 502
+    assert len(received) == 2
+    assert client.metrics["exhausted"] == 1
+
+def test_no_retry_when_backoff_exceeds_deadline(monkeypatch):
+    client = make_client(monkeypatch, SAPTIVA_RETRY_BASE_DELAY="5", SAPTIVA_RETRY_MAX_DELAY="5")
+    monkeypatch.setattr("services.saptiva_client.random.uniform", lambda low, high: high)
+
+    async def call(url):
+        with deadline_scope(Deadline(1.0)):
+            return await client.post_json(MODEL, url, {}, {}, timeout=5)
+
+    result, received = run_against(client, [(503, 0), (200, 0)], call)
+    assert isinstance(result, SaptivaAPIError)
+    assert len(received) == 1
+    assert client.metrics["deadline_exceeded"] == 1
+
+def test_backoff_is_capped_full_jitter(monkeypatch):
+    policy = RetryPolicy(max_attempts=5, base_delay=0.2, max_delay=1.0)
+    monkeypatch.setattr("services.saptiva_client.random.uniform", lambda low, high: (low, high))
+    assert [policy.backoff(attempt) for attempt in range(1, 5)] == [(0, 0.2), (0, 0.4), (0, 0.8), (0, 1.0)]
+
+def test_slow_idempotent_call_is_hedged(monkeypatch):
+    client = make_client(monkeypatch, SAPTIVA_HEDGE_MODELS=MODEL, SAPTIVA_HEDGE_DEFAULT_DELAY="0.05")
+    result, received = run_against(client, [(200, 1.0), (200, 0)], post(client, idempotent=True))
+    assert result == {"attempt": 1}
+    assert len(received) == 2
+    assert client.metrics["hedges_sent"] == 1
+    assert client.metrics["hedges_won"] == 1
+
+def test_non_idempotent_call_is_never_hedged(monkeypatch):
+    client = make_client(monkeypatch, SAPTIVA_HEDGE_MODELS=MODEL, SAPTIVA_HEDGE_DEFAULT_DELAY="0.01")
+    result, received = run_against(client, [(200, 0.1)], post(client))
+    assert result == {"attempt": 0}
+    assert len(received) == 1
+    assert client.metrics["hedges_sent"] == 0
+
+def test_hedge_delay_follows_observed_percentile(monkeypatch):
+    client = make_client(monkeypatch, SAPTIVA_HEDGE_DEFAULT_DELAY="1.0", SAPTIVA_HEDGE_PERCENTILE="0.9")
+    assert client.hedge_delay(MODEL) == 1.0
+    client.latencies[MODEL] = [i / 100 for i in range(1, 20)]
+    assert client.hedge_delay(MODEL) == 1.0  # menos de 20 muestras
+    client.latencies[MODEL].append(0.20)
+    assert client.hedge_delay(MODEL) == pytest.approx(0.19)
@@ -0,0 +1,50 @@
+"""
+Limitador AIMD: las cancelaciones no son señal de congestión
+"""
+
+import asyncio
+
+from services.saptiva_limiter import AdaptiveConcurrencyLimiter
+
+def test_cancelled_call_is_not_counted_as_error():
+    limiter = AdaptiveConcurrencyLimiter("Saptiva Ops", initial_limit=4, cooldown=0)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def call():
+            async with limiter.acquire():
+                started.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(call())
+        await started.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+    status = limiter.get_status()
+    assert status["cancelled"] == 1
+    assert status["errors"] == 0
+    assert status["decreases"] == 0
+    assert status["limit"] == 4
+    assert status["in_flight"] == 0
+
+def test_timeout_still_lowers_limit():
+    limiter = AdaptiveConcurrencyLimiter("Saptiva Ops", initial_limit=4, cooldown=0)
+
+    async def run():
+        try:
+            async with limiter.acquire():
+                raise asyncio.TimeoutError()
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+
+    assert limiter.get_status()["timeouts"] == 1
+    assert limiter.limit == 2
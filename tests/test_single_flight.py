@@ -0,0 +1,123 @@
+"""
+Single-flight de aplicaciones KYC: solo se fusionan envíos equivalentes
+"""
+
+import asyncio
+
+from services.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+from services.kyc_orchestrator import KYCOrchestrator
+from services.saptiva_service import SaptivaService
+from services.single_flight import SingleFlight
+
+APPLICANT = {"name": "Juan Perez Garcia", "id_number": "PEGJ800101HDFRRN09"}
+
+class SlowHTTPClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+
+    async def post_json(self, model, url, headers, payload, timeout=30):
+        self.calls.append(payload)
+        await asyncio.sleep(self.delay)
+        return {"choices": [{"message": {"content": "respuesta real"}}]}
+
+def make_orchestrator(monkeypatch):
+    monkeypatch.setenv("KYC_RESUME_MODE", "off")
+    orchestrator = KYCOrchestrator()
+    runs = []
+
+    async def fake_process(customer_id, documents, personal_info, deadline, resume):
+        runs.append(personal_info)
+        await asyncio.sleep(0.01)
+        return {"customer_id": customer_id, "personal_info": personal_info, "resume": resume}
+
+    orchestrator._process_within_deadline = fake_process
+    return orchestrator, runs
+
+def submit_concurrently(orchestrator, *submissions):
+    async def run():
+        return await asyncio.gather(*(
+            orchestrator.process_kyc_application(customer_id="sf-1", documents=[], **kwargs)
+            for kwargs in submissions
+        ))
+    return asyncio.run(run())
+
+def test_identical_submissions_share_one_run(monkeypatch):
+    orchestrator, runs = make_orchestrator(monkeypatch)
+    first, second = submit_concurrently(
+        orchestrator,
+        {"personal_info": dict(APPLICANT)},
+        {"personal_info": dict(reversed(list(APPLICANT.items())))}
+    )
+    assert len(runs) == 1
+    assert first == second
+
+def test_different_payload_or_resume_is_not_merged(monkeypatch):
+    orchestrator, runs = make_orchestrator(monkeypatch)
+    other = dict(APPLICANT, name="Maria Lopez")
+    first, second, third = submit_concurrently(
+        orchestrator,
+        {"personal_info": APPLICANT},
+        {"personal_info": other},
+        {"personal_info": APPLICANT, "resume": True}
+    )
+    assert len(runs) == 3
+    assert first["personal_info"] == APPLICANT
+    assert second["personal_info"] == other
+    assert third["resume"] is True
+
+def test_different_deadline_is_not_merged(monkeypatch):
+    orchestrator, runs = make_orchestrator(monkeypatch)
+    submit_concurrently(
+        orchestrator,
+        {"personal_info": APPLICANT, "deadline": Deadline(30)},
+        {"personal_info": APPLICANT, "deadline": Deadline(2)},
+        {"personal_info": APPLICANT, "deadline": Deadline(30)}
+    )
+    assert len(runs) == 2
+    assert orchestrator.single_flight.metrics["deadline_mismatch"] == 1
+
+def test_shared_flight_applies_each_callers_deadline():
+    flight = SingleFlight("test")
+    observed = []
+
+    async def factory():
+        await asyncio.sleep(0.1)
+        observed.append(current_deadline())
+        return "ok"
+
+    short, long = Deadline(0.03), Deadline(5)
+
+    async def call(deadline):
+        with deadline_scope(deadline):
+            return await flight.do("same-payload", factory)
+
+    async def run():
+        return await asyncio.gather(call(short), call(long), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+
+    assert isinstance(first, DeadlineExceeded)
+    assert second == "ok"
+    # La ejecución compartida no quedó atada al deadline corto del primer llamador
+    assert observed[0].expires_at == long.expires_at
+    assert flight.metrics["coalesced"] == 1
+    assert flight.metrics["caller_deadline_exceeded"] == 1
+
+def test_short_deadline_caller_falls_back_without_failing_the_other():
+    http_client = SlowHTTPClient(delay=0.1)
+    service = SaptivaService(http_client=http_client, single_flight=SingleFlight("saptiva"))
+    messages = [{"role": "user", "content": "Evalúa el riesgo"}]
+
+    async def call(budget):
+        with deadline_scope(Deadline(budget)):
+            return await service._call_saptiva_api("Saptiva KAL", messages, 150)
+
+    async def run():
+        return await asyncio.gather(call(0.03), call(5))
+
+    short, long = asyncio.run(run())
+
+    assert len(http_client.calls) == 1
+    assert long["choices"][0]["message"]["content"] == "respuesta real"
+    assert short["choices"][0]["message"]["content"] != "respuesta real"
@@ -0,0 +1,60 @@
+"""
+Latencia real por paso KYC: step_timings, histogramas y header Server-Timing
+"""
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from services.kyc_orchestrator import PIPELINE_DURATION, STEP_DURATION, KYCOrchestrator
+
+APPLICANT = {
+    "name": "Juan Perez Garcia",
+    "id_number": "PEGJ800101HDFRRN09",
+    "birth_date": "1980-01-01",
+    "address": "Calle 1, CDMX",
+    "phone": "5512345678",
+    "email": "juan@example.com"
+}
+
+def series_count(histogram, **labels):
+    key = tuple(str(labels.get(name, "")) for name in histogram.label_names)
+    return histogram._series.get(key, {"count": 0})["count"]
+
+def test_step_timings_are_measured_and_observed(monkeypatch):
+    monkeypatch.setenv("KYC_RESUME_MODE", "off")
+    monkeypatch.setenv("KYC_FAIL_FAST_POLICY", "off")
+    orchestrator = KYCOrchestrator()
+
+    async def slow_call(model, messages, max_tokens=256):
+        await asyncio.sleep(0.02)
+        return {"choices": [{"message": {"content": "Sin indicadores de riesgo."}}]}
+
+    orchestrator.saptiva_service._call_saptiva_api = slow_call
+    before_total = sum(series["count"] for series in PIPELINE_DURATION._series.values())
+
+    result = asyncio.run(orchestrator.process_kyc_application(
+        customer_id="timing-1", documents=[], personal_info=APPLICANT
+    ))
+
+    timings = result["details"]["step_timings"]
+    assert timings
+    assert all(duration >= 0 for duration in timings.values())
+    # Pasos en paralelo: el total medido cubre al más lento, no es una suma de constantes
+    assert result["processing_time"] >= max(timings.values())
+    assert sum(series["count"] for series in PIPELINE_DURATION._series.values()) == before_total + 1
+    for step in timings:
+        assert series_count(STEP_DURATION, step=step) >= 1
+
+def test_server_timing_header_format():
+    header = main.server_timing_header({"validation": 0.0123, "identity": 1.5}, 1.75)
+    assert header == "validation;dur=12.3, identity;dur=1500.0, total;dur=1750.0"
+
+def test_metrics_endpoint_serves_prometheus_text():
+    STEP_DURATION.observe(0.2, step="test_step")
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE kyc_step_duration_seconds histogram" in response.text
+    assert 'kyc_step_duration_seconds_bucket{step="test_step",le="0.25"}' in response.text
@@ -0,0 +1,69 @@
+"""
+Write-behind: apagado ordenado de DatabaseService
+"""
+
+import asyncio
+
+from services.database_service import DatabaseService
+
+def make_db(monkeypatch, commit_delay, shutdown_timeout=30):
+    monkeypatch.setenv("KYC_WRITE_BEHIND", "true")
+    monkeypatch.setenv("KYC_WRITE_BEHIND_FLUSH_INTERVAL", "0.001")
+    monkeypatch.setenv("KYC_WRITE_BEHIND_SHUTDOWN_TIMEOUT", str(shutdown_timeout))
+    db = DatabaseService()
+    commit_batch = db._commit_batch
+
+    async def slow_commit(records):
+        await asyncio.sleep(commit_delay)
+        await commit_batch(records)
+
+    db._commit_batch = slow_commit
+    return db
+
+def record(customer_id, version):
+    return {"customer_id": customer_id, "status": "completed", "version": version}
+
+def test_saves_during_shutdown_stay_ordered(monkeypatch):
+    db = make_db(monkeypatch, commit_delay=0.02)
+
+    async def run():
+        await db.start()
+        await db.save_kyc_record(record("wb-a", 1))
+        await db.save_kyc_record(record("wb-b", 1))
+        stopping = asyncio.ensure_future(db.stop())
+        await asyncio.sleep(0.005)
+        # Llega mientras se vacía la cola: debe encolarse detrás de la versión 1
+        await db.save_kyc_record(record("wb-a", 2))
+        assert not stopping.done()
+        await stopping
+        # Flusher detenido: escritura directa
+        await db.save_kyc_record(record("wb-b", 2))
+        return await db.get_kyc_record("wb-a"), await db.get_kyc_record("wb-b")
+
+    a, b = asyncio.run(run())
+
+    assert a["version"] == 2
+    assert b["version"] == 2
+    assert db.pending == {}
+    assert db.write_behind_metrics["flushed"] == 3
+    assert db.blobs.get("wb-a")["version"] == 2
+
+def test_shutdown_timeout_cancels_flusher(monkeypatch):
+    db = make_db(monkeypatch, commit_delay=10, shutdown_timeout=0.05)
+
+    async def run():
+        await db.start()
+        await db.save_kyc_record(record("wb-c", 1))
+        flusher = db._flusher
+        await db.stop()
+        assert flusher.cancelled()
+        assert "wb-c" in db.pending
+        db._commit_batch = DatabaseService._commit_batch.__get__(db)
+        await db.save_kyc_record(record("wb-c", 2))
+        return await db.get_kyc_record("wb-c")
+
+    latest = asyncio.run(run())
+
+    assert latest["version"] == 2
+    assert db.pending == {}
+    assert db.get_storage_metrics()["write_behind"]["running"] is False